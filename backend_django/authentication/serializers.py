@@ -4,9 +4,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from attendance.models import Ficha
-from face_recognition_app.models import FaceEncoding
-from face_recognition_app.services import get_face_encoding_from_image
-import face_recognition
+from face_recognition_app.face_index import find_duplicate_face
+from face_recognition_app.services import get_face_encoding_from_image, save_face_encoding
 
 User = get_user_model()
 
@@ -51,15 +50,10 @@ class RegisterStudentSerializer(serializers.ModelSerializer):
                 })
             
             # Verificar que el rostro no exista ya en la base de datos
-            existing_encodings = FaceEncoding.objects.all()
-            if existing_encodings.exists():
-                known_encodings = [enc.get_encoding_array() for enc in existing_encodings if enc.get_encoding_array() is not None]
-                if known_encodings: # Ensure list is not empty
-                    matches = face_recognition.compare_faces(known_encodings, new_encoding)
-                    if True in matches:
-                        raise serializers.ValidationError({
-                            "face_image": "Este rostro ya ha sido registrado por otro aprendiz."
-                        })
+            if find_duplicate_face(new_encoding) is not None:
+                raise serializers.ValidationError({
+                    "face_image": "Este rostro ya ha sido registrado por otro aprendiz."
+                })
 
             attrs['face_encoding'] = new_encoding
         
@@ -86,9 +80,7 @@ class RegisterStudentSerializer(serializers.ModelSerializer):
         ficha.students.add(user)
 
         # Guardar la codificación facial que ya fue procesada en la validación
-        face_encoding_obj = FaceEncoding(user=user, profile_image=face_image)
-        face_encoding_obj.set_encoding_array(face_encoding)
-        face_encoding_obj.save()
+        save_face_encoding(user, face_image, face_encoding)
 
         return user
 
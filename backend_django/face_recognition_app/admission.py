@@ -0,0 +1,178 @@
+# face_recognition_app/admission.py
+"""
+Control de admisión del reconocimiento en tiempo real.
+
+Cuando todos llegan a la misma hora, aceptar cada frame hace que la
+latencia crezca sin límite. Se aplican, en este orden:
+
+  1. Límite de frames por segundo de cada sesión (SessionFrameRateThrottle,
+     con la caché de Django, así vale entre workers): 429 con Retry-After.
+     Los lotes tienen su propio límite y pagan un turno por frame.
+  2. Los frames duplicados se responden desde frame_cache sin pasar por la
+     admisión (ver services._recognize_unique_frame).
+  3. A lo sumo FACE_ADMISSION_MAX_CONCURRENT reconocimientos a la vez por
+     proceso y FACE_ADMISSION_MAX_QUEUE esperando turno, cada uno como
+     máximo FACE_ADMISSION_QUEUE_TIMEOUT segundos; el resto recibe 503 con
+     Retry-After (estimado con la duración reciente de cada frame).
+
+Además, el pool de inferencia acota su propia cola (ver inference.py) y
+las caras que no coinciden tras max_verification_attempts intentos solo
+se reintentan cada FACE_TRACK_RETRY_COOLDOWN segundos (ver tracking.py).
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import SimpleRateThrottle
+
+from .inference import InferenceBusy
+
+# Peso de cada frame nuevo en la media móvil de la duración
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class RecognitionOverloaded(InferenceBusy):
+    default_detail = 'Hay demasiados reconocimientos en curso. Intente de nuevo en unos segundos.'
+    default_code = 'recognition_overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class AdmissionController:
+    """Semáforo con cola acotada y espera máxima para el reconocimiento"""
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.service_time = 0.5  # segundos, media móvil
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self):
+        return self.max_concurrent > 0
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere un turno (al menos 1)"""
+        return max(1, math.ceil(self.service_time * (self.waiting + 1) / self.max_concurrent))
+
+    def _reject(self):
+        self.rejected += 1
+        raise RecognitionOverloaded(self.retry_after())
+
+    @contextmanager
+    def admit(self, timer=None):
+        """Espera un turno o lanza RecognitionOverloaded; con timer, mide la espera como 'admission'"""
+        if not self.enabled:
+            yield
+            return
+        requested = time.perf_counter()
+        with self._condition:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    self._reject()
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.active < self.max_concurrent, timeout=self.queue_timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self._reject()
+            self.active += 1
+        started = time.perf_counter()
+        if timer is not None:
+            timer.add('admission', (started - requested) * 1000)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._condition:
+                self.active -= 1
+                self.service_time += SERVICE_TIME_SMOOTHING * (elapsed - self.service_time)
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'rejected': self.rejected,
+                'service_time_ms': round(self.service_time * 1000, 1),
+            }
+
+
+recognition_admission = AdmissionController(
+    max_concurrent=settings.FACE_ADMISSION_MAX_CONCURRENT,
+    max_queue=settings.FACE_ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.FACE_ADMISSION_QUEUE_TIMEOUT,
+)
+
+
+class SessionThrottled(Throttled):
+    default_detail = 'Se están enviando demasiados frames para esta sesión.'
+    extra_detail_singular = 'Intente de nuevo en {wait} segundo.'
+    extra_detail_plural = 'Intente de nuevo en {wait} segundos.'
+
+
+class SessionFrameRateThrottle(SimpleRateThrottle):
+    """
+    Limita los frames por sesión de asistencia y usuario
+    (FACE_SESSION_FRAME_RATE, p. ej. '5/s'; vacío = sin límite). La clave
+    incluye al usuario porque el throttle corre antes de comprobar que la
+    sesión es suya: otro usuario solo gasta su propio cupo. Cada solicitud
+    cuesta tantos frames como indique view.frame_count(request) (1 si la
+    vista no lo define). El historial vive en la caché por defecto: sin
+    REDIS_URL es memoria local y el límite se aplica por worker.
+    """
+    scope = 'face_session'
+    rate_setting = 'FACE_SESSION_FRAME_RATE'
+
+    def get_rate(self):
+        return getattr(settings, self.rate_setting) or None
+
+    def get_cache_key(self, request, view):
+        session_id = request.data.get('session_id')
+        if not session_id:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': f'{request.user.pk}:{session_id}'}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        # Un lote mayor que el límite consume la ventana completa en lugar de no pasar nunca
+        frame_count = getattr(view, 'frame_count', None)
+        self.cost = min(max(1, frame_count(request) if frame_count else 1), self.num_requests)
+
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        if len(self.history) + self.cost > self.num_requests:
+            return self.throttle_failure()
+        self.history[:0] = [self.now] * self.cost
+        self.cache.set(self.key, self.history, self.duration)
+        return True
+
+    def wait(self):
+        """Segundos hasta que venzan suficientes frames para admitir la solicitud"""
+        oldest_needed = self.history[self.num_requests - self.cost]
+        return max(0, self.duration - (self.now - oldest_needed))
+
+
+class SessionBatchFrameRateThrottle(SessionFrameRateThrottle):
+    """Frames por sesión enviados en lote (FACE_SESSION_BATCH_FRAME_RATE), cobrados uno a uno"""
+    scope = 'face_session_batch'
+    rate_setting = 'FACE_SESSION_BATCH_FRAME_RATE'
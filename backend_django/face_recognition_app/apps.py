@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class FaceRecognitionAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'face_recognition_app'
+
+    def ready(self):
+        # Conecta los receptores que invalidan la caché de galerías
+        from . import signals
+
+        # Carga y calienta los modelos faciales antes de atender peticiones (opcional)
+        if settings.FACE_WARMUP:
+            from .warmup import warmup_on_startup
+            warmup_on_startup()
@@ -0,0 +1,75 @@
+# face_recognition_app/benchmarks.py
+"""
+Utilidades compartidas por los comandos de medición de rendimiento.
+"""
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from .profiles import RecognitionProfile
+
+
+def latency_summary(samples_ms):
+    """Resumen (p50, p95, media) de una lista de latencias en milisegundos"""
+    if not len(samples_ms):
+        return {'p50': None, 'p95': None, 'mean': None, 'count': 0}
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        'p50': round(float(np.percentile(samples, 50)), 2),
+        'p95': round(float(np.percentile(samples, 95)), 2),
+        'mean': round(float(samples.mean()), 2),
+        'count': int(samples.size),
+    }
+
+
+def timed(function, *args, **kwargs):
+    """Ejecuta la función y devuelve (resultado, milisegundos)"""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def synthetic_encodings(count, rng, dimensions=128):
+    """
+    Codificaciones con una distribución parecida a las de dlib: un componente
+    común y una variación por persona (distancia típica entre personas ~0.9).
+    """
+    mean = rng.normal(0.0, 0.08, dimensions)
+    return (mean + rng.normal(0.0, 0.056, (count, dimensions))).astype(np.float32)
+
+
+def composite_image(images, grid, tile_size=(320, 240)):
+    """
+    Mosaico grid x grid con las imágenes (PIL, se repiten en orden) reducidas
+    a tile_size, para simular un frame con varios rostros. Devuelve bytes JPEG.
+    """
+    width, height = tile_size
+    canvas = Image.new('RGB', (width * grid, height * grid))
+    for position in range(grid * grid):
+        tile = images[position % len(images)].convert('RGB').resize(tile_size)
+        canvas.paste(tile, ((position % grid) * width, (position // grid) * height))
+    buffer = BytesIO()
+    canvas.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def parse_profile(text):
+    """
+    Convierte 'modelo:upsample:jitters:landmarks[:max_dim]' en un
+    RecognitionProfile, por ejemplo 'hog:1:1:small' o 'cnn:0:10:large:960'.
+    """
+    parts = text.split(':')
+    if len(parts) not in (4, 5):
+        raise ValueError(f"Perfil inválido: {text}")
+    detection_model, upsample, jitters, landmark_model = parts[:4]
+    if detection_model not in ('hog', 'cnn') or landmark_model not in ('small', 'large'):
+        raise ValueError(f"Perfil inválido: {text}")
+    return RecognitionProfile(
+        detection_model=detection_model,
+        number_of_times_to_upsample=int(upsample),
+        num_jitters=int(jitters),
+        landmark_model=landmark_model,
+        max_image_dimension=int(parts[4]) if len(parts) == 5 else 0,
+    )
@@ -0,0 +1,63 @@
+# face_recognition_app/codec.py
+"""
+Formato binario para las codificaciones faciales.
+
+Cada codificación se guarda como una cabecera de 4 bytes seguida de los
+valores crudos en little-endian:
+
+    byte 0      versión del formato (FORMAT_VERSION)
+    byte 1      tamaño en bytes de cada valor (4 = float32, 8 = float64)
+    bytes 2-3   número de dimensiones (uint16)
+"""
+import struct
+
+import numpy as np
+
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<BBH')
+
+_DTYPES = {
+    4: np.dtype('<f4'),
+    8: np.dtype('<f8'),
+}
+
+
+class EncodingFormatError(ValueError):
+    """La codificación almacenada no tiene un formato reconocido."""
+
+
+def pack_encoding(encoding, dtype=np.float32):
+    """Convierte un vector (lista o ndarray) al formato binario versionado."""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype.itemsize not in _DTYPES or dtype.kind != 'f':
+        raise EncodingFormatError(f"Tipo de dato no soportado: {dtype}")
+    array = np.asarray(encoding, dtype=dtype).ravel()
+    return HEADER.pack(FORMAT_VERSION, dtype.itemsize, array.size) + array.tobytes()
+
+
+def unpack_encoding(data):
+    """
+    Devuelve el vector almacenado sin copiar los datos (np.frombuffer).
+    El arreglo resultante es de solo lectura.
+    """
+    if data is None:
+        raise EncodingFormatError("Codificación vacía.")
+    buffer = memoryview(data)
+    if buffer.nbytes < HEADER.size:
+        raise EncodingFormatError("Codificación truncada.")
+    version, itemsize, dimensions = HEADER.unpack_from(buffer)
+    if version != FORMAT_VERSION or itemsize not in _DTYPES:
+        raise EncodingFormatError(f"Versión de formato desconocida: {version}/{itemsize}")
+    if buffer.nbytes != HEADER.size + itemsize * dimensions:
+        raise EncodingFormatError("La longitud de la codificación no coincide con la cabecera.")
+    return np.frombuffer(buffer, dtype=_DTYPES[itemsize], count=dimensions, offset=HEADER.size)
+
+
+def stack_encodings(vectors, dtype=np.float32):
+    """
+    Construye una matriz contigua (N, D) a partir de vectores ya decodificados.
+    Devuelve una matriz vacía (0, 0) si no hay vectores.
+    """
+    if not vectors:
+        return np.empty((0, 0), dtype=dtype)
+    return np.ascontiguousarray(np.vstack(vectors), dtype=dtype)
@@ -0,0 +1,300 @@
+# face_recognition_app/enrollment.py
+"""
+Registro masivo de rostros desde un ZIP o un directorio de fotos nombradas
+con el student_id del aprendiz (p. ej. 1023456789.jpg).
+
+Las fotos se codifican por tandas en el pool de inferencia (así el archivo
+nunca está completo en memoria), se buscan rostros repetidos dentro del
+lote y contra los ya registrados (ver face_index.py), y las filas
+FaceEncoding y FaceTemplate se escriben con bulk_create/bulk_update en una
+sola transacción. Las operaciones en bloque no emiten señales, por eso al
+confirmar se invalidan las galerías y se actualiza el índice de duplicados
+(`manage.py enroll_faces` lo reconstruye una sola vez al terminar).
+"""
+import os
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from attendance.models import Ficha
+from .codec import pack_encoding
+from .face_index import face_index, find_duplicate_faces
+from .gallery import gallery_cache
+from .inference import encode_enrollment_images
+from .matching import face_distance_matrix
+from .models import FaceEncoding, FaceRecognitionSettings, FaceTemplate
+from .services import delete_images_on_commit
+
+User = get_user_model()
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Fotos leídas y codificadas a la vez; acota la memoria con archivos grandes
+ENCODE_CHUNK = 64
+# Codificaciones comparadas contra el índice por consulta
+DUPLICATE_CHUNK = 500
+
+STATUS_DETAILS = {
+    'enrolled': "Rostro registrado.",
+    'replaced': "Rostro registrado; reemplaza las plantillas anteriores.",
+    'unknown_student': "No existe un aprendiz con este student_id.",
+    'already_enrolled': "El aprendiz ya tiene un rostro registrado.",
+    'repeated_student': "Hay otra foto del mismo aprendiz en el lote; se usó la primera.",
+    'too_large': "La imagen supera el tamaño máximo permitido.",
+    'invalid_image': "No se pudo leer la imagen.",
+    'no_face': "No se detectó ningún rostro.",
+    'multiple_faces': "Se detectó más de un rostro.",
+    'duplicate_in_batch': "El rostro coincide con el de otro aprendiz del lote.",
+    'duplicate_face': "El rostro ya está registrado por otro aprendiz.",
+}
+
+
+class ZipImageSource:
+    """Fotos dentro de un archivo ZIP (ruta o archivo subido)"""
+
+    def __init__(self, archive_file):
+        try:
+            self._archive = zipfile.ZipFile(archive_file)
+        except zipfile.BadZipFile:
+            raise ValueError("El archivo no es un ZIP válido.")
+        self.names = sorted(
+            info.filename for info in self._archive.infolist()
+            if not info.is_dir() and _is_image_name(info.filename)
+        )
+
+    def size(self, name):
+        return self._archive.getinfo(name).file_size
+
+    def read(self, name):
+        return self._archive.read(name)
+
+    def close(self):
+        self._archive.close()
+
+
+class DirectoryImageSource:
+    """Fotos dentro de un directorio (incluye subdirectorios)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.names = sorted(
+            os.path.relpath(os.path.join(root, filename), path)
+            for root, _, filenames in os.walk(path)
+            for filename in filenames
+            if _is_image_name(filename)
+        )
+
+    def size(self, name):
+        return os.path.getsize(os.path.join(self.path, name))
+
+    def read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as image_file:
+            return image_file.read()
+
+    def close(self):
+        pass
+
+
+def _is_image_name(name):
+    # Se ignoran los archivos ocultos, p. ej. los ._foto.jpg que agrega macOS
+    filename = os.path.basename(name)
+    return not filename.startswith('.') and filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+@contextmanager
+def open_image_source(source):
+    """Abre un directorio o un ZIP (ruta o archivo) como fuente de fotos"""
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        image_source = DirectoryImageSource(source)
+    else:
+        image_source = ZipImageSource(source)
+    try:
+        yield image_source
+    finally:
+        image_source.close()
+
+
+def student_id_from_name(name):
+    """'fotos/1023456789.JPG' -> '1023456789'"""
+    return os.path.splitext(os.path.basename(name))[0].strip()
+
+
+def batch_duplicates(encodings, tolerance):
+    """
+    Pares (i, j), con i < j, de codificaciones del lote a distancia menor o
+    igual que la tolerancia.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if len(encodings) < 2:
+        return []
+    distances = face_distance_matrix(encodings, encodings)
+    rows, columns = np.nonzero(np.triu(distances <= tolerance, k=1))
+    return list(zip(rows.tolist(), columns.tolist()))
+
+
+def _set_status(entry, status):
+    entry['status'] = status
+    entry['detail'] = STATUS_DETAILS[status]
+
+
+def bulk_enroll(image_source, replace=False, dry_run=False, pool=None, tolerance=0.6, progress=None, update_index=True):
+    """
+    Registra los rostros de `image_source` (ver open_image_source).
+    Con replace=True los aprendices que ya tenían rostro pasan a tener solo
+    la foto nueva; si no, se omiten. Con dry_run=True no se escribe nada.
+    `pool` es un InferencePool para codificar (por defecto el compartido) y
+    `progress(procesadas, total)` se llama tras cada tanda. Con
+    update_index=False el índice de duplicados no se toca (quien llama lo
+    reconstruye).
+    Devuelve {'files', 'summary', 'results', 'dry_run'}, con un resultado
+    (file, student_id, status, detail, ...) por archivo.
+    """
+    if len(image_source.names) > settings.FACE_ENROLLMENT_MAX_FILES:
+        raise ValueError(f"El archivo contiene más de {settings.FACE_ENROLLMENT_MAX_FILES} imágenes.")
+    results = [{'file': name, 'student_id': student_id_from_name(name)} for name in image_source.names]
+
+    # 1. Aprendices: se descartan antes de codificar las fotos que no se van a usar
+    student_ids = {entry['student_id'] for entry in results}
+    users = dict(User.objects.filter(role='student', student_id__in=student_ids).values_list('student_id', 'id'))
+    enrolled = set(FaceEncoding.objects.filter(user_id__in=users.values()).values_list('user_id', flat=True))
+    seen, pending = set(), []
+    for entry in results:
+        user_id = users.get(entry['student_id'])
+        if user_id is None:
+            _set_status(entry, 'unknown_student')
+            continue
+        if user_id in seen:
+            _set_status(entry, 'repeated_student')
+            continue
+        seen.add(user_id)
+        if user_id in enrolled and not replace:
+            _set_status(entry, 'already_enrolled')
+        elif image_source.size(entry['file']) > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            _set_status(entry, 'too_large')
+        else:
+            entry['user_id'] = user_id
+            pending.append(entry)
+
+    # 2. Codificación en paralelo, por tandas
+    profile = FaceRecognitionSettings.current().get_profile()
+    encoded = []
+    for start in range(0, len(pending), ENCODE_CHUNK):
+        chunk = pending[start:start + ENCODE_CHUNK]
+        images = [image_source.read(entry['file']) for entry in chunk]
+        for entry, (faces, encoding, error) in zip(chunk, encode_enrollment_images(images, profile, pool)):
+            if error:
+                _set_status(entry, 'invalid_image')
+                print(f"Error encoding {entry['file']} for bulk enrollment: {error}")
+            elif faces == 0:
+                _set_status(entry, 'no_face')
+            elif faces > 1:
+                _set_status(entry, 'multiple_faces')
+            else:
+                entry['encoding'] = encoding
+                encoded.append(entry)
+        if progress:
+            progress(min(start + ENCODE_CHUNK, len(pending)), len(pending))
+
+    # 3. Duplicados dentro del lote: no se sabe cuál es el correcto, se omiten ambos
+    for first, second in batch_duplicates([entry['encoding'] for entry in encoded], tolerance):
+        for entry, other in ((encoded[first], encoded[second]), (encoded[second], encoded[first])):
+            _set_status(entry, 'duplicate_in_batch')
+            entry['duplicate_of'] = other['student_id']
+    encoded = [entry for entry in encoded if 'status' not in entry]
+
+    # 4. Duplicados contra los rostros registrados (sin contar el propio, si se reemplaza)
+    for start in range(0, len(encoded), DUPLICATE_CHUNK):
+        chunk = encoded[start:start + DUPLICATE_CHUNK]
+        duplicates = find_duplicate_faces(
+            [entry['encoding'] for entry in chunk], tolerance, [entry['user_id'] for entry in chunk]
+        )
+        for entry, duplicate_user_id in zip(chunk, duplicates):
+            if duplicate_user_id is not None:
+                _set_status(entry, 'duplicate_face')
+                entry['duplicate_of'] = duplicate_user_id
+    owners = dict(User.objects.filter(
+        id__in=[entry['duplicate_of'] for entry in encoded if 'status' in entry]
+    ).values_list('id', 'student_id'))
+    for entry in encoded:
+        if 'status' in entry:
+            entry['duplicate_of'] = owners.get(entry['duplicate_of']) or str(entry['duplicate_of'])
+    encoded = [entry for entry in encoded if 'status' not in entry]
+
+    for entry in encoded:
+        _set_status(entry, 'replaced' if entry['user_id'] in enrolled else 'enrolled')
+    if encoded and not dry_run:
+        _write_encodings(image_source, encoded, profile.model_version, update_index)
+
+    for entry in results:
+        entry.pop('encoding', None)
+    return {
+        'files': len(results),
+        'summary': dict(Counter(entry['status'] for entry in results)),
+        'results': results,
+        'dry_run': dry_run,
+    }
+
+
+def _write_encodings(image_source, entries, model_version, update_index=True):
+    """
+    Crea o reemplaza el FaceEncoding de cada aprendiz con una única
+    plantilla (la foto del lote). Las fotos se vuelven a leer de la fuente
+    por tandas para no tenerlas todas en memoria.
+    """
+    now = timezone.now()
+    user_ids = [entry['user_id'] for entry in entries]
+    with transaction.atomic():
+        face_encodings = {
+            face_encoding.user_id: face_encoding
+            for face_encoding in FaceEncoding.objects.select_for_update().filter(user_id__in=user_ids)
+        }
+        replaced = FaceTemplate.objects.filter(face_encoding__in=face_encodings.values())
+        delete_images_on_commit(list(replaced.values_list('image', flat=True)))
+        replaced.delete()
+        face_encodings.update({
+            face_encoding.user_id: face_encoding
+            for face_encoding in FaceEncoding.objects.bulk_create([
+                FaceEncoding(user_id=user_id, encoding_data=b'')
+                for user_id in user_ids if user_id not in face_encodings
+            ])
+        })
+
+        for start in range(0, len(entries), ENCODE_CHUNK):
+            chunk = entries[start:start + ENCODE_CHUNK]
+            # bulk_create guarda las imágenes en el almacenamiento como save()
+            templates = FaceTemplate.objects.bulk_create([
+                FaceTemplate(
+                    face_encoding=face_encodings[entry['user_id']],
+                    encoding_data=pack_encoding(entry['encoding']),
+                    image=ContentFile(image_source.read(entry['file']), name=os.path.basename(entry['file'])),
+                )
+                for entry in chunk
+            ])
+            for entry, template in zip(chunk, templates):
+                face_encoding = face_encodings[entry['user_id']]
+                face_encoding.encoding_data = pack_encoding(entry['encoding'])
+                face_encoding.profile_image = template.image.name
+                face_encoding.template_count = 1
+                face_encoding.spread = 0.0
+                face_encoding.is_active = True
+                face_encoding.model_version = model_version
+                face_encoding.updated_at = now
+
+        FaceEncoding.objects.bulk_update(
+            list(face_encodings.values()),
+            ['encoding_data', 'profile_image', 'template_count', 'spread', 'is_active', 'model_version', 'updated_at'],
+            batch_size=500,
+        )
+
+        ficha_ids = list(Ficha.objects.filter(students__in=user_ids).values_list('id', flat=True).distinct())
+        encodings = np.vstack([entry['encoding'] for entry in entries])
+        transaction.on_commit(lambda: gallery_cache.invalidate(*ficha_ids))
+        if update_index:
+            transaction.on_commit(lambda: face_index.upsert_many(user_ids, encodings))
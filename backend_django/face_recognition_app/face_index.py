@@ -0,0 +1,330 @@
+# face_recognition_app/face_index.py
+"""
+Índice aproximado (IVF) sobre todas las codificaciones activas del sistema,
+usado para detectar rostros duplicados al registrar aprendices sin recorrer
+toda la tabla FaceEncoding.
+
+Las codificaciones se agrupan con k-means en listas invertidas; una búsqueda
+solo revisa las `n_probe` listas con centroide más cercano. El índice se
+guarda en disco (FACE_INDEX_PATH) y se mantiene al día con las señales de
+FaceEncoding: los usuarios cambiados en una transacción se aplican juntos
+al confirmarla, con una sola escritura del archivo. QuerySet.update() y
+las operaciones en bloque no emiten señales; quien las use debe llamar a
+mark_changed() o reconstruir el índice (`manage.py rebuild_face_index`,
+como hacen enroll_faces y reencode_faces al terminar).
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se sincronizan los hilos del proceso
+    fcntl = None
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .matching import face_distance_matrix
+from .models import FaceEncoding
+
+# Por debajo de este tamaño basta con una sola lista (búsqueda exhaustiva)
+MIN_SIZE_FOR_CLUSTERING = 256
+KMEANS_ITERATIONS = 10
+
+
+def kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """k-means de Lloyd sobre vectores float32; devuelve los centroides"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = face_distance_matrix(vectors, centroids).argmin(axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+    return centroids
+
+
+class IVFIndex:
+    """Índice de listas invertidas con IDs de usuario y vectores float32"""
+
+    def __init__(self, dimensions=128):
+        self.dimensions = dimensions
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.centroids = np.zeros((1, dimensions), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, ids, vectors):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        self.train()
+
+    def train(self):
+        size = len(self.ids)
+        if size >= MIN_SIZE_FOR_CLUSTERING:
+            self.centroids = kmeans(self.vectors, int(np.sqrt(size)))
+        else:
+            self.centroids = np.zeros((1, self.dimensions), dtype=np.float32)
+        self.assignments = self._assign(self.vectors)
+        self.trained_size = size
+
+    def _assign(self, vectors):
+        if len(self.centroids) == 1:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return face_distance_matrix(vectors, self.centroids).argmin(axis=1).astype(np.int32)
+
+    def upsert(self, user_id, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, self.dimensions)
+        rows = np.flatnonzero(self.ids == user_id)
+        if len(rows):
+            self.vectors[rows[0]] = vector[0]
+            self.assignments[rows[0]] = self._assign(vector)[0]
+        else:
+            self.ids = np.append(self.ids, np.int64(user_id))
+            self.vectors = np.vstack([self.vectors, vector])
+            self.assignments = np.append(self.assignments, self._assign(vector))
+        # Los centroides dejan de representar bien los datos si el índice crece mucho
+        if len(self.ids) >= max(MIN_SIZE_FOR_CLUSTERING, 2 * self.trained_size):
+            self.train()
+
+    def upsert_many(self, user_ids, vectors):
+        """Como upsert para varios usuarios, con una sola copia de los arreglos"""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        if not len(user_ids):
+            return
+        # Si un usuario aparece varias veces gana su última codificación
+        _, last = np.unique(user_ids[::-1], return_index=True)
+        keep = np.sort(len(user_ids) - 1 - last)
+        user_ids, vectors = user_ids[keep], vectors[keep]
+        assignments = self._assign(vectors)
+        positions = {user_id: row for row, user_id in enumerate(self.ids.tolist())}
+        rows = np.array([positions.get(user_id, -1) for user_id in user_ids.tolist()], dtype=np.int64)
+        existing = rows >= 0
+        self.vectors[rows[existing]] = vectors[existing]
+        self.assignments[rows[existing]] = assignments[existing]
+        self.ids = np.concatenate([self.ids, user_ids[~existing]])
+        self.vectors = np.vstack([self.vectors, vectors[~existing]])
+        self.assignments = np.concatenate([self.assignments, assignments[~existing]])
+        if len(self.ids) >= max(MIN_SIZE_FOR_CLUSTERING, 2 * self.trained_size):
+            self.train()
+
+    def remove(self, user_id):
+        self.remove_many([user_id])
+
+    def remove_many(self, user_ids):
+        keep = ~np.isin(self.ids, np.asarray(list(user_ids), dtype=np.int64))
+        self.ids = self.ids[keep]
+        self.vectors = self.vectors[keep]
+        self.assignments = self.assignments[keep]
+
+    def search(self, vector, k=10, n_probe=8):
+        """Devuelve (ids, distancias) de los k vecinos aproximados más cercanos"""
+        if not len(self.ids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, self.dimensions)
+        centroid_distances = face_distance_matrix(vector, self.centroids)[0]
+        probed = np.argsort(centroid_distances)[:n_probe]
+        rows = np.flatnonzero(np.isin(self.assignments, probed))
+        distances = face_distance_matrix(vector, self.vectors[rows])[0]
+        nearest = np.argsort(distances)[:k]
+        return self.ids[rows[nearest]], distances[nearest]
+
+    def save(self, path):
+        # Escritura atómica: otros procesos nunca leen un archivo a medias
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.npz', delete=False) as tmp:
+            np.savez(
+                tmp,
+                ids=self.ids,
+                vectors=self.vectors,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_size=np.int64(self.trained_size),
+            )
+        os.replace(tmp.name, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(dimensions=data['vectors'].shape[1])
+            index.ids = data['ids']
+            index.vectors = data['vectors']
+            index.centroids = data['centroids']
+            index.assignments = data['assignments']
+            index.trained_size = int(data['trained_size'])
+        return index
+
+
+class PersistentFaceIndex:
+    """
+    Índice compartido por los procesos a través de un archivo. Antes de cada
+    lectura o actualización se recarga si otro proceso modificó el archivo.
+    Las actualizaciones (leer, modificar y guardar) se hacen con un flock
+    exclusivo sobre <path>.lock, para que dos procesos no pisen sus cambios;
+    las lecturas no lo necesitan porque el archivo se reemplaza atómicamente.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+        # Usuarios cambiados en la transacción de cada hilo (ver mark_changed)
+        self._pending = threading.local()
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_version(self):
+        # Cada guardado reemplaza el archivo (inodo nuevo): el mtime solo no basta si
+        # dos procesos escriben dentro de la misma resolución del reloj del sistema
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _ensure_current(self):
+        version = self._file_version()
+        if self._index is not None and version == self._version:
+            return
+        if version is None:
+            self._rebuild()
+        else:
+            self._index = IVFIndex.load(self.path)
+            self._version = version
+
+    def _rebuild(self):
+        ids, vectors = FaceEncoding.objects.filter(is_active=True).encoding_matrix()
+        index = IVFIndex()
+        if len(ids):
+            index.build(ids, vectors)
+        self._index = index
+        self._save()
+
+    def _save(self):
+        self._index.save(self.path)
+        self._version = self._file_version()
+
+    def rebuild(self):
+        with self._exclusive():
+            self._rebuild()
+            return len(self._index)
+
+    def update(self, user_ids=(), vectors=None, removed_ids=()):
+        """Agrega o reemplaza `user_ids` y quita `removed_ids` con un solo guardado"""
+        with self._exclusive():
+            self._ensure_current()
+            if len(removed_ids):
+                self._index.remove_many(removed_ids)
+            if len(user_ids):
+                self._index.upsert_many(user_ids, vectors)
+            self._save()
+
+    def upsert(self, user_id, vector):
+        self.update([user_id], vector)
+
+    def upsert_many(self, user_ids, vectors):
+        self.update(user_ids, vectors)
+
+    def remove(self, user_id):
+        self.update(removed_ids=[user_id])
+
+    def mark_changed(self, user_id):
+        """
+        Anota al usuario para actualizarlo al confirmar la transacción en
+        curso (de inmediato fuera de una transacción). Al confirmar se leen
+        sus codificaciones actuales, así un savepoint revertido no deja
+        valores que no llegaron a guardarse.
+        """
+        pending = getattr(self._pending, 'user_ids', None)
+        if pending is None:
+            pending = self._pending.user_ids = set()
+        pending.add(user_id)
+        # Se agenda en cada llamada porque revertir un savepoint descarta sus callbacks;
+        # el primero que se ejecuta aplica todo y los demás no encuentran nada pendiente
+        transaction.on_commit(self.apply_pending)
+
+    def apply_pending(self):
+        user_ids = getattr(self._pending, 'user_ids', None)
+        if not user_ids:
+            return
+        self._pending.user_ids = set()
+        ids, vectors = FaceEncoding.objects.filter(user_id__in=user_ids, is_active=True).encoding_matrix()
+        self.update(ids, vectors, list(user_ids - set(ids.tolist())))
+
+    def search(self, vector, k, n_probe):
+        if self._file_version() is None:
+            # Si falta el archivo se reconstruye con el mismo lock que las actualizaciones
+            with self._exclusive():
+                self._ensure_current()
+        with self._lock:
+            self._ensure_current()
+            return self._index.search(vector, k=k, n_probe=n_probe)
+
+
+face_index = PersistentFaceIndex(settings.FACE_INDEX_PATH)
+
+
+def find_duplicate_face(encoding, tolerance=0.6, exclude_user_id=None):
+    """
+    Busca un usuario cuyo rostro coincida con `encoding`. Los candidatos del
+    índice se reordenan con las codificaciones actuales de la base de datos,
+    que es la fuente de verdad si el índice estuviera desactualizado.
+    Devuelve el ID del usuario más cercano dentro de la tolerancia, o None.
+    """
+    return find_duplicate_faces([encoding], tolerance, [exclude_user_id])[0]
+
+
+def find_duplicate_faces(encodings, tolerance=0.6, exclude_user_ids=None):
+    """
+    find_duplicate_face para varias codificaciones con una sola consulta:
+    cada una se compara solo con sus propios candidatos del índice.
+    Devuelve una lista alineada con el ID del usuario duplicado o None.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(len(encodings), -1)
+    exclude_user_ids = exclude_user_ids or [None] * len(encodings)
+    candidate_ids = [
+        face_index.search(
+            encoding,
+            k=settings.FACE_INDEX_CANDIDATES,
+            n_probe=settings.FACE_INDEX_N_PROBE,
+        )[0]
+        for encoding in encodings
+    ]
+    all_candidates = set().union(*(ids.tolist() for ids in candidate_ids))
+    user_ids, known = FaceEncoding.objects.filter(user_id__in=all_candidates, is_active=True).encoding_matrix()
+    if not len(user_ids):
+        return [None] * len(encodings)
+
+    distances = face_distance_matrix(encodings, known)
+    duplicates = []
+    for row, candidates, exclude_user_id in zip(distances, candidate_ids, exclude_user_ids):
+        allowed = np.isin(user_ids, candidates)
+        if exclude_user_id is not None:
+            allowed &= user_ids != exclude_user_id
+        row = np.where(allowed, row, np.inf)
+        nearest = int(row.argmin())
+        duplicates.append(int(user_ids[nearest]) if row[nearest] <= tolerance else None)
+    return duplicates
@@ -0,0 +1,122 @@
+# face_recognition_app/frame_cache.py
+"""
+Supresión de frames casi idénticos en el stream de reconocimiento.
+
+La cámara del aula envía frames continuamente y la mayoría son casi iguales
+al anterior. Cada frame se resume con un hash de diferencias (dHash) de 64
+bits calculado sobre una miniatura en escala de grises; si está a menos de
+FACE_FRAME_DEDUP_MAX_DISTANCE bits de un frame procesado recientemente en la
+misma sesión, se reutiliza el resultado de ese frame. Los frames vencen a
+los FACE_FRAME_DEDUP_MAX_AGE segundos y los contadores de una sesión que
+deja de enviar imágenes, a los SESSION_IDLE_TIMEOUT segundos.
+"""
+import threading
+import time
+from collections import deque
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+
+HASH_SIZE = 8
+# Segundos sin frames tras los cuales se olvidan los contadores de una sesión
+SESSION_IDLE_TIMEOUT = 600
+
+
+def difference_hash(image_bytes, hash_size=HASH_SIZE):
+    """dHash de (hash_size x hash_size) bits de una imagen codificada"""
+    image = Image.open(BytesIO(image_bytes))
+    # En JPEG, draft() decodifica directamente a baja resolución (mucho más rápido)
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class FrameCache:
+    """
+    Resultados recientes por sesión, indexados por el hash del frame, con
+    contadores de frames procesados y omitidos.
+    """
+
+    def __init__(self, max_distance, max_age, history, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.history = history
+        self.idle_timeout = idle_timeout
+        self._frames = {}
+        self._stats = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_age > 0 and self.history > 0
+
+    def _expire(self, now):
+        """Descarta los frames vencidos y las sesiones que ya no envían imágenes"""
+        expired = [key for key, frames in self._frames.items() if now - frames[-1][2] > self.max_age]
+        for key in expired:
+            del self._frames[key]
+        idle = [key for key, last_seen in self._last_seen.items() if now - last_seen > self.idle_timeout]
+        for key in idle:
+            del self._last_seen[key]
+            self._stats.pop(key, None)
+
+    def lookup(self, session_id, frame_hash):
+        """Devuelve el resultado de un frame reciente casi idéntico, o None"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._last_seen[session_id] = now
+            stats = self._stats.setdefault(session_id, {'processed': 0, 'skipped': 0})
+            frames = self._frames.get(session_id, ())
+            for cached_hash, result, stored_at in reversed(frames):
+                if now - stored_at > self.max_age:
+                    break
+                if hamming_distance(cached_hash, frame_hash) <= self.max_distance:
+                    stats['skipped'] += 1
+                    return result
+            stats['processed'] += 1
+            return None
+
+    def store(self, session_id, frame_hash, result):
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[session_id] = now
+            frames = self._frames.setdefault(session_id, deque(maxlen=self.history))
+            frames.append((frame_hash, result, now))
+
+    def stats(self, session_id):
+        with self._lock:
+            stats = dict(self._stats.get(session_id, {'processed': 0, 'skipped': 0}))
+        total = stats['processed'] + stats['skipped']
+        stats['skip_rate'] = round(stats['skipped'] / total, 3) if total else 0.0
+        return stats
+
+    def forget(self, session_id):
+        with self._lock:
+            self._frames.pop(session_id, None)
+            self._stats.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+
+    def __len__(self):
+        """Sesiones con frames o contadores en memoria"""
+        with self._lock:
+            return len(self._frames.keys() | self._stats.keys())
+
+
+frame_cache = FrameCache(
+    max_distance=settings.FACE_FRAME_DEDUP_MAX_DISTANCE,
+    max_age=settings.FACE_FRAME_DEDUP_MAX_AGE,
+    history=settings.FACE_FRAME_DEDUP_HISTORY,
+)
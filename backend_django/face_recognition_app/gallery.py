@@ -0,0 +1,314 @@
+# face_recognition_app/gallery.py
+"""
+Caché en proceso de las galerías de rostros por ficha.
+
+Cada galería es una matriz contigua (N, D) con las codificaciones de los
+estudiantes de la ficha y el arreglo de IDs alineado con sus filas. Las
+entradas se desalojan por LRU cuando se supera el límite de memoria y se
+invalidan mediante señales (ver signals.py). La invalidación llega a los
+demás procesos con un contador de versión por ficha en la caché compartida
+(ver settings_cache.py).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from attendance.models import Ficha
+from .models import FaceEncoding, FaceTemplate
+from .quantization import QuantizedMatrix
+from .settings_cache import bump_version, read_version
+
+
+class FaceGallery:
+    """
+    Codificaciones conocidas de una ficha, listas para comparar: el centroide
+    de cada estudiante y, para quienes tienen varias plantillas, las
+    plantillas ordenadas por fila del estudiante (ver matching.py).
+    Los centroides pueden guardarse en float16 o int8 (ver quantization.py);
+    `exact_loader` devuelve sus valores float32 para recalcular los pares
+    cercanos a la tolerancia. Cada centroide exacto se consulta una sola vez
+    y queda en `exact_cache` mientras la galería siga en caché.
+    """
+
+    __slots__ = (
+        'ficha_id', 'student_ids', 'encodings', 'spreads',
+        'template_owners', 'template_encodings', 'exact_loader', 'exact_cache', 'loaded_at',
+    )
+
+    def __init__(
+        self, ficha_id, student_ids, encodings, spreads=None, template_owners=None, template_encodings=None,
+        precision='float32', exact_loader=None,
+    ):
+        self.ficha_id = ficha_id
+        self.student_ids = student_ids
+        # Normas al cuadrado precalculadas en float32 (ver quantization.py)
+        self.encodings = encodings if isinstance(encodings, QuantizedMatrix) else QuantizedMatrix(encodings, precision)
+        self.spreads = spreads if spreads is not None else np.zeros(len(student_ids), dtype=np.float32)
+        # Fila de student_ids a la que pertenece cada plantilla (orden ascendente)
+        self.template_owners = template_owners if template_owners is not None else np.empty(0, dtype=np.int64)
+        self.template_encodings = (
+            template_encodings if template_encodings is not None
+            else np.empty((0, self.encodings.shape[1]), dtype=np.float32)
+        )
+        self.exact_loader = exact_loader
+        # Fila -> centroide float32, o None si ya no está en la base de datos
+        self.exact_cache = {}
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @property
+    def sq_norms(self):
+        return self.encodings.sq_norms
+
+    @property
+    def nbytes(self):
+        return sum(self.memory_usage().values())
+
+    def memory_usage(self):
+        """Bytes ocupados por cada parte de la galería"""
+        return {
+            'student_ids': self.student_ids.nbytes,
+            'encodings': self.encodings.nbytes,
+            'spreads': self.spreads.nbytes,
+            'templates': self.template_owners.nbytes + self.template_encodings.nbytes,
+            'exact_cache': sum(encoding.nbytes for encoding in list(self.exact_cache.values()) if encoding is not None),
+        }
+
+    def contains(self, student_id):
+        return bool(np.any(self.student_ids == student_id))
+
+    def exact_encodings(self, rows):
+        """
+        Centroides float32 de las filas indicadas, con una máscara de las que
+        se pudieron obtener. Sin exact_loader se usan los valores en memoria;
+        con él, solo se consultan las filas que no están en exact_cache.
+        """
+        if self.exact_loader is None:
+            return self.encodings.rows(rows), np.ones(len(rows), dtype=bool)
+        rows = [int(row) for row in rows]
+        missing = sorted({row for row in rows if row not in self.exact_cache})
+        if missing:
+            loaded_ids, matrix = self.exact_loader(self.student_ids[missing])
+            positions = {int(student_id): index for index, student_id in enumerate(loaded_ids)}
+            for row in missing:
+                position = positions.get(int(self.student_ids[row]))
+                self.exact_cache[row] = matrix[position].copy() if position is not None else None
+
+        exact = np.zeros((len(rows), self.encodings.shape[1]), dtype=np.float32)
+        found = np.zeros(len(rows), dtype=bool)
+        for index, row in enumerate(rows):
+            encoding = self.exact_cache[row]
+            if encoding is not None:
+                exact[index] = encoding
+                found[index] = True
+        return exact, found
+
+
+def load_exact_encodings(student_ids):
+    """Centroides float32 de los estudiantes indicados, leídos de la base de datos"""
+    return FaceEncoding.objects.filter(user_id__in=[int(i) for i in student_ids], is_active=True).encoding_matrix()
+
+
+def load_ficha_gallery(ficha_id, precision=None):
+    """
+    Carga desde la base de datos la galería de una ficha: los centroides en
+    una consulta y, solo para estudiantes con varias plantillas, sus
+    dispersiones y plantillas en otras dos.
+    """
+    precision = precision or settings.FACE_GALLERY_PRECISION
+    encodings = FaceEncoding.objects.filter(user__fichas_enrolled=ficha_id, is_active=True)
+    student_ids, centroids = encodings.encoding_matrix()
+    rows = {int(student_id): row for row, student_id in enumerate(student_ids)}
+
+    spreads = np.zeros(len(student_ids), dtype=np.float32)
+    multi_template = encodings.filter(template_count__gt=1)
+    for student_id, spread in multi_template.values_list('user_id', 'spread'):
+        if student_id in rows:
+            spreads[rows[student_id]] = spread
+
+    template_owners, template_encodings = None, None
+    if spreads.any():
+        owner_ids, templates = FaceTemplate.objects.filter(
+            face_encoding__in=multi_template
+        ).encoding_matrix()
+        keep = np.array([int(owner_id) in rows for owner_id in owner_ids], dtype=bool)
+        owners = np.array([rows.get(int(owner_id), -1) for owner_id in owner_ids], dtype=np.int64)[keep]
+        order = np.argsort(owners, kind='stable')
+        template_owners = owners[order]
+        template_encodings = np.ascontiguousarray(templates[keep][order])
+
+    return FaceGallery(
+        ficha_id, student_ids, centroids, spreads, template_owners, template_encodings,
+        precision=precision,
+        exact_loader=load_exact_encodings if precision != 'float32' else None,
+    )
+
+
+class GalleryCache:
+    """
+    Caché LRU de galerías con límite de memoria (en bytes) y edad máxima.
+    Con `version_key`, cada invalidación incrementa al confirmarse la
+    transacción la versión compartida de la ficha (o una global si no se
+    conocen las fichas) y get() descarta las galerías cargadas con una
+    versión anterior, así los demás procesos no comparan contra rostros
+    borrados o cambiados. Sin caché compartida solo la edad máxima acota
+    esa desactualización entre procesos.
+    Cada galería cuenta con el tamaño que tenía al guardarse (su exact_cache
+    crece después, como mucho hasta el tamaño de los centroides en float32).
+    """
+
+    def __init__(self, max_bytes, max_age, loader=load_ficha_gallery, version_key=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.loader = loader
+        self.version_key = version_key
+        self._entries = OrderedDict()
+        self._sizes = {}
+        # Versiones compartidas leídas antes de cargar cada galería
+        self._loaded_versions = {}
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _shared_versions(self, ficha_id):
+        if self.version_key is None:
+            return None
+        return read_version(f'{self.version_key}:all', f'{self.version_key}:{ficha_id}')
+
+    def _broadcast(self, *suffixes):
+        # Al confirmar: antes, otro proceso podría recargar los datos anteriores con la versión nueva
+        if self.version_key is not None:
+            keys = [f'{self.version_key}:{suffix}' for suffix in suffixes]
+            transaction.on_commit(lambda: [bump_version(key) for key in keys])
+
+    def get(self, ficha_id):
+        # Fuera del lock: con Redis es una consulta de red
+        versions = self._shared_versions(ficha_id)
+        with self._lock:
+            gallery = self._entries.get(ficha_id)
+            if (
+                gallery is not None and time.monotonic() - gallery.loaded_at <= self.max_age
+                and self._loaded_versions.get(ficha_id) == versions
+            ):
+                self._entries.move_to_end(ficha_id)
+                self.hits += 1
+                return gallery
+            self.misses += 1
+            generation = self._generations.get(ficha_id, 0)
+
+        # La carga se hace fuera del lock para no bloquear otras fichas
+        gallery = self.loader(ficha_id)
+
+        with self._lock:
+            # Si hubo una invalidación durante la carga, no se guarda el resultado
+            if self._generations.get(ficha_id, 0) == generation:
+                self._store(ficha_id, gallery, versions)
+        return gallery
+
+    def _store(self, ficha_id, gallery, versions=None):
+        self._discard(ficha_id)
+        size = gallery.nbytes
+        if size > self.max_bytes:
+            return
+        self._entries[ficha_id] = gallery
+        self._sizes[ficha_id] = size
+        self._loaded_versions[ficha_id] = versions
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            evicted_id, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted_id)
+            self._loaded_versions.pop(evicted_id, None)
+
+    def _discard(self, ficha_id):
+        if self._entries.pop(ficha_id, None) is not None:
+            self._bytes -= self._sizes.pop(ficha_id)
+            self._loaded_versions.pop(ficha_id, None)
+
+    def _invalidate_local(self, ficha_ids):
+        with self._lock:
+            for ficha_id in ficha_ids:
+                self._generations[ficha_id] = self._generations.get(ficha_id, 0) + 1
+                self._discard(ficha_id)
+
+    def invalidate(self, *ficha_ids):
+        self._invalidate_local(ficha_ids)
+        if ficha_ids:
+            self._broadcast(*ficha_ids)
+
+    def invalidate_student(self, student_id, broadcast=True):
+        """
+        Invalida todas las galerías en caché que contienen al estudiante. Los
+        demás procesos no saben en qué fichas está, así que se les invalidan
+        todas (broadcast=False cuando ya se invalidaron sus fichas).
+        """
+        with self._lock:
+            ficha_ids = [ficha_id for ficha_id, gallery in self._entries.items() if gallery.contains(student_id)]
+        self._invalidate_local(ficha_ids)
+        if broadcast:
+            self._broadcast('all')
+
+    def clear(self):
+        with self._lock:
+            for ficha_id in self._entries:
+                self._generations[ficha_id] = self._generations.get(ficha_id, 0) + 1
+            self._entries.clear()
+            self._sizes.clear()
+            self._loaded_versions.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def memory_usage(self):
+        """Detalle de memoria por galería en caché, de la más a la menos usada"""
+        with self._lock:
+            galleries = list(reversed(self._entries.values()))
+        return {
+            'bytes': sum(gallery.nbytes for gallery in galleries),
+            'max_bytes': self.max_bytes,
+            'galleries': [
+                {
+                    'ficha_id': gallery.ficha_id,
+                    'students': len(gallery),
+                    'templates': len(gallery.template_owners),
+                    'precision': gallery.encodings.precision,
+                    'bytes': gallery.nbytes,
+                    **{f'{part}_bytes': size for part, size in gallery.memory_usage().items()},
+                }
+                for gallery in galleries
+            ],
+        }
+
+
+gallery_cache = GalleryCache(
+    max_bytes=settings.FACE_GALLERY_CACHE_MAX_BYTES,
+    max_age=settings.FACE_GALLERY_CACHE_MAX_AGE,
+    version_key='face_recognition_app:gallery_version',
+)
+
+
+def get_ficha_gallery(ficha_id):
+    return gallery_cache.get(ficha_id)
+
+
+def invalidate_user_galleries(user_id):
+    """Invalida las galerías de todas las fichas en las que está inscrito el usuario"""
+    ficha_ids = list(Ficha.objects.filter(students=user_id).values_list('id', flat=True))
+    gallery_cache.invalidate(*ficha_ids)
+    # Fichas que aún lo tengan en caché en este proceso (las demás ya se avisaron)
+    gallery_cache.invalidate_student(user_id, broadcast=False)
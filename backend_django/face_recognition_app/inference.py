@@ -0,0 +1,236 @@
+# face_recognition_app/inference.py
+"""
+Pool de procesos para la inferencia facial (detección y codificación).
+
+dlib libera poco el GIL y una imagen grande puede tardar segundos, así que
+ejecutarlo en el hilo de la petición bloquea al worker web. Con
+FACE_INFERENCE_WORKERS > 0 el trabajo se envía a procesos de larga duración
+que cargan los modelos una sola vez. La cola de envío está acotada: si está
+llena se responde 503 de inmediato en lugar de acumular latencia.
+
+pipeline.py (y con él face_recognition y dlib) se importa solo al ejecutar
+una tarea, así el proceso web no carga los modelos si todo va al pool.
+"""
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class InferenceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'El servicio de reconocimiento facial no está disponible en este momento.'
+    default_code = 'inference_unavailable'
+    # DRF la envía como cabecera Retry-After
+    wait = settings.FACE_INFERENCE_RETRY_AFTER
+
+
+class InferenceBusy(InferenceUnavailable):
+    default_detail = 'El servicio de reconocimiento facial está saturado. Intente de nuevo en unos segundos.'
+    default_code = 'inference_busy'
+
+
+class InferenceTimeout(InferenceUnavailable):
+    default_detail = 'El reconocimiento facial tardó demasiado en responder.'
+    default_code = 'inference_timeout'
+
+
+def _init_worker():
+    # Importar face_recognition carga los modelos de dlib una sola vez por proceso
+    import face_recognition
+
+
+# Tareas de inferencia: se envían al pool por referencia y cargan pipeline al ejecutarse
+
+def _encode_image_bytes(*args):
+    from .pipeline import encode_image_bytes
+    return encode_image_bytes(*args)
+
+
+def _encode_image_bytes_timed(*args):
+    from .pipeline import encode_image_bytes_timed
+    return encode_image_bytes_timed(*args)
+
+
+def _encode_face_crops_timed(*args):
+    from .pipeline import encode_face_crops_timed
+    return encode_face_crops_timed(*args)
+
+
+def _encode_enrollment_bytes(*args):
+    from .pipeline import encode_enrollment_bytes
+    return encode_enrollment_bytes(*args)
+
+
+class InferencePool:
+    """
+    Envoltorio síncrono sobre un ProcessPoolExecutor con una cola acotada
+    (workers + max_pending tareas en vuelo) y tiempo máximo por tarea.
+    """
+
+    def __init__(self, workers, max_pending, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # 'spawn' evita heredar hilos y conexiones del proceso web
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _submit(self, function, *args, wait=False):
+        acquired = self._slots.acquire(timeout=self.timeout) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            raise InferenceBusy()
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset_executor()
+            raise InferenceUnavailable()
+        except BaseException:
+            self._slots.release()
+            raise
+        # El cupo se libera cuando la tarea termina, aunque el cliente ya no espere
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future, timeout=None):
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            raise InferenceTimeout()
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise InferenceUnavailable()
+
+    def run(self, function, *args, timeout=None):
+        return self._result(self._submit(function, *args), timeout)
+
+    def map(self, function, items, *args):
+        """
+        Ejecuta function(item, *args) para cada elemento y devuelve los
+        resultados en orden. Mantiene a lo sumo `workers` tareas en vuelo y
+        espera cupo en lugar de fallar con InferenceBusy, así las peticiones
+        interactivas conservan el resto de la cola.
+        """
+        results = []
+        in_flight = deque()
+        try:
+            for item in items:
+                if len(in_flight) >= self.workers:
+                    results.append(self._result(in_flight.popleft()))
+                in_flight.append(self._submit(function, item, *args, wait=True))
+            while in_flight:
+                results.append(self._result(in_flight.popleft()))
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return results
+
+    def run_on_workers(self, function, *args):
+        """
+        Envía una tarea por proceso del pool (arranca los que falten) y
+        devuelve sus resultados. Pensado para el calentamiento inicial: el
+        pool no garantiza que cada tarea caiga en un proceso distinto.
+        """
+        executor = self._get_executor()
+        futures = [executor.submit(function, *args) for _ in range(self.workers)]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._reset_executor()
+
+
+inference_pool = None
+if settings.FACE_INFERENCE_WORKERS > 0:
+    inference_pool = InferencePool(
+        workers=settings.FACE_INFERENCE_WORKERS,
+        max_pending=settings.FACE_INFERENCE_MAX_PENDING,
+        timeout=settings.FACE_INFERENCE_TIMEOUT,
+    )
+
+
+def _run(function, *args):
+    if inference_pool is None:
+        return function(*args)
+    return inference_pool.run(function, *args)
+
+
+def _add_timings(timer, timings, started):
+    # Lo que no se midió en el proceso de inferencia es lectura, cola y envío
+    elapsed = (time.perf_counter() - started) * 1000
+    for stage, stage_ms in timings.items():
+        timer.add(stage, stage_ms)
+    timer.add('inference_wait', max(elapsed - sum(timings.values()), 0.0))
+
+
+def encode_image(image_file, profile, skip_boxes=(), timer=None, known_locations=None):
+    """
+    Detecta y codifica los rostros de una imagen subida. Usa el pool de
+    procesos si está configurado; si no, se ejecuta en el hilo actual.
+    Con `known_locations` se codifican esas cajas sin detectar.
+    Con un StageTimer (ver timing.py) se registran decode, detection,
+    encoding y, como inference_wait, el resto del tiempo (lectura del
+    archivo, cola del pool y envío entre procesos).
+    Devuelve (ubicaciones, codificaciones); ver pipeline.detect_and_encode.
+    """
+    started = time.perf_counter()
+    image_file.seek(0)
+    image_bytes = image_file.read()
+    if timer is None:
+        return _run(_encode_image_bytes, image_bytes, profile, skip_boxes, known_locations)
+
+    locations, encodings, timings = _run(_encode_image_bytes_timed, image_bytes, profile, skip_boxes, known_locations)
+    _add_timings(timer, timings, started)
+    return locations, encodings
+
+
+def encode_face_crops(crop_files, profile, timer):
+    """
+    Codifica recortes de un solo rostro enviados por el cliente (ver
+    pipeline.encode_face_crops_timed). Devuelve la lista de codificaciones.
+    """
+    started = time.perf_counter()
+    crops = []
+    for crop_file in crop_files:
+        crop_file.seek(0)
+        crops.append(crop_file.read())
+    encodings, timings = _run(_encode_face_crops_timed, crops, profile)
+    _add_timings(timer, timings, started)
+    return encodings
+
+
+def encode_enrollment_images(images, profile, pool=None):
+    """
+    Codifica varias fotos de registro (bytes) en paralelo en `pool` o, si no
+    se indica, en el pool compartido; sin pool se procesan en el hilo actual.
+    Devuelve una lista alineada de (rostros, codificación, error); ver
+    pipeline.encode_enrollment_bytes.
+    """
+    pool = pool or inference_pool
+    if pool is None:
+        return [_encode_enrollment_bytes(image_bytes, profile) for image_bytes in images]
+    return pool.map(_encode_enrollment_bytes, images, profile)
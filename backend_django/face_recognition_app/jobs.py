@@ -0,0 +1,88 @@
+# face_recognition_app/jobs.py
+"""
+Ejecución asíncrona de trabajos de reconocimiento y registro facial.
+
+Si hay un broker de Celery configurado (CELERY_BROKER_URL) los trabajos se
+envían a Celery; si no, se ejecutan en un pool de hilos del propio proceso.
+En ambos casos el estado y el resultado quedan en FaceRecognitionJob.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import FaceRecognitionJob
+from .services import get_face_encoding_from_image, recognize_faces_in_stream, save_face_encoding
+
+_local_executor = None
+_local_executor_lock = threading.Lock()
+
+
+def _get_local_executor():
+    global _local_executor
+    with _local_executor_lock:
+        if _local_executor is None:
+            _local_executor = ThreadPoolExecutor(
+                max_workers=settings.FACE_JOBS_LOCAL_WORKERS,
+                thread_name_prefix='face-jobs',
+            )
+        return _local_executor
+
+
+def _run_locally(job_id):
+    close_old_connections()
+    try:
+        execute_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def enqueue_job(job):
+    """Programa la ejecución del trabajo una vez confirmada la transacción actual"""
+    job_id = str(job.id)
+    if settings.CELERY_BROKER_URL:
+        from .tasks import run_face_job
+        transaction.on_commit(lambda: run_face_job.delay(job_id))
+    else:
+        transaction.on_commit(lambda: _get_local_executor().submit(_run_locally, job_id))
+
+
+def execute_job(job_id):
+    """Ejecuta un trabajo pendiente y guarda su resultado"""
+    updated = FaceRecognitionJob.objects.filter(id=job_id, status='pending').update(
+        status='running', updated_at=timezone.now()
+    )
+    if not updated:
+        # Ya fue tomado por otro worker o no existe
+        return
+
+    job = FaceRecognitionJob.objects.select_related('user').get(id=job_id)
+    try:
+        if job.kind == 'recognition':
+            result = recognize_faces_in_stream(job.image, job.session_id)
+        else:
+            result = _register_face(job)
+    except Exception as e:
+        print(f"Error running face job {job_id}: {e}")
+        result = {'error': f"Ocurrió un error al procesar el trabajo: {e}"}
+
+    job.status = 'failed' if 'error' in result else 'completed'
+    job.result = result
+    job.error_message = result.get('error')
+    job.completed_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error_message', 'completed_at', 'updated_at'])
+
+    # La imagen de un reconocimiento no se necesita más; la de un registro
+    # queda como imagen de perfil de la codificación facial
+    if job.kind == 'recognition' and job.image:
+        job.image.delete(save=True)
+
+
+def _register_face(job):
+    encoding = get_face_encoding_from_image(job.image)
+    if encoding is None:
+        return {'error': 'No se pudo detectar una única cara en la imagen. Intente con otra foto.'}
+    face_encoding_obj, created = save_face_encoding(job.user, job.image.name, encoding)
+    return {'created': created, 'updated_at': face_encoding_obj.updated_at.isoformat()}
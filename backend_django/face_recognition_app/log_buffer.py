@@ -0,0 +1,161 @@
+# face_recognition_app/log_buffer.py
+"""
+Escritura diferida de registros de alto volumen (FaceVerificationLog, métricas).
+
+Las entradas se acumulan en memoria en cada proceso y un hilo en segundo
+plano las escribe con bulk_create cuando el buffer alcanza `max_size`
+entradas o pasan `flush_interval` segundos, y una última vez al terminar
+el proceso. Así el reconocimiento nunca espera una escritura de log.
+
+Con `spill_path` las entradas se agregan a un archivo JSONL en lugar de ir a
+la base de datos; `manage.py load_buffered_logs` las carga después. Si el
+bulk_create de un lote falla se reintenta fila por fila, así una entrada
+inválida (p. ej. de una sesión ya borrada) no descarta las demás.
+"""
+import atexit
+import json
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+BULK_CREATE_BATCH_SIZE = 500
+
+
+class BufferedModelWriter:
+    """Buffer por proceso de filas de un modelo, vaciado por un hilo propio"""
+
+    def __init__(self, model_label, max_size, flush_interval, spill_path='', timestamp_field='created_at'):
+        self.model_label = model_label
+        self.timestamp_field = timestamp_field
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._entries = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def add(self, **fields):
+        """Encola una fila; sin buffer (max_size = 0) se escribe de inmediato"""
+        # La fecha es la del evento, no la del momento en que se vacía el buffer
+        fields.setdefault(self.timestamp_field, timezone.now())
+        if not self.enabled:
+            self.model.objects.create(**fields)
+            return
+        with self._lock:
+            self._entries.append(fields)
+            pending = len(self._entries)
+            if self._thread is None:
+                self._start()
+        if pending >= self.max_size:
+            self._wakeup.set()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name=f'log-buffer-{self.model_label}', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Escribe todas las entradas pendientes. Devuelve cuántas se escribieron."""
+        with self._flush_lock:
+            with self._lock:
+                entries, self._entries = self._entries, []
+            if not entries:
+                return 0
+            if self.spill_path:
+                try:
+                    self._spill(entries)
+                except Exception as e:
+                    print(f"Error writing {len(entries)} buffered {self.model_label} entries: {e}")
+                    return 0
+                return len(entries)
+            return self._write(entries)
+
+    def _write(self, entries):
+        model = self.model
+        try:
+            # Con savepoint: si falla dentro de una transacción abierta, los reintentos aún pueden escribir
+            with transaction.atomic():
+                model.objects.bulk_create([model(**fields) for fields in entries], batch_size=BULK_CREATE_BATCH_SIZE)
+            return len(entries)
+        except Exception as e:
+            print(f"Error writing {len(entries)} buffered {self.model_label} entries, retrying one by one: {e}")
+        written = 0
+        for fields in entries:
+            try:
+                with transaction.atomic():
+                    model.objects.create(**fields)
+                written += 1
+            except Exception as e:
+                print(f"Error writing buffered {self.model_label} entry {fields}: {e}")
+        return written
+
+    def _spill(self, entries):
+        # Una sola escritura en modo append: las líneas de varios procesos no se mezclan
+        lines = ''.join(
+            json.dumps({'model': self.model_label, 'fields': fields}, cls=DjangoJSONEncoder) + '\n'
+            for fields in entries
+        )
+        with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+            spill_file.write(lines)
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def load_spilled_entries(lines):
+    """
+    Convierte líneas JSONL escritas por BufferedModelWriter en instancias de
+    modelo sin guardar, agrupadas por modelo: {modelo: [instancias]}.
+    """
+    instances = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        model = apps.get_model(entry['model'])
+        fields = {
+            name: model._meta.get_field(name).to_python(value)
+            for name, value in entry['fields'].items()
+        }
+        instances.setdefault(model, []).append(model(**fields))
+    return instances
+
+
+verification_log = BufferedModelWriter(
+    'face_recognition_app.FaceVerificationLog',
+    max_size=settings.FACE_LOG_BUFFER_SIZE,
+    flush_interval=settings.FACE_LOG_FLUSH_INTERVAL,
+    spill_path=settings.FACE_LOG_SPILL_PATH,
+)
+
+recognition_metrics = BufferedModelWriter(
+    'face_recognition_app.RecognitionMetric',
+    max_size=settings.FACE_LOG_BUFFER_SIZE,
+    flush_interval=settings.FACE_LOG_FLUSH_INTERVAL,
+    spill_path=settings.FACE_LOG_SPILL_PATH,
+)
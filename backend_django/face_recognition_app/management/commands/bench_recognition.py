@@ -0,0 +1,234 @@
+# face_recognition_app/management/commands/bench_recognition.py
+import json
+import platform
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from io import BytesIO
+
+import face_recognition
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from attendance.models import Attendance, AttendanceSession, Ficha
+from face_recognition_app import services
+from face_recognition_app.benchmarks import composite_image, latency_summary, synthetic_encodings, timed
+from face_recognition_app.codec import pack_encoding
+from face_recognition_app.frame_cache import frame_cache
+from face_recognition_app.gallery import gallery_cache
+from face_recognition_app.log_buffer import recognition_metrics, verification_log
+from face_recognition_app.models import FaceEncoding, FaceRecognitionSettings
+from face_recognition_app.pipeline import detect_and_encode
+from face_recognition_app.timing import StageTimer
+from face_recognition_app.warmup import warmup_image_bytes
+
+User = get_user_model()
+
+
+def _summaries(samples):
+    return {stage: latency_summary(values) for stage, values in sorted(samples.items())}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide recognize_faces_in_stream de punta a punta sobre una galería sintética "
+        "(estudiantes, ficha, sesión y asistencias creados dentro de una transacción que "
+        "se revierte al final). Reproduce las imágenes indicadas y mosaicos con varios "
+        "rostros, y reporta p50/p95 por etapa (ver timing.py) y consultas SQL por frame "
+        "en JSON. Los registros de verificación y las métricas se escriben sin buffer "
+        "para que queden dentro de la transacción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help="Imágenes de prueba (por defecto FACE_WARMUP_IMAGE)")
+        parser.add_argument('--students', type=int, default=500, help="Tamaño de la galería sintética")
+        parser.add_argument('--composites', type=int, nargs='*', default=[2, 3],
+                            help="Mosaicos NxN generados con las imágenes (p. ej. 2 3)")
+        parser.add_argument('--repeat', type=int, default=5, help="Frames medidos por imagen")
+        parser.add_argument('--warmup', type=int, default=1, help="Frames no medidos por imagen")
+        parser.add_argument('--cold-gallery', action='store_true', help="Invalidar la galería en caché antes de cada frame")
+        parser.add_argument('--keep-state', action='store_true',
+                            help="No reiniciar asistencias, frames duplicados ni pistas entre frames (simula un stream)")
+        parser.add_argument('--output', help="Archivo JSON de salida (por defecto la salida estándar)")
+        parser.add_argument('--baseline', help="JSON de una ejecución anterior para comparar p50/p95")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        samples = self._load_samples(options['images'] or [settings.FACE_WARMUP_IMAGE], options['composites'])
+        profile = FaceRecognitionSettings.current().get_profile()
+        rng = np.random.default_rng(options['seed'])
+
+        # Los rostros reales de las muestras se inscriben para que haya coincidencias
+        known_encodings = []
+        for sample in samples:
+            if sample['name'].startswith('mosaico'):
+                continue
+            image = face_recognition.load_image_file(BytesIO(sample['bytes']))
+            _, encodings = detect_and_encode(image, profile)
+            known_encodings.extend(encodings)
+        filler = max(options['students'] - len(known_encodings), 0)
+        gallery_encodings = np.vstack(
+            [np.asarray(known_encodings, dtype=np.float32).reshape(-1, 128), synthetic_encodings(filler, rng)]
+        )
+
+        buffer_sizes = verification_log.max_size, recognition_metrics.max_size
+        verification_log.max_size = recognition_metrics.max_size = 0
+        session = None
+        try:
+            with transaction.atomic():
+                session = self._create_fixtures(gallery_encodings)
+                report = self._run(samples, session, options)
+                transaction.set_rollback(True)
+        finally:
+            verification_log.max_size, recognition_metrics.max_size = buffer_sizes
+            if session is not None:
+                gallery_cache.invalidate(session.ficha_id)
+                frame_cache.forget(session.id)
+                services.session_trackers.forget(session.id)
+
+        report['environment'] = {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'database': connection.vendor,
+            'profile': profile._asdict(),
+            'gallery_size': len(gallery_encodings),
+            'enrolled_faces': len(known_encodings),
+            'gallery_precision': settings.FACE_GALLERY_PRECISION,
+            'inference_workers': settings.FACE_INFERENCE_WORKERS,
+            'cold_gallery': options['cold_gallery'],
+            'keep_state': options['keep_state'],
+            'repeat': options['repeat'],
+        }
+        output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(f"Resultados guardados en {options['output']}")
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            self._compare(report, options['baseline'])
+
+    def _load_samples(self, paths, grids):
+        samples, images = [], []
+        for path in paths:
+            image_bytes, source = warmup_image_bytes(path)
+            if source != str(path):
+                self.stderr.write(f"{path}: no es una imagen válida, se usa una imagen sintética")
+                source = 'sintética'
+            if any(sample['name'] == source for sample in samples):
+                continue
+            image = Image.open(BytesIO(image_bytes))
+            samples.append({'name': source, 'bytes': image_bytes, 'size': image.size})
+            images.append(image)
+        for grid in grids:
+            if grid < 2:
+                raise CommandError("Los mosaicos deben ser de al menos 2x2.")
+            image_bytes = composite_image(images, grid)
+            samples.append({'name': f'mosaico {grid}x{grid}', 'bytes': image_bytes, 'size': Image.open(BytesIO(image_bytes)).size})
+        return samples
+
+    def _create_fixtures(self, gallery_encodings):
+        """Instructor, ficha, sesión activa y un estudiante inscrito por codificación"""
+        tag = uuid.uuid4().hex[:8]
+        password = make_password(None)
+        instructor = User.objects.create(username=f'bench-{tag}-instructor', role='instructor', password=password)
+        students = User.objects.bulk_create([
+            User(username=f'bench-{tag}-{index}', role='student', password=password)
+            for index in range(len(gallery_encodings))
+        ])
+        ficha = Ficha.objects.create(programa_formacion='Benchmark', numero_ficha=f'bench-{tag}', instructor=instructor)
+        Ficha.students.through.objects.bulk_create([
+            Ficha.students.through(ficha_id=ficha.id, user_id=student.id) for student in students
+        ])
+        now = timezone.localtime()
+        session = AttendanceSession.objects.create(
+            ficha=ficha, date=now.date(), start_time=now.time(),
+            end_time=(now + timedelta(hours=1)).time(), permisividad=15,
+        )
+        Attendance.objects.bulk_create([Attendance(session=session, student=student) for student in students])
+        FaceEncoding.objects.bulk_create([
+            FaceEncoding(user=student, encoding_data=pack_encoding(encoding))
+            for student, encoding in zip(students, gallery_encodings)
+        ])
+        return session
+
+    def _reset_state(self, session, options):
+        if options['cold_gallery']:
+            gallery_cache.invalidate(session.ficha_id)
+        if not options['keep_state']:
+            Attendance.objects.filter(session=session).exclude(status='absent').update(
+                status='absent', check_in_time=None, verified_by_face=False
+            )
+            frame_cache.forget(session.id)
+            services.session_trackers.forget(session.id)
+
+    def _run(self, samples, session, options):
+        overall = {'total': [], 'queries': [], 'stages': defaultdict(list)}
+        per_sample = {}
+        for sample in samples:
+            stages = defaultdict(list)
+            totals, queries, recognized, errors = [], [], [], 0
+            for iteration in range(options['warmup'] + options['repeat']):
+                self._reset_state(session, options)
+                image_file = BytesIO(sample['bytes'])
+                image_file.name = 'frame.jpg'
+                timer = StageTimer()
+                with CaptureQueriesContext(connection) as captured:
+                    result, elapsed = timed(services.recognize_faces_in_stream, image_file, session.id, timer)
+                if iteration < options['warmup']:
+                    continue
+                totals.append(elapsed)
+                queries.append(len(captured))
+                for stage, stage_ms in timer.stages.items():
+                    stages[stage].append(stage_ms)
+                recognized.append(len(result.get('recognized_students', [])))
+                errors += 'error' in result
+            for stage, values in stages.items():
+                overall['stages'][stage].extend(values)
+            overall['total'].extend(totals)
+            overall['queries'].extend(queries)
+            per_sample[sample['name']] = {
+                'width': sample['size'][0],
+                'height': sample['size'][1],
+                'total': latency_summary(totals),
+                'stages': _summaries(stages),
+                'queries_per_frame': latency_summary(queries),
+                'recognized_per_frame': float(np.mean(recognized)) if recognized else 0.0,
+                'errors': errors,
+            }
+        return {
+            'overall': {
+                'total': latency_summary(overall['total']),
+                'stages': _summaries(overall['stages']),
+                'queries_per_frame': latency_summary(overall['queries']),
+            },
+            'samples': per_sample,
+        }
+
+    def _compare(self, report, baseline_path):
+        try:
+            with open(baseline_path, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer la línea base: {e}")
+
+        rows = [('total', report['overall']['total'], baseline['overall'].get('total', {}))]
+        rows += [
+            (stage, summary, baseline['overall'].get('stages', {}).get(stage, {}))
+            for stage, summary in report['overall']['stages'].items()
+        ]
+        rows.append(('consultas', report['overall']['queries_per_frame'], baseline['overall'].get('queries_per_frame', {})))
+        self.stderr.write(f"{'etapa':<12} {'p50 base':>10} {'p50':>10} {'p95 base':>10} {'p95':>10}")
+        for stage, current, previous in rows:
+            self.stderr.write(
+                f"{stage:<12} {str(previous.get('p50')):>10} {str(current['p50']):>10} "
+                f"{str(previous.get('p95')):>10} {str(current['p95']):>10}"
+            )
@@ -0,0 +1,91 @@
+# face_recognition_app/management/commands/benchmark_gallery_precision.py
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from face_recognition_app.benchmarks import latency_summary, synthetic_encodings, timed
+from face_recognition_app.gallery import FaceGallery
+from face_recognition_app.matching import match_faces
+from face_recognition_app.models import FaceEncoding
+from face_recognition_app.quantization import PRECISIONS
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la galería cuantizada (float16, int8) con la comparación exacta en float32: "
+        "memoria, latencia y coincidencias que cambian, con y sin el recálculo exacto de los "
+        "pares cercanos a la tolerancia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20000, help="Tamaño de la galería sintética")
+        parser.add_argument('--frames', type=int, default=200, help="Frames de prueba")
+        parser.add_argument('--faces', type=int, default=30, help="Rostros por frame")
+        parser.add_argument('--tolerance', type=float, default=0.4)
+        parser.add_argument('--margin', type=float, default=settings.FACE_GALLERY_RERANK_MARGIN)
+        parser.add_argument('--from-db', action='store_true', help="Usar las codificaciones activas en lugar de datos sintéticos")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        if options['from_db']:
+            student_ids, encodings = FaceEncoding.objects.filter(is_active=True).encoding_matrix()
+            if not len(student_ids):
+                raise CommandError("No hay codificaciones activas en la base de datos.")
+        else:
+            encodings = synthetic_encodings(options['students'], rng)
+            student_ids = np.arange(1, len(encodings) + 1, dtype=np.int64)
+
+        # Frames: rostros de la galería con ruido (distancia ~0.2-0.5) y algunos desconocidos
+        frames = []
+        for _ in range(options['frames']):
+            known = rng.choice(len(encodings), size=options['faces'], replace=False)
+            noise = rng.normal(0.0, rng.uniform(0.018, 0.045, (options['faces'], 1)), (options['faces'], encodings.shape[1]))
+            probes = encodings[known] + noise.astype(np.float32)
+            strangers = rng.random(options['faces']) < 0.2
+            probes[strangers] = synthetic_encodings(int(strangers.sum()), rng, encodings.shape[1])
+            frames.append(probes)
+
+        def exact_loader(ids):
+            return ids, encodings[np.searchsorted(student_ids, ids)]
+
+        tolerance = options['tolerance']
+        reference = FaceGallery(0, student_ids, encodings)
+        expected = [
+            [m.student_id for m in match_faces(probes, reference, tolerance)] for probes in frames
+        ]
+
+        self.stdout.write(
+            f"{len(student_ids)} estudiantes, {len(frames)} frames x {options['faces']} rostros, "
+            f"tolerancia {tolerance}, margen {options['margin']}"
+        )
+        self.stdout.write(
+            f"{'precisión':<10} {'MB':>7} {'p50 ms':>8} {'p95 ms':>8} {'máx. Δdist':>11} "
+            f"{'cambios sin recálculo':>22} {'cambios con recálculo':>22} {'recalculados/frame':>19}"
+        )
+        for precision in PRECISIONS:
+            approximate = FaceGallery(0, student_ids, encodings, precision=precision)
+            reranked = FaceGallery(0, student_ids, encodings, precision=precision, exact_loader=exact_loader)
+            max_error = 0.0
+            changed_plain, changed_reranked, samples = 0, 0, []
+            for probes, expected_ids in zip(frames, expected):
+                max_error = max(max_error, float(np.abs(
+                    approximate.encodings.distances(probes) - reference.encodings.distances(probes)
+                ).max()))
+                plain = [m.student_id for m in match_faces(probes, approximate, tolerance, rerank_margin=0.0)]
+                matches, elapsed = timed(match_faces, probes, reranked, tolerance, rerank_margin=options['margin'])
+                samples.append(elapsed)
+                changed_plain += sum(a != b for a, b in zip(plain, expected_ids))
+                changed_reranked += sum(m.student_id != b for m, b in zip(matches, expected_ids))
+
+            rerank_counts = [
+                int((np.abs(reranked.encodings.distances(probes) - tolerance) <= options['margin']).sum())
+                for probes in frames
+            ] if precision != 'float32' else [0]
+            summary = latency_summary(samples)
+            total_faces = len(frames) * options['faces']
+            self.stdout.write(
+                f"{precision:<10} {approximate.nbytes / 2 ** 20:>7.2f} {summary['p50']:>8} {summary['p95']:>8} "
+                f"{max_error:>11.5f} {changed_plain:>12}/{total_faces:<9} {changed_reranked:>12}/{total_faces:<9} "
+                f"{np.mean(rerank_counts):>19.1f}"
+            )
@@ -0,0 +1,56 @@
+# face_recognition_app/management/commands/benchmark_profiles.py
+import face_recognition
+from django.core.management.base import BaseCommand, CommandError
+
+from face_recognition_app.benchmarks import latency_summary, parse_profile, timed
+from face_recognition_app.models import FaceRecognitionSettings
+from face_recognition_app.pipeline import detect_and_encode
+
+DEFAULT_PROFILES = [
+    'hog:0:1:small',
+    'hog:1:1:small',
+    'hog:1:1:large',
+    'hog:2:1:large',
+    'hog:1:10:large',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia de detección + codificación de varios perfiles de reconocimiento "
+        "(modelo:upsample:jitters:landmarks[:max_dim]). Incluye siempre el perfil activo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='+', help="Imágenes de prueba")
+        parser.add_argument('--profiles', nargs='+', default=DEFAULT_PROFILES)
+        parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por imagen")
+
+    def handle(self, *args, **options):
+        try:
+            profiles = [parse_profile(text) for text in options['profiles']]
+            images = [face_recognition.load_image_file(path) for path in options['images']]
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        active = FaceRecognitionSettings.get_settings().get_profile()
+        if active not in profiles:
+            profiles.insert(0, active)
+
+        self.stdout.write(f"{'perfil':<28} {'p50 ms':>8} {'p95 ms':>8} {'rostros':>8}")
+        for profile in profiles:
+            samples = []
+            faces = 0
+            for image in images:
+                for _ in range(options['repeat']):
+                    (locations, _), elapsed = timed(detect_and_encode, image, profile)
+                    samples.append(elapsed)
+                faces += len(locations)
+            summary = latency_summary(samples)
+            label = (
+                f"{profile.detection_model}:{profile.number_of_times_to_upsample}:"
+                f"{profile.num_jitters}:{profile.landmark_model}:{profile.max_image_dimension}"
+            )
+            if profile == active:
+                label += ' *'
+            self.stdout.write(f"{label:<28} {summary['p50']:>8} {summary['p95']:>8} {faces:>8}")
@@ -0,0 +1,62 @@
+# face_recognition_app/management/commands/downscale_report.py
+import time
+
+import face_recognition
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from face_recognition_app.matching import face_distance_matrix
+from face_recognition_app.preprocessing import downscale_for_detection, scale_locations
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara latencia y precisión de la detección facial con distintos valores de "
+        "max_image_dimension. La resolución original se usa como referencia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='+', help="Imágenes de prueba (por ejemplo, frames de la cámara del aula)")
+        parser.add_argument('--dimensions', nargs='+', type=int, default=[1280, 960, 640, 480])
+        parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por imagen para promediar tiempos")
+
+    def handle(self, *args, **options):
+        try:
+            images = [face_recognition.load_image_file(path) for path in options['images']]
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo cargar una de las imágenes: {e}")
+
+        baseline = [self._run(image, 0, options['repeat']) for image in images]
+        self.stdout.write(f"{'max_dim':>8} {'detección ms':>13} {'total ms':>9} {'rostros':>9} {'desvío cod.':>12}")
+        for dimension in [0] + options['dimensions']:
+            results = [self._run(image, dimension, options['repeat']) for image in images]
+            detection_ms = np.mean([r['detection_ms'] for r in results])
+            total_ms = np.mean([r['total_ms'] for r in results])
+            found = sum(len(r['encodings']) for r in results)
+            expected = sum(len(b['encodings']) for b in baseline)
+            drifts = []
+            for result, reference in zip(results, baseline):
+                if len(result['encodings']) and len(reference['encodings']):
+                    distances = face_distance_matrix(result['encodings'], np.asarray(reference['encodings']))
+                    drifts.extend(distances.min(axis=1))
+            drift = f"{np.mean(drifts):.4f}" if drifts else '-'
+            label = dimension or 'original'
+            self.stdout.write(f"{label:>8} {detection_ms:>13.1f} {total_ms:>9.1f} {found:>4}/{expected:<4} {drift:>12}")
+
+    def _run(self, image, dimension, repeat):
+        detection_times, total_times = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            detection_image, scale = downscale_for_detection(image, dimension)
+            locations = face_recognition.face_locations(detection_image)
+            locations = scale_locations(locations, scale, image.shape)
+            detected = time.perf_counter()
+            encodings = face_recognition.face_encodings(image, locations)
+            finished = time.perf_counter()
+            detection_times.append((detected - started) * 1000)
+            total_times.append((finished - started) * 1000)
+        return {
+            'detection_ms': float(np.median(detection_times)),
+            'total_ms': float(np.median(total_times)),
+            'encodings': encodings,
+        }
@@ -0,0 +1,73 @@
+# face_recognition_app/management/commands/enroll_faces.py
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from face_recognition_app.enrollment import bulk_enroll, open_image_source
+from face_recognition_app.face_index import face_index
+from face_recognition_app.inference import InferencePool
+
+
+class Command(BaseCommand):
+    help = (
+        "Registra los rostros de una cohorte desde un ZIP o un directorio de fotos nombradas "
+        "por student_id (p. ej. 1023456789.jpg). Las fotos se codifican en paralelo en un pool "
+        "de procesos propio y se omiten las que tienen rostros repetidos en el lote o ya "
+        "registrados por otro aprendiz."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Archivo ZIP o directorio con las fotos")
+        parser.add_argument('--workers', type=int, default=settings.FACE_ENROLLMENT_WORKERS,
+                            help="Procesos para codificar (0 = en este proceso)")
+        parser.add_argument('--replace', action='store_true', help="Reemplazar los rostros ya registrados")
+        parser.add_argument('--dry-run', action='store_true', help="Validar las fotos sin escribir nada")
+        parser.add_argument('--tolerance', type=float, default=0.6, help="Distancia máxima para considerar un duplicado")
+        parser.add_argument('--output', help="Archivo JSON con el resultado de cada foto")
+
+    def handle(self, *args, **options):
+        pool = None
+        if options['workers'] > 0:
+            pool = InferencePool(
+                workers=options['workers'],
+                max_pending=options['workers'],
+                timeout=settings.FACE_INFERENCE_TIMEOUT,
+            )
+
+        def progress(done, total):
+            self.stderr.write(f"{done}/{total} fotos codificadas")
+
+        started = time.perf_counter()
+        try:
+            with open_image_source(options['source']) as image_source:
+                report = bulk_enroll(
+                    image_source, replace=options['replace'], dry_run=options['dry_run'],
+                    pool=pool, tolerance=options['tolerance'], progress=progress, update_index=False,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if not options['dry_run'] and (report['summary'].get('enrolled') or report['summary'].get('replaced')):
+            # Una sola reconstrucción al final en lugar de reescribir el índice por cada rostro
+            self.stderr.write(f"Índice de rostros reconstruido con {face_index.rebuild()} codificaciones")
+        elapsed = time.perf_counter() - started
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output_file:
+                json.dump(report, output_file, indent=2, ensure_ascii=False)
+                output_file.write('\n')
+        else:
+            for entry in report['results']:
+                if entry['status'] not in ('enrolled', 'replaced'):
+                    self.stdout.write(f"{entry['file']}: {entry['detail']}")
+
+        summary = ', '.join(f"{status}: {count}" for status, count in sorted(report['summary'].items()))
+        prefix = "Simulación" if options['dry_run'] else "Registro"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} de {report['files']} fotos en {elapsed:.1f} s ({summary})"
+        ))
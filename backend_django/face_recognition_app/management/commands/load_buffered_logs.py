@@ -0,0 +1,49 @@
+# face_recognition_app/management/commands/load_buffered_logs.py
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from face_recognition_app.log_buffer import BULK_CREATE_BATCH_SIZE, load_spilled_entries
+
+LOADING_SUFFIX = '.loading'
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga en la base de datos los registros escritos en archivo por el buffer de logs "
+        "(FACE_LOG_SPILL_PATH). Cada archivo se renombra antes de leerlo, así los procesos "
+        "que siguen escribiendo crean uno nuevo; si la carga falla, el archivo renombrado "
+        "se conserva y puede pasarse de nuevo a este comando."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Archivos JSONL (por defecto FACE_LOG_SPILL_PATH)")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [settings.FACE_LOG_SPILL_PATH]
+        if not any(paths):
+            raise CommandError("No se indicó ningún archivo y FACE_LOG_SPILL_PATH está vacío.")
+
+        for path in paths:
+            if not os.path.exists(path):
+                self.stdout.write(f"{path}: no existe, nada que cargar")
+                continue
+            loading_path = path if path.endswith(LOADING_SUFFIX) else f"{path}.{os.getpid()}{LOADING_SUFFIX}"
+            if loading_path != path:
+                os.replace(path, loading_path)
+
+            with open(loading_path, encoding='utf-8') as spill_file:
+                try:
+                    instances = load_spilled_entries(spill_file)
+                except (ValueError, LookupError) as e:
+                    raise CommandError(f"{loading_path}: línea inválida ({e}); el archivo se conserva.")
+
+            with transaction.atomic():
+                for model, rows in instances.items():
+                    model.objects.bulk_create(rows, batch_size=BULK_CREATE_BATCH_SIZE)
+            os.remove(loading_path)
+
+            loaded = ', '.join(f"{len(rows)} {model._meta.label}" for model, rows in instances.items())
+            self.stdout.write(self.style.SUCCESS(f"{path}: cargados {loaded or '0 registros'}"))
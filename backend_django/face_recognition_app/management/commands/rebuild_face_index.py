@@ -0,0 +1,14 @@
+# face_recognition_app/management/commands/rebuild_face_index.py
+from django.core.management.base import BaseCommand
+
+from face_recognition_app.face_index import face_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde la base de datos el índice de rostros usado para detectar duplicados."
+
+    def handle(self, *args, **options):
+        size = face_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice reconstruido con {size} codificaciones en {face_index.path}"
+        ))
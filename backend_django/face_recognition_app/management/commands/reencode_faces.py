@@ -0,0 +1,142 @@
+# face_recognition_app/management/commands/reencode_faces.py
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from face_recognition_app.face_index import face_index
+from face_recognition_app.inference import InferencePool, InferenceUnavailable
+from face_recognition_app.models import FaceEncoding, FaceRecognitionSettings
+from face_recognition_app.reencoding import reencode_chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera las codificaciones faciales guardadas con la configuración de reconocimiento "
+        "activa (p. ej. tras cambiar el modelo de puntos o los remuestreos). Recorre la tabla por "
+        "tandas en orden de ID, codifica en un pool de procesos y escribe cada tanda en su propia "
+        "transacción. Con --checkpoint guarda el último ID procesado y, si se interrumpe, la "
+        "siguiente ejecución continúa desde ahí."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only-stale', action='store_true',
+                            help="Solo las codificaciones de otra versión (ver FaceEncoding.model_version)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Codificar y reportar cuánto cambian los centroides sin escribir nada")
+        parser.add_argument('--workers', type=int, default=settings.FACE_ENROLLMENT_WORKERS,
+                            help="Procesos para codificar (0 = en este proceso)")
+        parser.add_argument('--chunk-size', type=int, default=100, help="Registros por tanda y transacción")
+        parser.add_argument('--checkpoint', help="Archivo JSON con el progreso, para reanudar")
+        parser.add_argument('--restart', action='store_true', help="Ignorar el progreso guardado en --checkpoint")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size debe ser mayor que cero.")
+        profile = FaceRecognitionSettings.current().get_profile()
+        version = profile.model_version
+        state = self._load_checkpoint(options, version)
+
+        queryset = FaceEncoding.objects.filter(id__gt=state['last_id'])
+        if options['only_stale']:
+            queryset = queryset.exclude(model_version=version)
+        total = queryset.count()
+        self.stderr.write(f"{total} codificaciones por procesar con la versión {version}")
+
+        pool = None
+        if options['workers'] > 0:
+            pool = InferencePool(
+                workers=options['workers'],
+                max_pending=options['workers'],
+                timeout=settings.FACE_INFERENCE_TIMEOUT,
+            )
+
+        started = time.perf_counter()
+        updated_before = state['updated']
+        rows = queryset.order_by('id').values_list('id', 'user_id', 'profile_image', 'encoding_data')
+        chunk = []
+        try:
+            for row in rows.iterator(chunk_size=options['chunk_size']):
+                chunk.append(row)
+                if len(chunk) < options['chunk_size']:
+                    continue
+                self._process(chunk, profile, pool, options, state, version)
+                chunk = []
+            if chunk:
+                self._process(chunk, profile, pool, options, state, version)
+        except InferenceUnavailable as e:
+            raise CommandError(f"Se interrumpió en el ID {state['last_id']}: {e.detail}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if not options['dry_run'] and state['updated'] > updated_before:
+                # Las tandas no tocan el índice de duplicados: se reconstruye una vez, aunque se interrumpa
+                self.stderr.write(f"Índice de rostros reconstruido con {face_index.rebuild()} codificaciones")
+
+        processed, updated, failed, shifts = state['processed'], state['updated'], state['failed'], state['shifts']
+        elapsed = time.perf_counter() - started
+        failures = ', '.join(f"{reason}: {count}" for reason, count in sorted(failed.items())) or 'ninguno'
+        self.stdout.write(f"Errores: {failures}")
+        if shifts:
+            self.stdout.write(
+                f"Desplazamiento de los centroides: media {np.mean(shifts):.4f}, "
+                f"p95 {np.percentile(shifts, 95):.4f}, máximo {np.max(shifts):.4f}"
+            )
+        prefix = "Simulación" if options['dry_run'] else "Regeneración"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}: {processed} codificaciones procesadas, {updated} "
+            f"{'regenerables' if options['dry_run'] else 'actualizadas'} en {elapsed:.1f} s"
+        ))
+
+    def _process(self, chunk, profile, pool, options, state, version):
+        result = reencode_chunk(chunk, profile, pool=pool, dry_run=options['dry_run'])
+        state['last_id'] = chunk[-1][0]
+        state['processed'] += len(chunk)
+        state['updated'] += result['updated']
+        state['failed'].update(result['failed'])
+        state['shifts'].extend(result['shifts'])
+        if options['checkpoint'] and not options['dry_run']:
+            self._save_checkpoint(options['checkpoint'], state, version)
+        self.stderr.write(
+            f"{state['processed']} procesadas, {state['updated']} actualizadas, "
+            f"{sum(state['failed'].values())} con error (último ID {state['last_id']})"
+        )
+
+    def _load_checkpoint(self, options, version):
+        state = {'last_id': 0, 'processed': 0, 'updated': 0, 'failed': Counter(), 'shifts': []}
+        path = options['checkpoint']
+        if not path or options['restart'] or options['dry_run'] or not os.path.exists(path):
+            return state
+        try:
+            with open(path, encoding='utf-8') as checkpoint_file:
+                saved = json.load(checkpoint_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer el progreso guardado: {e}")
+        if saved.get('model_version') != version:
+            raise CommandError(
+                f"El progreso guardado es de la versión {saved.get('model_version')} y la actual es "
+                f"{version}; use --restart para empezar de nuevo."
+            )
+        state.update(
+            last_id=saved['last_id'], processed=saved['processed'], updated=saved['updated'],
+            failed=Counter(saved['failed']),
+        )
+        self.stderr.write(f"Se reanuda desde el ID {state['last_id']}")
+        return state
+
+    def _save_checkpoint(self, path, state, version):
+        # Escritura atómica: una interrupción nunca deja el archivo a medias
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({
+                'model_version': version,
+                'last_id': state['last_id'],
+                'processed': state['processed'],
+                'updated': state['updated'],
+                'failed': dict(state['failed']),
+            }, checkpoint_file, indent=2)
+        os.replace(temporary, path)
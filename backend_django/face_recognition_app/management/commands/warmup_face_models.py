@@ -0,0 +1,16 @@
+# face_recognition_app/management/commands/warmup_face_models.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from face_recognition_app.warmup import run_warmup
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga los modelos faciales y mide la primera inferencia frente a la siguiente. "
+        "Es lo mismo que hace cada worker al arrancar con FACE_WARMUP=True."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(run_warmup(), indent=2, ensure_ascii=False))
@@ -0,0 +1,151 @@
+# face_recognition_app/matching.py
+"""
+Comparación vectorizada de todos los rostros de una imagen contra la galería.
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# Franja alrededor de la tolerancia que se recalcula en float32 con galerías cuantizadas
+DEFAULT_RERANK_MARGIN = 0.02
+
+
+class FaceMatch(NamedTuple):
+    face_index: int
+    student_id: Optional[int]
+    distance: Optional[float]       # Distancia al estudiante asignado
+    best_distance: Optional[float]  # Menor distancia a cualquier estudiante (para el log)
+
+
+def face_distance_matrix(probes, gallery, gallery_sq_norms=None):
+    """
+    Distancias euclidianas (F, N) entre F codificaciones detectadas y las N de
+    la galería, calculadas en una sola operación matricial.
+    """
+    probes = np.asarray(probes, dtype=np.float32)
+    gallery = np.asarray(gallery, dtype=np.float32)
+    if not len(probes) or not len(gallery):
+        return np.empty((len(probes), len(gallery)), dtype=np.float32)
+    if gallery_sq_norms is None:
+        gallery_sq_norms = np.einsum('ij,ij->i', gallery, gallery)
+    probe_sq_norms = np.einsum('ij,ij->i', probes, probes)
+    squared = probe_sq_norms[:, None] + gallery_sq_norms[None, :] - 2.0 * (probes @ gallery.T)
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+def assign_faces(distances, student_ids, tolerance):
+    """
+    Asigna cada rostro a su estudiante más cercano dentro de la tolerancia.
+
+    Los pares (rostro, estudiante) se recorren de menor a mayor distancia, de
+    modo que si dos rostros reclaman al mismo estudiante lo obtiene el más
+    cercano y el otro pasa a su siguiente candidato válido (o queda sin
+    asignar). Devuelve un FaceMatch por rostro, en el orden de entrada.
+    """
+    face_count = distances.shape[0]
+    if not distances.size:
+        return [FaceMatch(i, None, None, None) for i in range(face_count)]
+
+    best_distances = distances.min(axis=1)
+    face_rows, gallery_cols = np.nonzero(distances <= tolerance)
+    order = np.argsort(distances[face_rows, gallery_cols], kind='stable')
+
+    assigned = {}
+    taken = set()
+    for position in order:
+        face_index, gallery_index = int(face_rows[position]), int(gallery_cols[position])
+        if face_index in assigned or gallery_index in taken:
+            continue
+        assigned[face_index] = gallery_index
+        taken.add(gallery_index)
+        if len(assigned) == face_count:
+            break
+
+    matches = []
+    for face_index in range(face_count):
+        gallery_index = assigned.get(face_index)
+        if gallery_index is None:
+            matches.append(FaceMatch(face_index, None, None, float(best_distances[face_index])))
+        else:
+            matches.append(FaceMatch(
+                face_index,
+                int(student_ids[gallery_index]),
+                float(distances[face_index, gallery_index]),
+                float(best_distances[face_index]),
+            ))
+    return matches
+
+
+def refine_with_templates(distances, probes, gallery, tolerance):
+    """
+    Ajusta en el lugar las distancias a centroides que quedan en el límite.
+
+    Por la desigualdad triangular, la distancia a cualquier plantilla de un
+    estudiante es al menos (distancia al centroide - spread). Solo los pares
+    que superan la tolerancia por menos de su spread podrían coincidir con
+    alguna plantilla; para ellos se usa la menor distancia a sus plantillas.
+    Devuelve el número de pares revisados.
+    """
+    if not distances.size or not len(gallery.template_owners):
+        return 0
+    borderline = (distances > tolerance) & (distances - gallery.spreads[None, :] <= tolerance)
+    face_rows, gallery_cols = np.nonzero(borderline)
+    if not len(face_rows):
+        return 0
+
+    candidate_faces = np.unique(face_rows)
+    selected = np.isin(gallery.template_owners, np.unique(gallery_cols))
+    owners = gallery.template_owners[selected]
+    if not len(owners):
+        return 0
+    template_distances = face_distance_matrix(probes[candidate_faces], gallery.template_encodings[selected])
+    # Las plantillas están ordenadas por estudiante: mínimo por grupo contiguo
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    per_student = np.minimum.reduceat(template_distances, starts, axis=1)
+
+    face_positions = np.searchsorted(candidate_faces, face_rows)
+    student_positions = np.searchsorted(owners[starts], gallery_cols)
+    has_templates = (student_positions < len(starts)) & (owners[starts][np.minimum(student_positions, len(starts) - 1)] == gallery_cols)
+    refined = per_student[face_positions[has_templates], student_positions[has_templates]]
+    rows, cols = face_rows[has_templates], gallery_cols[has_templates]
+    distances[rows, cols] = np.minimum(distances[rows, cols], refined)
+    return int(has_templates.sum())
+
+
+def rerank_exact(distances, probes, gallery, tolerance, margin):
+    """
+    Si los centroides de la galería están cuantizados, recalcula en float32
+    las distancias que quedan a menos de `margin` de la tolerancia, donde el
+    error de cuantización podría cambiar la decisión. Ajusta en el lugar y
+    devuelve el número de pares recalculados.
+    """
+    if gallery.encodings.precision == 'float32' or not distances.size:
+        return 0
+    face_rows, gallery_cols = np.nonzero(np.abs(distances - tolerance) <= margin)
+    if not len(face_rows):
+        return 0
+
+    candidate_faces = np.unique(face_rows)
+    candidate_cols = np.unique(gallery_cols)
+    exact, found = gallery.exact_encodings(candidate_cols)
+    exact_distances = face_distance_matrix(probes[candidate_faces], exact)
+
+    face_positions = np.searchsorted(candidate_faces, face_rows)
+    col_positions = np.searchsorted(candidate_cols, gallery_cols)
+    keep = found[col_positions]
+    distances[face_rows[keep], gallery_cols[keep]] = exact_distances[face_positions[keep], col_positions[keep]]
+    return int(keep.sum())
+
+
+def match_faces(probes, gallery, tolerance, rerank_margin=DEFAULT_RERANK_MARGIN):
+    """
+    Calcula la matriz de distancias contra los centroides de una FaceGallery,
+    recalcula en float32 los pares dudosos si la galería está cuantizada,
+    revisa las plantillas de los pares en el límite y asigna los rostros.
+    """
+    probes = np.asarray(probes, dtype=np.float32)
+    distances = gallery.encodings.distances(probes)
+    rerank_exact(distances, probes, gallery, tolerance, rerank_margin)
+    refine_with_templates(distances, probes, gallery, tolerance)
+    return assign_faces(distances, gallery.student_ids, tolerance)
@@ -0,0 +1,69 @@
+# face_recognition_app/metrics.py
+"""
+Agregación de los tiempos por etapa guardados en RecognitionMetric.
+
+Para cada etapa se calculan p50/p95, un histograma con cubetas fijas (así
+los resultados de distintos despliegues o fechas se pueden comparar) y su
+fracción del tiempo total. La etapa con mayor fracción es `hot_stage`.
+`detection_skip_rate` es la fracción de frames en los que el cliente envió
+cajas o recortes válidos y no se ejecutó la detección en el servidor.
+"""
+from collections import Counter
+
+import numpy as np
+
+from .benchmarks import latency_summary
+from .timing import STAGES
+
+CLIENT_DETECTION_SOURCES = ('client_boxes', 'client_crops')
+
+# Límites superiores de las cubetas en milisegundos; la última cubeta acumula el resto
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def histogram(samples_ms, buckets=HISTOGRAM_BUCKETS_MS):
+    """Cantidad de muestras por cubeta: len(buckets) + 1 valores (el último, > buckets[-1])"""
+    positions = np.searchsorted(np.asarray(buckets, dtype=np.float64), np.asarray(samples_ms, dtype=np.float64), side='left')
+    return np.bincount(positions, minlength=len(buckets) + 1).tolist()
+
+
+def summarize_metrics(rows):
+    """
+    Resume filas (total_ms, stages, outcome, detection_source) de
+    RecognitionMetric. Las etapas que no se ejecutaron en un frame (p. ej.
+    detección en un frame duplicado) no cuentan como muestras de esa etapa.
+    """
+    totals, outcomes, detection_sources = [], Counter(), Counter()
+    stage_samples = {}
+    for total_ms, stages, outcome, detection_source in rows:
+        totals.append(total_ms)
+        outcomes[outcome] += 1
+        if detection_source:
+            detection_sources[detection_source] += 1
+        for stage, elapsed in (stages or {}).items():
+            stage_samples.setdefault(stage, []).append(elapsed)
+
+    total_time = float(np.sum(totals)) if totals else 0.0
+    order = {stage: index for index, stage in enumerate(STAGES)}
+    stages = {}
+    for stage in sorted(stage_samples, key=lambda name: (order.get(name, len(order)), name)):
+        samples = stage_samples[stage]
+        stages[stage] = {
+            **latency_summary(samples),
+            'share': round(float(np.sum(samples)) / total_time, 4) if total_time else 0.0,
+            'histogram': histogram(samples),
+        }
+    hot_stage = max(stages, key=lambda stage: stages[stage]['share']) if stages else None
+    inferred = sum(detection_sources.values())
+    skipped = sum(detection_sources[source] for source in CLIENT_DETECTION_SOURCES)
+
+    return {
+        'frames': len(totals),
+        'outcomes': dict(outcomes),
+        'detection_sources': dict(detection_sources),
+        'detection_skip_rate': round(skipped / inferred, 4) if inferred else 0.0,
+        'buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+        'total': {**latency_summary(totals), 'histogram': histogram(totals)},
+        'stages': stages,
+        'hot_stage': hot_stage,
+    }
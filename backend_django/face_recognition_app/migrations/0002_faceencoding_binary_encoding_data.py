@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:00
+
+import json
+
+from django.db import migrations, models
+
+from face_recognition_app.codec import EncodingFormatError, pack_encoding, unpack_encoding
+
+
+def json_to_binary(apps, schema_editor):
+    FaceEncoding = apps.get_model('face_recognition_app', 'FaceEncoding')
+    for face_encoding in FaceEncoding.objects.only('id', 'encoding_data').iterator():
+        try:
+            values = json.loads(face_encoding.encoding_data)
+        except (json.JSONDecodeError, TypeError):
+            values = []
+        FaceEncoding.objects.filter(pk=face_encoding.pk).update(
+            encoding_binary=pack_encoding(values)
+        )
+
+
+def binary_to_json(apps, schema_editor):
+    FaceEncoding = apps.get_model('face_recognition_app', 'FaceEncoding')
+    for face_encoding in FaceEncoding.objects.only('id', 'encoding_binary').iterator():
+        try:
+            values = unpack_encoding(face_encoding.encoding_binary).tolist()
+        except EncodingFormatError:
+            values = []
+        FaceEncoding.objects.filter(pk=face_encoding.pk).update(
+            encoding_data=json.dumps(values)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceencoding',
+            name='encoding_binary',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='faceencoding',
+            name='encoding_data',
+            field=models.TextField(blank=True, default='[]'),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='faceencoding',
+            name='encoding_data',
+        ),
+        migrations.RenameField(
+            model_name='faceencoding',
+            old_name='encoding_binary',
+            new_name='encoding_data',
+        ),
+        migrations.AlterField(
+            model_name='faceencoding',
+            name='encoding_data',
+            field=models.BinaryField(help_text='Codificación facial en formato binario versionado (ver codec.py)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0002_faceencoding_binary_encoding_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facerecognitionsettings',
+            name='max_image_dimension',
+            field=models.PositiveIntegerField(default=0, help_text='Lado máximo (px) de la copia reducida usada para detectar rostros (0 = resolución original)'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0003_facerecognitionsettings_max_image_dimension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facerecognitionsettings',
+            name='landmark_model',
+            field=models.CharField(choices=[('small', '5 puntos (rápido)'), ('large', '68 puntos (preciso)')], default='small', help_text='Modelo de puntos faciales usado para alinear el rostro antes de codificarlo', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='facerecognitionsettings',
+            name='num_jitters',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Remuestreos al calcular cada codificación (más alto = más preciso, más lento)'),
+        ),
+        migrations.AddField(
+            model_name='facerecognitionsettings',
+            name='number_of_times_to_upsample',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Veces que se amplía la imagen al detectar (más alto = detecta rostros más pequeños, más lento)'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_attendancesession_permisividad'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('face_recognition_app', '0004_recognition_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceRecognitionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('recognition', 'Reconocimiento'), ('registration', 'Registro de rostro')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En proceso'), ('completed', 'Completado'), ('failed', 'Fallido')], default='pending', max_length=20)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='face_jobs/')),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('session', models.ForeignKey(blank=True, help_text='Sesión de asistencia (solo para reconocimiento)', null=True, on_delete=django.db.models.deletion.CASCADE, to='attendance.attendancesession')),
+                ('user', models.ForeignKey(help_text='Usuario que solicitó el trabajo', on_delete=django.db.models.deletion.CASCADE, related_name='face_recognition_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Reconocimiento Facial',
+                'verbose_name_plural': 'Trabajos de Reconocimiento Facial',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
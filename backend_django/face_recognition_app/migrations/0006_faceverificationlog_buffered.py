@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('face_recognition_app', '0005_facerecognitionjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='faceverificationlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='faceverificationlog',
+            name='user',
+            field=models.ForeignKey(blank=True, help_text='Usuario reconocido (vacío si el rostro no coincidió con nadie)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='face_verification_logs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+def deactivate_duplicate_settings(apps, schema_editor):
+    # get_or_create concurrente pudo dejar varias filas activas: se conserva la última editada
+    FaceRecognitionSettings = apps.get_model('face_recognition_app', 'FaceRecognitionSettings')
+    active = FaceRecognitionSettings.objects.filter(is_active=True).order_by('-updated_at', '-pk')
+    keep = active.values_list('pk', flat=True).first()
+    if keep is not None:
+        active.exclude(pk=keep).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0006_faceverificationlog_buffered'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_duplicate_settings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='facerecognitionsettings',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='unique_active_face_recognition_settings'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_initial_templates(apps, schema_editor):
+    # La codificación actual de cada usuario pasa a ser su primera plantilla
+    FaceEncoding = apps.get_model('face_recognition_app', 'FaceEncoding')
+    FaceTemplate = apps.get_model('face_recognition_app', 'FaceTemplate')
+    FaceTemplate.objects.bulk_create(
+        FaceTemplate(
+            face_encoding_id=face_encoding.pk,
+            encoding_data=face_encoding.encoding_data,
+            image=face_encoding.profile_image.name or None,
+        )
+        for face_encoding in FaceEncoding.objects.only('id', 'encoding_data', 'profile_image').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0007_single_active_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceencoding',
+            name='spread',
+            field=models.FloatField(default=0.0, help_text='Distancia máxima entre el centroide y cualquiera de las plantillas'),
+        ),
+        migrations.AddField(
+            model_name='faceencoding',
+            name='template_count',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Número de plantillas (FaceTemplate) promediadas en encoding_data'),
+        ),
+        migrations.CreateModel(
+            name='FaceTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encoding_data', models.BinaryField(help_text='Codificación facial en formato binario versionado (ver codec.py)')),
+                ('image', models.ImageField(blank=True, help_text='Imagen utilizada para generar esta plantilla', null=True, upload_to='face_templates/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('face_encoding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='templates', to='face_recognition_app.faceencoding')),
+            ],
+            options={
+                'verbose_name': 'Plantilla Facial',
+                'verbose_name_plural': 'Plantillas Faciales',
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.RunPython(create_initial_templates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_attendancesession_permisividad'),
+        ('face_recognition_app', '0008_face_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecognitionMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome', models.CharField(choices=[('checked_in', 'Asistencia registrada'), ('no_check_in', 'Sin asistencias nuevas'), ('no_face', 'No se detectó rostro'), ('no_gallery', 'Sin rostros registrados'), ('duplicate', 'Frame duplicado'), ('error', 'Error del sistema')], max_length=20)),
+                ('total_ms', models.FloatField(help_text='Duración total del reconocimiento del frame (ms)')),
+                ('stages', models.JSONField(default=dict, help_text='Milisegundos por etapa, p. ej. {"detection": 412.3}')),
+                ('faces', models.PositiveSmallIntegerField(default=0, help_text='Rostros detectados en el frame')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recognition_metrics', to='attendance.attendancesession')),
+            ],
+            options={
+                'verbose_name': 'Métrica de Reconocimiento',
+                'verbose_name_plural': 'Métricas de Reconocimiento',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
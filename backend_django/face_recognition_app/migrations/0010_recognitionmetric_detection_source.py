@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0009_recognitionmetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recognitionmetric',
+            name='detection_source',
+            field=models.CharField(blank=True, choices=[('server', 'Detección en el servidor'), ('client_boxes', 'Cajas enviadas por el cliente'), ('client_crops', 'Recortes enviados por el cliente'), ('client_fallback', 'Datos del cliente descartados, detección en el servidor')], help_text='Origen de las cajas de rostros (vacío si el frame no llegó a la inferencia)', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0010_recognitionmetric_detection_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facerecognitionsettings',
+            name='decode_max_dimension',
+            field=models.PositiveIntegerField(default=1920, help_text='Lado máximo (px) al decodificar las imágenes recibidas; los JPEG más grandes se decodifican a escala reducida (0 = resolución original)'),
+        ),
+    ]
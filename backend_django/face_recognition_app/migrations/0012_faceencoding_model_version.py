@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0011_facerecognitionsettings_decode_max_dimension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceencoding',
+            name='model_version',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Versión del proceso que generó las codificaciones (ver RecognitionProfile.model_version); vacío = desconocida', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition_app', '0012_faceencoding_model_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recognitionmetric',
+            name='outcome',
+            field=models.CharField(choices=[('checked_in', 'Asistencia registrada'), ('no_check_in', 'Sin asistencias nuevas'), ('no_face', 'No se detectó rostro'), ('no_gallery', 'Sin rostros registrados'), ('duplicate', 'Frame duplicado'), ('rejected', 'Rechazado por saturación'), ('error', 'Error del sistema')], max_length=20),
+        ),
+    ]
@@ -1,24 +1,58 @@
 # face_recognition_app/models.py
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.conf import settings
-import json
+import numpy as np
+import uuid
+
+from .codec import EncodingFormatError, pack_encoding, stack_encodings, unpack_encoding
+from .profiles import RecognitionProfile
+from .settings_cache import SettingsCache
 
 User = settings.AUTH_USER_MODEL
 
+class EncodingMatrixQuerySet(models.QuerySet):
+    # Campo con el ID de usuario dueño de cada codificación
+    owner_field = 'user_id'
+
+    def encoding_matrix(self, dtype=np.float32):
+        """
+        Devuelve (user_ids, matriz) para las codificaciones del queryset, sin
+        instanciar modelos: un arreglo de IDs de usuario y una matriz (N, D)
+        contigua alineada con ellos. Las filas con formato inválido se omiten.
+        """
+        user_ids = []
+        vectors = []
+        for user_id, encoding_data in self.values_list(self.owner_field, 'encoding_data'):
+            try:
+                vector = unpack_encoding(encoding_data)
+            except EncodingFormatError:
+                continue
+            if vector.size:
+                user_ids.append(user_id)
+                vectors.append(vector)
+        return np.array(user_ids, dtype=np.int64), stack_encodings(vectors, dtype=dtype)
+
+class FaceEncodingQuerySet(EncodingMatrixQuerySet):
+    pass
+
+class FaceTemplateQuerySet(EncodingMatrixQuerySet):
+    owner_field = 'face_encoding__user_id'
+
 class FaceEncoding(models.Model):
     """
     Modelo para almacenar las codificaciones faciales de los usuarios.
     Separado del modelo User para mayor flexibilidad y posibles futuras extensiones.
+    encoding_data es el centroide de las plantillas del usuario (FaceTemplate).
     """
     user = models.OneToOneField(
         User, 
         on_delete=models.CASCADE, 
         related_name='face_encoding_data'
     )
-    encoding_data = models.TextField(
-        help_text="Codificación facial almacenada como JSON string"
+    encoding_data = models.BinaryField(
+        help_text="Codificación facial en formato binario versionado (ver codec.py)"
     )
     profile_image = models.ImageField(
         upload_to='face_profiles/',
@@ -32,6 +66,23 @@ class FaceEncoding(models.Model):
         default=True,
         help_text="Indica si esta codificación facial está activa"
     )
+    template_count = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Número de plantillas (FaceTemplate) promediadas en encoding_data"
+    )
+    spread = models.FloatField(
+        default=0.0,
+        help_text="Distancia máxima entre el centroide y cualquiera de las plantillas"
+    )
+    model_version = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        db_index=True,
+        help_text="Versión del proceso que generó las codificaciones (ver RecognitionProfile.model_version); vacío = desconocida"
+    )
+
+    objects = FaceEncodingQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Codificación Facial"
@@ -41,18 +92,63 @@ class FaceEncoding(models.Model):
         return f"Face encoding for {self.user.username}"
     
     def get_encoding_array(self):
-        """Convierte el JSON string de vuelta a lista de Python"""
+        """Devuelve la codificación como ndarray de solo lectura (sin copia)"""
         try:
-            return json.loads(self.encoding_data)
-        except (json.JSONDecodeError, TypeError):
+            encoding = unpack_encoding(self.encoding_data)
+        except EncodingFormatError:
             return None
+        return encoding if encoding.size else None
     
-    def set_encoding_array(self, encoding_array):
-        """Convierte la lista de encoding a JSON string"""
+    def set_encoding_array(self, encoding_array, dtype=np.float32):
+        """Guarda la codificación (lista o ndarray) en formato binario"""
         try:
-            self.encoding_data = json.dumps(encoding_array.tolist() if hasattr(encoding_array, 'tolist') else encoding_array)
-        except (TypeError, AttributeError):
-            self.encoding_data = json.dumps([])
+            self.encoding_data = pack_encoding(encoding_array, dtype=dtype)
+        except (TypeError, ValueError):
+            self.encoding_data = pack_encoding([], dtype=dtype)
+
+    def refresh_centroid(self):
+        """
+        Recalcula encoding_data como el centroide de las plantillas, junto con
+        template_count y spread. No guarda el objeto.
+        """
+        _, templates = FaceTemplate.objects.filter(face_encoding=self).encoding_matrix()
+        if not len(templates):
+            return
+        centroid = templates.mean(axis=0)
+        self.set_encoding_array(centroid)
+        self.template_count = len(templates)
+        self.spread = float(np.linalg.norm(templates - centroid, axis=1).max())
+
+class FaceTemplate(models.Model):
+    """
+    Una de las codificaciones registradas por un usuario (hasta
+    FACE_MAX_TEMPLATES). FaceEncoding guarda su centroide para comparar.
+    """
+    face_encoding = models.ForeignKey(
+        FaceEncoding,
+        on_delete=models.CASCADE,
+        related_name='templates'
+    )
+    encoding_data = models.BinaryField(
+        help_text="Codificación facial en formato binario versionado (ver codec.py)"
+    )
+    image = models.ImageField(
+        upload_to='face_templates/',
+        null=True,
+        blank=True,
+        help_text="Imagen utilizada para generar esta plantilla"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = FaceTemplateQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Plantilla Facial"
+        verbose_name_plural = "Plantillas Faciales"
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"Face template {self.pk} for encoding {self.face_encoding_id}"
 
 class FaceVerificationLog(models.Model):
     """
@@ -70,7 +166,10 @@ class FaceVerificationLog(models.Model):
     user = models.ForeignKey(
         User, 
         on_delete=models.CASCADE, 
-        related_name='face_verification_logs'
+        null=True,
+        blank=True,
+        related_name='face_verification_logs',
+        help_text="Usuario reconocido (vacío si el rostro no coincidió con nadie)"
     )
     session = models.ForeignKey(
         'attendance.AttendanceSession',
@@ -104,7 +203,7 @@ class FaceVerificationLog(models.Model):
         blank=True,
         help_text="Mensaje de error si la verificación falló"
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)  # Lo fija el writer al encolar
     
     class Meta:
         verbose_name = "Log de Verificación Facial"
@@ -112,7 +211,57 @@ class FaceVerificationLog(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.user.username} - {self.status} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+        username = self.user.username if self.user_id else '-'
+        return f"{username} - {self.status} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+class RecognitionMetric(models.Model):
+    """
+    Tiempos por etapa del reconocimiento de un frame (ver timing.py).
+    Se escriben con el buffer de log_buffer.py y se agregan en el
+    endpoint de métricas (ver metrics.py).
+    """
+    OUTCOME_CHOICES = [
+        ('checked_in', 'Asistencia registrada'),
+        ('no_check_in', 'Sin asistencias nuevas'),
+        ('no_face', 'No se detectó rostro'),
+        ('no_gallery', 'Sin rostros registrados'),
+        ('duplicate', 'Frame duplicado'),
+        ('rejected', 'Rechazado por saturación'),
+        ('error', 'Error del sistema'),
+    ]
+    DETECTION_SOURCE_CHOICES = [
+        ('server', 'Detección en el servidor'),
+        ('client_boxes', 'Cajas enviadas por el cliente'),
+        ('client_crops', 'Recortes enviados por el cliente'),
+        ('client_fallback', 'Datos del cliente descartados, detección en el servidor'),
+    ]
+
+    session = models.ForeignKey(
+        'attendance.AttendanceSession',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='recognition_metrics',
+    )
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    total_ms = models.FloatField(help_text="Duración total del reconocimiento del frame (ms)")
+    stages = models.JSONField(default=dict, help_text="Milisegundos por etapa, p. ej. {\"detection\": 412.3}")
+    faces = models.PositiveSmallIntegerField(default=0, help_text="Rostros detectados en el frame")
+    detection_source = models.CharField(
+        max_length=20,
+        choices=DETECTION_SOURCE_CHOICES,
+        blank=True,
+        help_text="Origen de las cajas de rostros (vacío si el frame no llegó a la inferencia)"
+    )
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)  # Lo fija el writer al encolar
+
+    class Meta:
+        verbose_name = "Métrica de Reconocimiento"
+        verbose_name_plural = "Métricas de Reconocimiento"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.outcome} - {self.total_ms:.0f} ms - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
 class FaceRecognitionSettings(models.Model):
     """
@@ -135,6 +284,31 @@ class FaceRecognitionSettings(models.Model):
         ],
         help_text="Modelo a usar para detección facial"
     )
+    number_of_times_to_upsample = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Veces que se amplía la imagen al detectar (más alto = detecta rostros más pequeños, más lento)"
+    )
+    num_jitters = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Remuestreos al calcular cada codificación (más alto = más preciso, más lento)"
+    )
+    landmark_model = models.CharField(
+        max_length=10,
+        default='small',
+        choices=[
+            ('small', '5 puntos (rápido)'),
+            ('large', '68 puntos (preciso)'),
+        ],
+        help_text="Modelo de puntos faciales usado para alinear el rostro antes de codificarlo"
+    )
+    max_image_dimension = models.PositiveIntegerField(
+        default=0,
+        help_text="Lado máximo (px) de la copia reducida usada para detectar rostros (0 = resolución original)"
+    )
+    decode_max_dimension = models.PositiveIntegerField(
+        default=1920,
+        help_text="Lado máximo (px) al decodificar las imágenes recibidas; los JPEG más grandes se decodifican a escala reducida (0 = resolución original)"
+    )
     enable_logging = models.BooleanField(
         default=True,
         help_text="Habilitar logging de verificaciones faciales"
@@ -149,20 +323,104 @@ class FaceRecognitionSettings(models.Model):
     class Meta:
         verbose_name = "Configuración de Reconocimiento Facial"
         verbose_name_plural = "Configuraciones de Reconocimiento Facial"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='unique_active_face_recognition_settings',
+            ),
+        ]
     
     def __str__(self):
         return f"Face Recognition Settings - Active: {self.is_active}"
     
+    def get_profile(self):
+        """Perfil de reconocimiento (detección y codificación) definido por esta configuración"""
+        return RecognitionProfile(
+            detection_model=self.face_detection_model,
+            number_of_times_to_upsample=self.number_of_times_to_upsample,
+            num_jitters=self.num_jitters,
+            landmark_model=self.landmark_model,
+            max_image_dimension=self.max_image_dimension,
+            decode_max_dimension=self.decode_max_dimension,
+        )
+
     @classmethod
     def get_settings(cls):
-        """Obtiene la configuración actual o crea una por defecto"""
-        settings, created = cls.objects.get_or_create(
-            is_active=True,
-            defaults={
-                'confidence_threshold': 0.4,
-                'max_verification_attempts': 3,
-                'face_detection_model': 'hog',
-                'enable_logging': True,
-            }
-        )
-        return settings
\ No newline at end of file
+        """
+        Lee de la base de datos la configuración activa o crea una por defecto.
+        La restricción unique_active_face_recognition_settings impide que dos
+        workers creen filas activas a la vez: el que pierde lee la del otro.
+        """
+        settings = cls.objects.filter(is_active=True).first()
+        if settings is not None:
+            return settings
+        try:
+            with transaction.atomic():
+                return cls.objects.create(is_active=True)
+        except IntegrityError:
+            return cls.objects.get(is_active=True)
+
+    @classmethod
+    def current(cls):
+        """
+        Configuración activa desde la caché del proceso (ver settings_cache.py).
+        Es la que debe usarse en el camino de reconocimiento; el objeto devuelto
+        es compartido y no debe modificarse. Los cambios deben guardarse con
+        save(): QuerySet.update() no dispara la invalidación.
+        """
+        return active_settings.get()
+
+active_settings = SettingsCache(
+    loader=FaceRecognitionSettings.get_settings,
+    ttl=settings.FACE_SETTINGS_CACHE_TTL,
+    version_key='face_recognition_app:settings_version',
+)
+
+class FaceRecognitionJob(models.Model):
+    """
+    Trabajo asíncrono de reconocimiento o registro facial.
+    La imagen y el resultado se guardan en la base de datos para que el
+    cliente consulte el estado sin depender del backend de Celery.
+    """
+    KIND_CHOICES = [
+        ('recognition', 'Reconocimiento'),
+        ('registration', 'Registro de rostro'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'En proceso'),
+        ('completed', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='face_recognition_jobs',
+        help_text="Usuario que solicitó el trabajo"
+    )
+    session = models.ForeignKey(
+        'attendance.AttendanceSession',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        help_text="Sesión de asistencia (solo para reconocimiento)"
+    )
+    image = models.ImageField(upload_to='face_jobs/', null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Trabajo de Reconocimiento Facial"
+        verbose_name_plural = "Trabajos de Reconocimiento Facial"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} - {self.status} - {self.id}"
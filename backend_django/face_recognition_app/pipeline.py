@@ -0,0 +1,160 @@
+# face_recognition_app/pipeline.py
+"""
+Etapas de detección y codificación facial.
+
+Este módulo no depende de los modelos de Django para que pueda ejecutarse
+en los procesos del pool de inferencia (ver inference.py).
+"""
+import time
+
+import face_recognition
+import numpy as np
+
+from .preprocessing import decode_image, downscale_for_detection, scale_locations
+from .tracking import associate
+
+
+def detect_and_encode(image, profile, skip_boxes=(), timings=None, known_locations=None):
+    """
+    Detecta los rostros sobre una copia reducida de la imagen (según
+    profile.max_image_dimension) y calcula sus codificaciones sobre la
+    imagen original, con los parámetros del perfil de reconocimiento.
+    Con `known_locations` (cajas ya validadas, p. ej. enviadas por el
+    cliente) no se detecta y se codifican esas cajas.
+    Los rostros asociados a alguna de `skip_boxes` (pistas ya identificadas,
+    ver tracking.py) no se codifican y su codificación es None.
+    Si se pasa el dict `timings`, se agregan los milisegundos de
+    'detection' (si se detectó) y 'encoding'.
+    Devuelve (ubicaciones, codificaciones).
+    """
+    started = time.perf_counter()
+    if known_locations is None:
+        detection_image, scale = downscale_for_detection(image, profile.max_image_dimension)
+        locations = face_recognition.face_locations(
+            detection_image,
+            number_of_times_to_upsample=profile.number_of_times_to_upsample,
+            model=profile.detection_model,
+        )
+        locations = scale_locations(locations, scale, image.shape)
+    else:
+        locations = list(known_locations)
+    skipped = associate(locations, skip_boxes) if skip_boxes else {}
+    pending = [location for index, location in enumerate(locations) if index not in skipped]
+    detected = time.perf_counter()
+    encoded = iter(face_recognition.face_encodings(
+        image,
+        pending,
+        num_jitters=profile.num_jitters,
+        model=profile.landmark_model,
+    ) if pending else ())
+    encodings = [None if index in skipped else next(encoded) for index in range(len(locations))]
+    if timings is not None:
+        if known_locations is None:
+            timings['detection'] = (detected - started) * 1000
+        timings['encoding'] = (time.perf_counter() - detected) * 1000
+    return locations, encodings
+
+
+def _detect_and_encode_decoded(image, scale, original_shape, profile, skip_boxes, timings, known_locations):
+    """
+    detect_and_encode sobre una imagen decodificada a escala reducida: las
+    cajas de entrada y de salida están en coordenadas de la imagen original.
+    """
+    if scale != 1.0:
+        skip_boxes = scale_locations(skip_boxes, 1 / scale, image.shape)
+        if known_locations is not None:
+            known_locations = scale_locations(known_locations, 1 / scale, image.shape)
+    locations, encodings = detect_and_encode(image, profile, skip_boxes, timings, known_locations)
+    return scale_locations(locations, scale, original_shape), encodings
+
+
+def encode_image_bytes(image_bytes, profile, skip_boxes=(), known_locations=None):
+    """
+    Decodifica una imagen en bytes (a lo sumo profile.decode_max_dimension,
+    ver preprocessing.decode_image) y ejecuta detect_and_encode sobre ella.
+    Las ubicaciones están en coordenadas de la imagen original.
+    """
+    image, scale, original_shape = decode_image(image_bytes, profile.decode_max_dimension)
+    return _detect_and_encode_decoded(image, scale, original_shape, profile, skip_boxes, None, known_locations)
+
+
+def encode_image_bytes_timed(image_bytes, profile, skip_boxes=(), known_locations=None):
+    """
+    Igual que encode_image_bytes, pero devuelve también los milisegundos de
+    'decode', 'detection' y 'encoding' (se mide en el proceso que ejecuta
+    la inferencia, que puede ser uno del pool).
+    Devuelve (ubicaciones, codificaciones, tiempos).
+    """
+    started = time.perf_counter()
+    image, scale, original_shape = decode_image(image_bytes, profile.decode_max_dimension)
+    timings = {'decode': (time.perf_counter() - started) * 1000}
+    locations, encodings = _detect_and_encode_decoded(
+        image, scale, original_shape, profile, skip_boxes, timings, known_locations
+    )
+    return locations, encodings, timings
+
+
+def encode_face_crops_timed(crops, profile):
+    """
+    Codifica recortes (bytes) que contienen un solo rostro cada uno; la caja
+    es el recorte completo, así no se ejecuta la detección.
+    Devuelve (codificaciones, tiempos de 'decode' y 'encoding').
+    """
+    timings = {'decode': 0.0, 'encoding': 0.0}
+    encodings = []
+    for crop_bytes in crops:
+        started = time.perf_counter()
+        image, _, _ = decode_image(crop_bytes, profile.decode_max_dimension)
+        decoded = time.perf_counter()
+        height, width = image.shape[:2]
+        encodings.extend(face_recognition.face_encodings(
+            image,
+            [(0, width, height, 0)],
+            num_jitters=profile.num_jitters,
+            model=profile.landmark_model,
+        ))
+        timings['decode'] += (decoded - started) * 1000
+        timings['encoding'] += (time.perf_counter() - decoded) * 1000
+    return encodings, timings
+
+
+def encode_enrollment_bytes(image_bytes, profile):
+    """
+    Codifica una foto de registro, en la que se espera un solo rostro.
+    Devuelve (rostros detectados, codificación float32 o None, error): los
+    errores se devuelven en lugar de lanzarse para no interrumpir un
+    registro masivo (ver enrollment.py).
+    """
+    try:
+        _, encodings = encode_image_bytes(image_bytes, profile)
+    except Exception as e:
+        return 0, None, str(e) or e.__class__.__name__
+    encoding = np.asarray(encodings[0], dtype=np.float32) if len(encodings) == 1 else None
+    return len(encodings), encoding, None
+
+
+def warm_up(image, profile):
+    """
+    Ejecuta una inferencia completa con el perfil para que los modelos queden
+    cargados y preparados. Si la imagen no tiene rostros se codifica una caja
+    central, así también se ejercitan los modelos de puntos y de codificación.
+    Devuelve los milisegundos de detección y de codificación.
+    """
+    started = time.perf_counter()
+    locations, _ = detect_and_encode(image, profile)
+    detected = time.perf_counter()
+    if not locations:
+        height, width = image.shape[:2]
+        box = (height // 4, width * 3 // 4, height * 3 // 4, width // 4)
+        face_recognition.face_encodings(image, [box], num_jitters=profile.num_jitters, model=profile.landmark_model)
+    encoded = time.perf_counter()
+    return {
+        'detection_ms': round((detected - started) * 1000, 1),
+        'encoding_ms': round((encoded - detected) * 1000, 1),
+        'faces': len(locations),
+    }
+
+
+def warm_up_bytes(image_bytes, profile):
+    """warm_up sobre una imagen en bytes (para los procesos del pool)"""
+    return warm_up(decode_image(image_bytes, profile.decode_max_dimension)[0], profile)
@@ -0,0 +1,163 @@
+# face_recognition_app/preprocessing.py
+"""
+Preprocesamiento de imágenes antes de la detección facial.
+
+La detección HOG escala con el número de píxeles, así que se ejecuta sobre
+una copia reducida de la imagen; las cajas detectadas se llevan de vuelta a
+la imagen original para calcular las codificaciones con toda la resolución.
+
+La decodificación (decode_image) usa el modo draft de JPEG: libjpeg escala
+en el dominio DCT (1/2, 1/4, 1/8) y la imagen nunca se materializa a
+resolución completa, lo que reduce tiempo y memoria con cámaras 4K.
+
+Los clientes que ya detectan rostros (p. ej. el navegador de un kiosco)
+pueden enviar sus cajas; si son verosímiles se codifican directamente y
+se omite la detección en el servidor.
+"""
+import json
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Valores de la etiqueta EXIF Orientation que intercambian ancho y alto
+EXIF_ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Relación ancho/alto aceptada para una caja de rostro enviada por el cliente
+CLIENT_BOX_MIN_ASPECT = 0.5
+CLIENT_BOX_MAX_ASPECT = 2.0
+# Fracción mínima de la caja que debe quedar dentro de la imagen
+CLIENT_BOX_MIN_INSIDE = 0.5
+
+
+def oriented_size(image):
+    """(ancho, alto) de una imagen PIL abierta tal como se ve tras aplicar su orientación EXIF"""
+    width, height = image.size
+    if image.getexif().get(EXIF_ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def decode_image(image_bytes, max_dimension=0):
+    """
+    Decodifica una imagen a un arreglo RGB uint8 contiguo, con la orientación
+    EXIF aplicada y su lado mayor limitado a `max_dimension` (0 = sin límite).
+    En JPEG se decodifica directamente a la escala DCT más pequeña que no
+    baje de ese tamaño y luego se ajusta con un reescalado; otros formatos se
+    decodifican completos y se reducen después.
+    Devuelve (imagen, escala, (alto, ancho) original), con
+    escala = decodificada / original.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    original_width, original_height = oriented_size(image)
+    scale = 1.0
+    if max_dimension and max(image.size) > max_dimension:
+        scale = max_dimension / max(image.size)
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Solo tiene efecto en JPEG; no baja del tamaño pedido
+        image.draft('RGB', target)
+        if image.size != target:
+            image = image.resize(target, Image.BILINEAR, reducing_gap=None)
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    # np.asarray no hace una segunda copia como np.array (face_recognition.load_image_file)
+    array = np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+    if scale != 1.0:
+        scale = array.shape[1] / original_width
+    return array, scale, (original_height, original_width)
+
+
+def downscale_for_detection(image, max_dimension):
+    """
+    Reduce la imagen para que su lado mayor no supere `max_dimension`.
+    Devuelve (imagen_reducida, escala), con escala = reducida / original.
+    Si max_dimension es 0 o la imagen ya es pequeña, la devuelve sin cambios.
+    """
+    height, width = image.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return image, 1.0
+    scale = max_dimension / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    small = Image.fromarray(image).resize(size, Image.BILINEAR)
+    return np.asarray(small), scale
+
+
+def scale_locations(locations, scale, image_shape):
+    """
+    Lleva cajas (top, right, bottom, left) detectadas en la imagen reducida a
+    coordenadas de la imagen original, recortándolas a sus bordes.
+    """
+    if scale == 1.0:
+        return list(locations)
+    height, width = image_shape[:2]
+    scaled = []
+    for top, right, bottom, left in locations:
+        scaled.append((
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale))),
+        ))
+    return scaled
+
+
+def parse_face_boxes(raw):
+    """
+    Lee las cajas de rostros enviadas por el cliente: una lista (o su JSON)
+    de objetos {"x", "y", "width", "height"} o de listas
+    [top, right, bottom, left]. Devuelve una lista de cajas
+    (top, right, bottom, left) o None si no se enviaron.
+    Lanza ValueError si el formato no es válido.
+    """
+    if raw is None or raw == '':
+        return None
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise ValueError("face_boxes debe ser una lista JSON de cajas.")
+    if not isinstance(raw, list):
+        raise ValueError("face_boxes debe ser una lista JSON de cajas.")
+
+    boxes = []
+    try:
+        for box in raw:
+            if isinstance(box, dict):
+                left, top = float(box['x']), float(box['y'])
+                boxes.append((top, left + float(box['width']), top + float(box['height']), left))
+            elif isinstance(box, (list, tuple)) and len(box) == 4:
+                boxes.append(tuple(float(value) for value in box))
+            else:
+                raise ValueError
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Cada caja debe ser {x, y, width, height} o [top, right, bottom, left].")
+    return boxes
+
+
+def plausible_face_boxes(boxes, image_size, min_size, max_faces):
+    """
+    Valida las cajas del cliente contra el tamaño (ancho, alto) de la imagen
+    y las recorta a sus bordes. Devuelve las cajas en enteros, o None si
+    alguna no parece un rostro (muy pequeña, muy alargada o fuera de la
+    imagen) o si hay demasiadas; en ese caso se usa la detección normal.
+    """
+    if not boxes or len(boxes) > max_faces:
+        return None
+    width, height = image_size
+    plausible = []
+    for top, right, bottom, left in boxes:
+        box_width, box_height = right - left, bottom - top
+        if box_width <= 0 or box_height <= 0:
+            return None
+        if not CLIENT_BOX_MIN_ASPECT <= box_width / box_height <= CLIENT_BOX_MAX_ASPECT:
+            return None
+        clipped = (max(0, round(top)), min(width, round(right)), min(height, round(bottom)), max(0, round(left)))
+        clipped_width, clipped_height = clipped[1] - clipped[3], clipped[2] - clipped[0]
+        if min(clipped_width, clipped_height) < min_size:
+            return None
+        if clipped_width * clipped_height < CLIENT_BOX_MIN_INSIDE * box_width * box_height:
+            return None
+        plausible.append(clipped)
+    return plausible
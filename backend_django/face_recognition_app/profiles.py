@@ -0,0 +1,27 @@
+# face_recognition_app/profiles.py
+from typing import NamedTuple
+
+from .codec import FORMAT_VERSION
+
+
+class RecognitionProfile(NamedTuple):
+    """
+    Parámetros de detección y codificación que se aplican por igual en el
+    registro y en el reconocimiento. Es un valor inmutable y serializable.
+    """
+    detection_model: str = 'hog'
+    number_of_times_to_upsample: int = 1
+    num_jitters: int = 1
+    landmark_model: str = 'small'
+    max_image_dimension: int = 0
+    decode_max_dimension: int = 0
+
+    @property
+    def model_version(self):
+        """
+        Identifica el proceso que produce las codificaciones: modelo de puntos
+        faciales, remuestreos y formato de almacenamiento (codec.py). Si
+        cambia, las codificaciones guardadas se regeneran con
+        `manage.py reencode_faces`.
+        """
+        return f"resnet-v1:{self.landmark_model}:j{self.num_jitters}:f{FORMAT_VERSION}"
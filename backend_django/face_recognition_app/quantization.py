@@ -0,0 +1,87 @@
+# face_recognition_app/quantization.py
+"""
+Matrices de codificaciones con menor precisión para las galerías en caché.
+
+  - float32: sin pérdida (4 bytes por valor)
+  - float16: 2 bytes por valor, error de distancia del orden de 5e-4
+  - int8: 1 byte por valor, cuantización escalar simétrica por fila
+    (valor ≈ q * escala), error de distancia menor a 0.01 para distancias
+    cercanas a las tolerancias usuales (0.4-0.6); crece cerca de 0 por la raíz
+
+`manage.py benchmark_gallery_precision` mide el error y los cambios de
+decisión frente a float32.
+
+Las normas al cuadrado se calculan con los valores float32 originales, así
+solo el producto punto arrastra error de cuantización. Los pares cuya
+distancia aproximada queda cerca de la tolerancia se recalculan con los
+valores exactos (ver matching.rerank_exact).
+"""
+import numpy as np
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# Filas que se convierten a float32 a la vez al multiplicar (acota la memoria temporal)
+CHUNK_ROWS = 4096
+
+
+class QuantizedMatrix:
+    """Matriz (N, D) de codificaciones en la precisión indicada"""
+
+    __slots__ = ('precision', 'data', 'scales', 'sq_norms')
+
+    def __init__(self, matrix, precision='float32'):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Precisión no soportada: {precision}")
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.precision = precision
+        self.sq_norms = np.einsum('ij,ij->i', matrix, matrix) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+        self.scales = None
+        if precision == 'float32':
+            self.data = matrix
+        elif precision == 'float16':
+            self.data = matrix.astype(np.float16)
+        else:
+            max_abs = np.abs(matrix).max(axis=1) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+            self.scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+            self.data = np.round(matrix / self.scales[:, None]).astype(np.int8)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.sq_norms.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def rows(self, indexes):
+        """Filas reconstruidas en float32 (aproximadas si la matriz está cuantizada)"""
+        rows = self.data[indexes].astype(np.float32)
+        if self.scales is not None:
+            rows *= self.scales[indexes, None]
+        return rows
+
+    def dot(self, probes):
+        """Productos punto (F, N) entre las codificaciones detectadas y la matriz"""
+        probes = np.asarray(probes, dtype=np.float32)
+        if self.precision == 'float32':
+            return probes @ self.data.T
+        result = np.empty((len(probes), len(self.data)), dtype=np.float32)
+        for start in range(0, len(self.data), CHUNK_ROWS):
+            block = self.data[start:start + CHUNK_ROWS].astype(np.float32)
+            result[:, start:start + CHUNK_ROWS] = probes @ block.T
+        if self.scales is not None:
+            result *= self.scales[None, :]
+        return result
+
+    def distances(self, probes):
+        """Distancias euclidianas (F, N), como matching.face_distance_matrix"""
+        probes = np.asarray(probes, dtype=np.float32)
+        if not len(probes) or not len(self.data):
+            return np.empty((len(probes), len(self.data)), dtype=np.float32)
+        probe_sq_norms = np.einsum('ij,ij->i', probes, probes)
+        squared = probe_sq_norms[:, None] + self.sq_norms[None, :] - 2.0 * self.dot(probes)
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared, out=squared)
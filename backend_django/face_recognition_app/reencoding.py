@@ -0,0 +1,154 @@
+# face_recognition_app/reencoding.py
+"""
+Regeneración de las codificaciones guardadas cuando cambia el proceso que
+las produce (modelo de puntos, remuestreos o formato; ver
+RecognitionProfile.model_version).
+
+Cada FaceEncoding se recalcula a partir de las imágenes de sus plantillas
+y su centroide se recompone con las codificaciones nuevas. Si no tiene
+plantillas se usa profile_image y se crea la plantilla que falta (como en
+la migración 0008), así template_count coincide con las filas existentes.
+Si alguna imagen falta o ya no produce un único rostro, el registro
+completo se deja como estaba, para no mezclar
+versiones en un mismo centroide. `manage.py reencode_faces` recorre la
+tabla por tandas, llama a reencode_chunk con cada una y al terminar
+reconstruye el índice de duplicados (las tandas no lo actualizan).
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from attendance.models import Ficha
+from .codec import EncodingFormatError, pack_encoding, unpack_encoding
+from .gallery import gallery_cache
+from .inference import encode_enrollment_images
+from .models import FaceEncoding, FaceTemplate
+
+
+def _read_image(name):
+    with default_storage.open(name, 'rb') as image_file:
+        return image_file.read()
+
+
+def _old_centroid(encoding_data):
+    try:
+        encoding = unpack_encoding(encoding_data)
+    except EncodingFormatError:
+        return None
+    return encoding if encoding.size else None
+
+
+def reencode_chunk(rows, profile, pool=None, dry_run=False):
+    """
+    Regenera las codificaciones de `rows`: tuplas (id, user_id,
+    profile_image, encoding_data) de FaceEncoding. Las escrituras de la
+    tanda se hacen en una transacción, salvo con dry_run=True.
+    Devuelve {'updated', 'failed': {motivo: cantidad}, 'shifts'}, donde
+    shifts son las distancias entre cada centroide anterior y el nuevo.
+    """
+    rows = list(rows)
+    templates = defaultdict(list)
+    for template_id, face_encoding_id, image in FaceTemplate.objects.filter(
+        face_encoding_id__in=[row[0] for row in rows]
+    ).order_by('id').values_list('id', 'face_encoding_id', 'image'):
+        templates[face_encoding_id].append((template_id, image))
+
+    failed = defaultdict(int)
+    jobs = []  # (id de FaceEncoding, id de FaceTemplate o None, bytes de la imagen)
+    for face_encoding_id, _, profile_image, _ in rows:
+        sources = templates.get(face_encoding_id) or [(None, profile_image)]
+        if not all(image for _, image in sources):
+            failed['missing_image'] += 1
+            continue
+        try:
+            images = [(face_encoding_id, template_id, _read_image(image)) for template_id, image in sources]
+        except OSError as e:
+            print(f"Error reading images of face encoding {face_encoding_id}: {e}")
+            failed['missing_image'] += 1
+            continue
+        jobs.extend(images)
+
+    encodings, broken = defaultdict(list), set()
+    results = encode_enrollment_images([image for _, _, image in jobs], profile, pool)
+    for (face_encoding_id, template_id, _), (faces, encoding, error) in zip(jobs, results):
+        if encoding is None:
+            broken.add(face_encoding_id)
+            print(f"Could not re-encode face encoding {face_encoding_id}: {error or f'{faces} faces'}")
+        else:
+            encodings[face_encoding_id].append((template_id, encoding))
+    failed['no_single_face'] += len(broken)
+
+    updates = {}
+    shifts = []
+    for face_encoding_id, user_id, _, encoding_data in rows:
+        if face_encoding_id in broken or face_encoding_id not in encodings:
+            continue
+        matrix = np.vstack([encoding for _, encoding in encodings[face_encoding_id]])
+        centroid = matrix.mean(axis=0)
+        old = _old_centroid(encoding_data)
+        if old is not None and old.shape == centroid.shape:
+            shifts.append(float(np.linalg.norm(old - centroid)))
+        updates[face_encoding_id] = (user_id, centroid, float(np.linalg.norm(matrix - centroid, axis=1).max()))
+
+    if updates and not dry_run:
+        failed['changed_during_run'] += _write_chunk(updates, encodings, profile.model_version)
+    return {
+        'updated': len(updates) - failed['changed_during_run'],
+        'failed': {reason: count for reason, count in failed.items() if count},
+        'shifts': shifts,
+    }
+
+
+def _write_chunk(updates, encodings, model_version):
+    """
+    Guarda las plantillas y centroides nuevos con bulk_update (y crea la
+    plantilla de los registros recalculados desde profile_image). Los
+    registros cuyas plantillas cambiaron desde que se leyeron (p. ej. el
+    aprendiz registró otra foto) se omiten; devuelve cuántos fueron.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        face_encodings = list(FaceEncoding.objects.select_for_update().filter(id__in=updates).order_by('id'))
+        current = defaultdict(set)
+        for template_id, face_encoding_id in FaceTemplate.objects.filter(
+            face_encoding__in=face_encodings
+        ).values_list('id', 'face_encoding_id'):
+            current[face_encoding_id].add(template_id)
+
+        changed_encodings, changed_templates, new_templates = [], [], []
+        for face_encoding in face_encodings:
+            template_encodings = encodings[face_encoding.id]
+            expected = {template_id for template_id, _ in template_encodings if template_id is not None}
+            if current[face_encoding.id] != expected:
+                continue
+            _, centroid, spread = updates[face_encoding.id]
+            face_encoding.encoding_data = pack_encoding(centroid)
+            face_encoding.template_count = len(template_encodings)
+            face_encoding.spread = spread
+            face_encoding.model_version = model_version
+            face_encoding.updated_at = now
+            changed_encodings.append(face_encoding)
+            for template_id, encoding in template_encodings:
+                if template_id is None:
+                    # La imagen ya está en el almacenamiento: la plantilla apunta al mismo archivo
+                    new_templates.append(FaceTemplate(
+                        face_encoding=face_encoding, encoding_data=pack_encoding(encoding),
+                        image=face_encoding.profile_image.name,
+                    ))
+                else:
+                    changed_templates.append(FaceTemplate(id=template_id, encoding_data=pack_encoding(encoding)))
+
+        FaceTemplate.objects.bulk_update(changed_templates, ['encoding_data'], batch_size=500)
+        FaceTemplate.objects.bulk_create(new_templates, batch_size=500)
+        FaceEncoding.objects.bulk_update(
+            changed_encodings, ['encoding_data', 'template_count', 'spread', 'model_version', 'updated_at'], batch_size=500
+        )
+
+        # bulk_update no emite señales: las galerías se invalidan aquí
+        user_ids = [face_encoding.user_id for face_encoding in changed_encodings]
+        ficha_ids = list(Ficha.objects.filter(students__in=user_ids).values_list('id', flat=True).distinct())
+        transaction.on_commit(lambda: gallery_cache.invalidate(*ficha_ids))
+    return len(face_encodings) - len(changed_encodings)
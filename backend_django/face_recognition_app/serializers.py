@@ -1,6 +1,6 @@
 # face_recognition_app/serializers.py
 from rest_framework import serializers
-from .models import FaceEncoding
+from .models import FaceEncoding, FaceRecognitionJob, FaceTemplate
 
 class FaceEncodingSerializer(serializers.ModelSerializer):
     """
@@ -8,5 +8,25 @@ class FaceEncodingSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = FaceEncoding
-        fields = ['user', 'profile_image', 'updated_at']
-        read_only_fields = ['user', 'updated_at']
+        fields = ['user', 'profile_image', 'template_count', 'updated_at']
+        read_only_fields = ['user', 'template_count', 'updated_at']
+
+
+class FaceTemplateSerializer(serializers.ModelSerializer):
+    """
+    Serializador para las plantillas faciales de un usuario.
+    """
+    class Meta:
+        model = FaceTemplate
+        fields = ['id', 'image', 'created_at']
+        read_only_fields = fields
+
+
+class FaceRecognitionJobSerializer(serializers.ModelSerializer):
+    """
+    Serializador para consultar el estado de un trabajo asíncrono.
+    """
+    class Meta:
+        model = FaceRecognitionJob
+        fields = ['id', 'kind', 'status', 'session', 'result', 'error_message', 'created_at', 'completed_at']
+        read_only_fields = fields
@@ -1,13 +1,33 @@
 # face_recognition_app/services.py
-import face_recognition
 import numpy as np
+import os
+import zipfile
 from io import BytesIO
 from PIL import Image
+from django.conf import settings as django_settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime
 
-from attendance.models import Attendance, Ficha
-from .models import FaceEncoding, FaceVerificationLog, FaceRecognitionSettings # Added imports
+from attendance.models import Attendance, AttendanceSession, Ficha
+from .codec import pack_encoding
+from .models import FaceEncoding, FaceRecognitionSettings, FaceTemplate
+from .frame_cache import difference_hash, frame_cache
+from .gallery import get_ficha_gallery
+from .admission import recognition_admission
+from .log_buffer import recognition_metrics, verification_log
+from .matching import match_faces
+from .preprocessing import oriented_size, plausible_face_boxes
+from .timing import StageTimer
+from .tracking import TrackerRegistry
+from .inference import InferenceUnavailable, encode_face_crops, encode_image
+
+session_trackers = TrackerRegistry(
+    confirm_hits=django_settings.FACE_TRACK_CONFIRM_HITS,
+    max_age=django_settings.FACE_TRACK_MAX_AGE,
+    retry_cooldown=django_settings.FACE_TRACK_RETRY_COOLDOWN,
+)
 
 def get_face_encoding_from_image(image_file):
     """
@@ -15,146 +35,547 @@ def get_face_encoding_from_image(image_file):
     Devuelve None si no se encuentra ninguna cara o si hay más de una.
     """
     try:
-        image = face_recognition.load_image_file(image_file)
-        encodings = face_recognition.face_encodings(image)
+        settings = FaceRecognitionSettings.current()
+        _, encodings = encode_image(image_file, settings.get_profile())
         if len(encodings) == 1:
             return encodings[0]
         return None
+    except InferenceUnavailable:
+        raise
     except Exception as e:
         print(f"Error processing image for encoding: {e}")
         return None
 
-def recognize_faces_in_stream(image_file, session_id):
+def delete_images_on_commit(names):
+    """
+    Borra del almacenamiento, al confirmar la transacción, las imágenes de
+    plantillas eliminadas (QuerySet.delete() no borra los archivos). Se
+    conservan las que otra plantilla o un profile_image sigan usando.
+    """
+    names = {name for name in names if name}
+    if not names:
+        return
+
+    def delete_images():
+        in_use = set(FaceTemplate.objects.filter(image__in=names).values_list('image', flat=True))
+        in_use.update(FaceEncoding.objects.filter(profile_image__in=names).values_list('profile_image', flat=True))
+        for name in names - in_use:
+            try:
+                default_storage.delete(name)
+            except OSError as e:
+                print(f"Error deleting face template image {name}: {e}")
+
+    transaction.on_commit(delete_images)
+
+def add_face_template(user, image_file, encoding):
+    """
+    Agrega una plantilla al rostro registrado del usuario (creándolo si no
+    existe) y recalcula su centroide. Si se supera FACE_MAX_TEMPLATES se
+    descartan las plantillas más antiguas y, al confirmar, sus imágenes.
+    Devuelve (face_encoding_obj, template, created).
+    """
+    with transaction.atomic():
+        # Un centroide que mezcla plantillas de otra versión conserva la versión anterior
+        face_encoding_obj, created = FaceEncoding.objects.select_for_update().get_or_create(
+            user=user,
+            defaults={
+                'encoding_data': pack_encoding(encoding),
+                'model_version': FaceRecognitionSettings.current().get_profile().model_version,
+            },
+        )
+        template = FaceTemplate.objects.create(
+            face_encoding=face_encoding_obj,
+            image=image_file,
+            encoding_data=pack_encoding(encoding),
+        )
+        stale = FaceTemplate.objects.filter(face_encoding=face_encoding_obj).order_by('-created_at', '-id')
+        stale = list(stale.values_list('id', 'image')[django_settings.FACE_MAX_TEMPLATES:])
+        if stale:
+            FaceTemplate.objects.filter(id__in=[template_id for template_id, _ in stale]).delete()
+            delete_images_on_commit(image for _, image in stale)
+
+        # Apunta al archivo ya guardado por la plantilla (no se sube dos veces)
+        face_encoding_obj.profile_image = template.image
+        face_encoding_obj.refresh_centroid()
+        face_encoding_obj.save()
+    return face_encoding_obj, template, created
+
+def remove_face_template(template):
+    """
+    Elimina una plantilla (y, al confirmar, su imagen) y recalcula el
+    centroide del usuario.
+    Devuelve un mensaje de error si es la única plantilla, o None.
+    """
+    with transaction.atomic():
+        face_encoding_obj = FaceEncoding.objects.select_for_update().get(pk=template.face_encoding_id)
+        if face_encoding_obj.templates.count() <= 1:
+            return "No se puede eliminar la única plantilla registrada; registre otra primero."
+        image = template.image.name
+        template.delete()
+        if image and face_encoding_obj.profile_image.name == image:
+            # La imagen de perfil pasa a ser la de la plantilla más reciente
+            face_encoding_obj.profile_image = face_encoding_obj.templates.order_by('-created_at', '-id').first().image
+        face_encoding_obj.refresh_centroid()
+        face_encoding_obj.save()
+        delete_images_on_commit([image])
+    return None
+
+def save_face_encoding(user, image_file, encoding):
+    """
+    Registra un rostro del usuario como una nueva plantilla; las anteriores
+    se conservan (hasta FACE_MAX_TEMPLATES). Devuelve (face_encoding_obj, created).
+    """
+    face_encoding_obj, _, created = add_face_template(user, image_file, encoding)
+    return face_encoding_obj, created
+
+ARCHIVE_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def count_archive_frames(archive_file):
+    """Cantidad de imágenes de un archivo ZIP sin extraerlas (0 si no es un ZIP válido)"""
+    try:
+        with zipfile.ZipFile(archive_file) as archive:
+            return sum(
+                1 for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(ARCHIVE_IMAGE_EXTENSIONS)
+            )
+    except zipfile.BadZipFile:
+        return 0
+    finally:
+        archive_file.seek(0)
+
+def read_archive_frames(archive_file, max_frames):
+    """
+    Extrae en memoria las imágenes de un archivo ZIP, ordenadas por nombre.
+    Lanza ValueError si el archivo no es un ZIP válido o supera max_frames.
+    """
+    try:
+        with zipfile.ZipFile(archive_file) as archive:
+            names = sorted(
+                info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(ARCHIVE_IMAGE_EXTENSIONS)
+            )
+            if len(names) > max_frames:
+                raise ValueError(f"El archivo contiene más de {max_frames} imágenes.")
+            frames = []
+            for name in names:
+                if archive.getinfo(name).file_size > django_settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                    raise ValueError(f"La imagen {name} supera el tamaño máximo permitido.")
+                frame = BytesIO(archive.read(name))
+                frame.name = os.path.basename(name)
+                frames.append(frame)
+            return frames
+    except zipfile.BadZipFile:
+        raise ValueError("El archivo no es un ZIP válido.")
+
+def _load_session_gallery(session_id):
+    """
+    Carga las codificaciones de los estudiantes inscritos en la ficha de la sesión.
+    Solo se incluyen estudiantes que ya han registrado su rostro.
+    Lanza Ficha.DoesNotExist si la sesión no tiene una ficha asociada.
+    """
+    ficha_id = Ficha.objects.values_list('id', flat=True).get(sessions__id=session_id)
+    return get_ficha_gallery(ficha_id)
+
+def _check_in_status(session, now):
+    """'present' o 'late' según la hora de inicio y la permisividad de la sesión"""
+    session_start_datetime = datetime.combine(session.date, session.start_time, tzinfo=now.tzinfo)
+    grace_period_end = session_start_datetime + timezone.timedelta(minutes=session.permisividad)
+    return 'late' if now > grace_period_end else 'present'
+
+def check_in_students(session_id, student_ids):
+    """
+    Marca la asistencia de varios estudiantes reconocidos en pocas consultas:
+    se leen y bloquean sus registros de la sesión, el estado se calcula una
+    sola vez y un único UPDATE condicional (solo filas 'absent') lo aplica,
+    así dos frames simultáneos no sobreescriben tardanzas ni presentes.
+
+    Devuelve un dict con:
+      - checked_in: estudiantes cuyo registro cambió (id, full_name, status, attendance_id)
+      - unchanged: IDs de estudiantes que ya tenían otro estado
+      - not_enrolled: IDs de estudiantes sin registro en esta sesión
+    """
+    student_ids = set(student_ids)
+    result = {'checked_in': [], 'unchanged': [], 'not_enrolled': []}
+    if not student_ids:
+        return result
+
+    session = AttendanceSession.objects.only('date', 'start_time', 'permisividad').get(pk=session_id)
+    now = timezone.now()
+    new_status = _check_in_status(session, now)
+
+    with transaction.atomic():
+        records = list(
+            Attendance.objects.select_for_update(of=('self',))
+            .filter(session_id=session_id, student_id__in=student_ids)
+            .select_related('student')
+        )
+        absent = [record for record in records if record.status == 'absent']
+        updated = 0
+        if absent:
+            updated = Attendance.objects.filter(
+                pk__in=[record.pk for record in absent], status='absent'
+            ).update(status=new_status, check_in_time=now, verified_by_face=True)
+        if updated != len(absent):
+            # Otra escritura cambió alguna fila entre la lectura y el UPDATE: se reporta lo que quedó
+            changed = set(Attendance.objects.filter(
+                pk__in=[record.pk for record in absent], status=new_status, check_in_time=now
+            ).values_list('pk', flat=True))
+            absent = [record for record in absent if record.pk in changed]
+
+    checked_in_ids = {record.student_id for record in absent}
+    for record in absent:
+        result['checked_in'].append({
+            'id': record.student_id,
+            'full_name': record.student.get_full_name(),
+            'status': new_status,
+            'attendance_id': record.pk,
+        })
+    result['unchanged'] = sorted(record.student_id for record in records if record.student_id not in checked_in_ids)
+    result['not_enrolled'] = sorted(student_ids - {record.student_id for record in records})
+    return result
+
+def _client_face_locations(image_file, face_boxes, timer):
+    """
+    Cajas del cliente validadas contra el tamaño de la imagen (solo se lee
+    la cabecera). Devuelve None si no se enviaron o no son verosímiles:
+    en ese caso se detecta en el servidor.
+    """
+    if not face_boxes or not django_settings.FACE_CLIENT_BOXES:
+        return None
+    try:
+        image_file.seek(0)
+        image_size = oriented_size(Image.open(image_file))
+    except (OSError, ValueError):
+        return None
+    locations = plausible_face_boxes(
+        face_boxes, image_size,
+        min_size=django_settings.FACE_CLIENT_BOX_MIN_SIZE,
+        max_faces=django_settings.FACE_CLIENT_MAX_FACES,
+    )
+    timer.detection_source = 'client_boxes' if locations is not None else 'client_fallback'
+    return locations
+
+def _plausible_face_crops(face_crops):
+    """Los recortes si todos son imágenes legibles de tamaño suficiente, o None"""
+    if not face_crops or len(face_crops) > django_settings.FACE_CLIENT_MAX_FACES:
+        return None
+    for crop_file in face_crops:
+        try:
+            crop_file.seek(0)
+            width, height = Image.open(crop_file).size
+        except (OSError, ValueError):
+            return None
+        if min(width, height) < django_settings.FACE_CLIENT_BOX_MIN_SIZE:
+            return None
+    return face_crops
+
+def _match_and_check_in(encodings, session_id, gallery, settings, timer):
+    """
+    Compara las codificaciones con la galería en una sola operación, marca
+    la asistencia de los reconocidos y registra cada intento.
+    Devuelve (face_matches, check_in); ver check_in_students.
+    """
+    with timer.stage('matching'):
+        face_matches = match_faces(
+            encodings, gallery, settings.confidence_threshold,
+            rerank_margin=django_settings.FACE_GALLERY_RERANK_MARGIN,
+        ) if len(encodings) else []
+
+    # Actualizar la asistencia de todos los estudiantes reconocidos a la vez
+    matched_student_ids = {m.student_id for m in face_matches if m.student_id is not None}
+    with timer.stage('check_in'):
+        check_in = check_in_students(session_id, matched_student_ids)
+    timer.outcome = 'checked_in' if check_in['checked_in'] else 'no_check_in'
+
+    if settings.enable_logging:
+        with timer.stage('logging'):
+            for face_match in face_matches:
+                matched_student_id = face_match.student_id
+                not_enrolled = matched_student_id in check_in['not_enrolled']
+                verification_log.add(
+                    user_id=matched_student_id, # Can be None if no match
+                    session_id=session_id,
+                    status='success' if matched_student_id and not not_enrolled else 'failed',
+                    confidence_score=face_match.best_distance, # Closest distance as confidence
+                    error_message="Rostro reconocido pero no pertenece a la sesión." if not_enrolled else None,
+                    # ip_address and user_agent would need to be passed from the request, not available here
+                )
+    return face_matches, check_in
+
+def _no_face_detected(session_id, settings, timer):
+    timer.outcome = 'no_face'
+    if settings.enable_logging:
+        with timer.stage('logging'):
+            verification_log.add(
+                session_id=session_id,
+                status='no_face_detected',
+                error_message="No se detectó ningún rostro en la imagen."
+            )
+    return {"error": "No se detectó ningún rostro en la imagen."}
+
+def _recognize_frame(image_file, session_id, gallery, settings, timer, face_boxes=None):
+    """
+    Procesa una imagen contra una galería ya cargada: detecta y codifica las
+    caras, las compara con la galería y actualiza la asistencia.
+    Si el cliente envió cajas verosímiles (face_boxes) no se detecta.
+    """
+    # Los rostros de pistas confirmadas o agotadas en la sesión no se vuelven a codificar
+    tracker = session_trackers.get(session_id) if session_trackers.enabled else None
+    confirmed_tracks = tracker.confirmed_tracks(settings.max_verification_attempts) if tracker else []
+
+    # 2. Cargar la imagen del stream y encontrar todas las caras
+    known_locations = _client_face_locations(image_file, face_boxes, timer)
+    if timer.detection_source is None:
+        timer.detection_source = 'server'
+    with recognition_admission.admit(timer):
+        stream_locations, stream_encodings = encode_image(
+            image_file, settings.get_profile(), skip_boxes=[track.box for track in confirmed_tracks],
+            timer=timer, known_locations=known_locations,
+        )
+    timer.faces = len(stream_locations)
+
+    if not stream_locations:
+        return _no_face_detected(session_id, settings, timer)
+
+    tracks = tracker.update(stream_locations, confirmed_tracks) if tracker else [None] * len(stream_locations)
+    pending = [index for index, encoding in enumerate(stream_encodings) if encoding is not None]
+
+    # 3 y 4. Comparar con la galería y actualizar la asistencia
+    face_matches, check_in = _match_and_check_in(
+        [stream_encodings[index] for index in pending], session_id, gallery, settings, timer
+    )
+    for face_match in face_matches:
+        track = tracks[pending[face_match.face_index]]
+        if track is not None:
+            tracker.record_match(track, face_match.student_id)
+
+    return {
+        "recognized_students": check_in['checked_in'],
+        "already_checked_in": check_in['unchanged'],
+        "tracked_faces": len(stream_locations) - len(pending),
+    }
+
+def _recognize_crops(face_crops, session_id, gallery, settings, timer):
+    """
+    Igual que _recognize_frame para recortes de un solo rostro enviados por
+    el cliente: no hay detección ni seguimiento de pistas.
+    """
+    timer.detection_source = 'client_crops'
+    with recognition_admission.admit(timer):
+        encodings = encode_face_crops(face_crops, settings.get_profile(), timer)
+    timer.faces = len(encodings)
+    if not encodings:
+        return _no_face_detected(session_id, settings, timer)
+
+    _, check_in = _match_and_check_in(encodings, session_id, gallery, settings, timer)
+    return {
+        "recognized_students": check_in['checked_in'],
+        "already_checked_in": check_in['unchanged'],
+        "tracked_faces": 0,
+    }
+
+def _replay_cached_result(cached_result):
+    """
+    Resultado de un frame duplicado: los estudiantes registrados por el frame
+    original ya no son nuevos, así que pasan a already_checked_in.
+    """
+    if 'recognized_students' not in cached_result:
+        return dict(cached_result)
+    checked_in = {student['id'] for student in cached_result['recognized_students']}
+    return {
+        **cached_result,
+        "recognized_students": [],
+        "already_checked_in": sorted(checked_in.union(cached_result['already_checked_in'])),
+    }
+
+def _recognize_unique_frame(image_file, session_id, gallery, settings, timer, face_boxes=None):
+    """
+    Igual que _recognize_frame, pero si el frame es casi idéntico a uno
+    procesado recientemente en la misma sesión devuelve el resultado de ese
+    frame sin volver a detectar ni codificar (sin repetir sus registros de
+    asistencia). Solo se guardan los resultados sin error, para no repetir
+    un fallo puntual. Incluye la tasa de frames omitidos.
+    """
+    if not frame_cache.enabled:
+        return _recognize_frame(image_file, session_id, gallery, settings, timer, face_boxes)
+
+    with timer.stage('dedup'):
+        try:
+            image_file.seek(0)
+            frame_hash = difference_hash(image_file.read())
+        except (OSError, ValueError):
+            frame_hash = None
+        cached_result = frame_cache.lookup(session_id, frame_hash) if frame_hash is not None else None
+    if frame_hash is None:
+        # Imagen ilegible: el pipeline completo se encarga de reportar el error
+        return _recognize_frame(image_file, session_id, gallery, settings, timer, face_boxes)
+
+    if cached_result is not None:
+        timer.outcome = 'duplicate'
+        return {**_replay_cached_result(cached_result), 'duplicate_frame': True, 'frame_stats': frame_cache.stats(session_id)}
+
+    result = _recognize_frame(image_file, session_id, gallery, settings, timer, face_boxes)
+    if 'error' not in result:
+        frame_cache.store(session_id, frame_hash, result)
+    return {**result, 'frame_stats': frame_cache.stats(session_id)}
+
+def _log_recognition_error(settings, session_id, error_message):
+    if settings is not None and settings.enable_logging:
+        verification_log.add(
+            session_id=session_id,
+            status='error',
+            error_message=error_message
+        )
+
+def _record_metrics(session_id, timer, result):
+    """Guarda los tiempos por etapa del frame (ver timing.py) con el buffer de métricas"""
+    total_ms = timer.stop()
+    if not django_settings.FACE_RECOGNITION_METRICS:
+        return
+    outcome = timer.outcome
+    if outcome is None or ('error' in result and outcome not in ('no_face', 'no_gallery')):
+        outcome = 'error'
+    recognition_metrics.add(
+        session_id=session_id,
+        outcome=outcome,
+        total_ms=round(total_ms, 2),
+        stages=timer.rounded_stages(),
+        faces=timer.faces,
+        detection_source=timer.detection_source or '',
+    )
+
+def recognize_faces_in_stream(image_file, session_id, timer=None, face_boxes=None, face_crops=None):
     """
     Servicio principal para el reconocimiento facial en tiempo real.
     Recibe una imagen y el ID de una sesión de asistencia activa.
+    Opcionalmente, las cajas de rostros detectadas por el cliente
+    (face_boxes, ver preprocessing.parse_face_boxes) o recortes de un solo
+    rostro (face_crops, en ese caso la imagen puede faltar); si no son
+    verosímiles se detecta en el servidor.
+    Los tiempos por etapa quedan en `timer` (se crea uno si no se pasa)
+    y se registran en RecognitionMetric.
+    Lanza InferenceUnavailable (503) si el frame no se admite por saturación
+    (ver admission.py).
     """
-    log_entry = None # Initialize log_entry
+    # HTTP entrega el id como texto y WebSocket como entero: las cachés por
+    # sesión (frames, seguimiento) usan siempre el entero
+    session_id = int(session_id)
+    timer = timer or StageTimer()
     try:
-        settings = FaceRecognitionSettings.get_settings() # Get global settings
+        result = _recognize_stream_frame(image_file, session_id, timer, face_boxes, face_crops)
+    except InferenceUnavailable:
+        timer.outcome = 'rejected'
+        _record_metrics(session_id, timer, {})
+        raise
+    _record_metrics(session_id, timer, result)
+    return result
 
-        # 1. Cargar las codificaciones de los estudiantes inscritos en la sesión
-        ficha = Ficha.objects.get(sessions__id=session_id)
-        known_encodings = []
-        known_student_ids = []
+def _recognize_stream_frame(image_file, session_id, timer, face_boxes, face_crops):
+    settings = None
+    try:
+        with timer.stage('settings'):
+            settings = FaceRecognitionSettings.current()
 
-        students = ficha.students.all()
-        for student in students:
-            try:
-                # Solo incluir estudiantes que ya han registrado su rostro
-                face_encoding_data = student.face_encoding_data
-                encoding_array = face_encoding_data.get_encoding_array()
-                if encoding_array is not None:
-                    known_encodings.append(encoding_array)
-                    known_student_ids.append(student.id)
-            except FaceEncoding.DoesNotExist:
-                continue
+        # 1. Cargar las codificaciones de los estudiantes inscritos en la sesión
+        with timer.stage('gallery'):
+            gallery = _load_session_gallery(session_id)
         
-        if not known_encodings:
+        if not len(gallery):
+            timer.outcome = 'no_gallery'
             if settings.enable_logging:
-                FaceVerificationLog.objects.create(
+                verification_log.add(
                     session_id=session_id,
                     status='no_registered_face',
                     error_message="No hay rostros registrados para esta ficha."
                 )
             return {"error": "No hay rostros registrados para esta ficha."}
 
-        # 2. Cargar la imagen del stream y encontrar todas las caras
-        stream_image = face_recognition.load_image_file(image_file)
-        stream_locations = face_recognition.face_locations(stream_image)
-        stream_encodings = face_recognition.face_encodings(stream_image, stream_locations)
+        if face_crops:
+            if _plausible_face_crops(face_crops) is not None:
+                return _recognize_crops(face_crops, session_id, gallery, settings, timer)
+            timer.detection_source = 'client_fallback'
+            if image_file is None:
+                return {"error": "Los recortes de rostros no son imágenes válidas o son demasiado pequeños."}
 
-        if not stream_encodings:
-            if settings.enable_logging:
-                FaceVerificationLog.objects.create(
-                    session_id=session_id,
-                    status='no_face_detected',
-                    error_message="No se detectó ningún rostro en la imagen."
-                )
-            return {"error": "No se detectó ningún rostro en la imagen."}
-
-        recognized_students = []
-
-        # 3. Comparar cada cara encontrada con las caras conocidas
-        for stream_encoding in stream_encodings:
-            matches = face_recognition.compare_faces(known_encodings, stream_encoding, tolerance=settings.confidence_threshold) # Use confidence_threshold
-            
-            matched_student_id = None
-            if True in matches:
-                first_match_index = matches.index(True)
-                matched_student_id = known_student_ids[first_match_index]
-
-            # Log the attempt for each detected face
-            log_status = 'failed'
-            log_student = None
-            if matched_student_id:
-                log_status = 'success'
-                log_student = students.get(id=matched_student_id) # Get the actual student object
-
-            if settings.enable_logging:
-                log_entry = FaceVerificationLog.objects.create(
-                    user=log_student, # Can be None if no match
-                    session_id=session_id,
-                    status=log_status,
-                    confidence_score=np.min(face_recognition.face_distance(known_encodings, stream_encoding)) if known_encodings else None, # Closest distance as confidence
-                    # ip_address and user_agent would need to be passed from the request, not available here
-                )
-
-            if matched_student_id:
-                # 4. Actualizar el registro de asistencia
-                try:
-                    attendance_record = Attendance.objects.get(session_id=session_id, student_id=matched_student_id)
-                    
-                    # Solo actualizar si el estado es 'ausente' para no sobreescribir tardanzas o presentes
-                    if attendance_record.status == 'absent':
-                        session = attendance_record.session
-                        now = timezone.now()
-                        
-                        # Calcular si es tardanza
-                        session_start_datetime = datetime.combine(session.date, session.start_time, tzinfo=now.tzinfo)
-                        grace_period_end = session_start_datetime + timezone.timedelta(minutes=session.permisividad)
-                        
-                        new_status = 'present'
-                        if now > grace_period_end:
-                            new_status = 'late'
-                        
-                        attendance_record.status = new_status
-                        attendance_record.check_in_time = now
-                        attendance_record.verified_by_face = True
-                        attendance_record.save()
-                        
-                        recognized_students.append({
-                            'id': attendance_record.student.id,
-                            'full_name': attendance_record.student.get_full_name(),
-                            'status': new_status
-                        })
-
-                except Attendance.DoesNotExist:
-                    # This case means a recognized face is not part of this session's attendance records
-                    # Log this as a failed attempt for the recognized user if logging is enabled
-                    if settings.enable_logging and log_entry:
-                        log_entry.status = 'failed'
-                        log_entry.error_message = "Rostro reconocido pero no pertenece a la sesión."
-                        log_entry.save()
-                    continue 
-
-        return {"recognized_students": recognized_students}
+        return _recognize_unique_frame(image_file, session_id, gallery, settings, timer, face_boxes)
 
+    except InferenceUnavailable:
+        # El pool de inferencia está saturado: la vista responde 503
+        raise
     except Ficha.DoesNotExist:
-        if settings.enable_logging:
-            FaceVerificationLog.objects.create(
-                session_id=session_id,
-                status='error',
-                error_message="La ficha de la sesión no existe."
-            )
+        _log_recognition_error(settings, session_id, "La ficha de la sesión no existe.")
         return {"error": "La sesión de asistencia no existe o no tiene una ficha asociada."}
     except Exception as e:
         error_msg = f"Ocurrió un error durante el reconocimiento: {e}"
         print(f"Error during face recognition: {e}")
+        _log_recognition_error(settings, session_id, error_msg)
+        return {"error": error_msg}
+
+def recognize_faces_in_batch(image_files, session_id):
+    """
+    Procesa varias imágenes de una misma sesión en una sola pasada: la
+    configuración y la galería se cargan una vez y se comparten entre frames.
+    Devuelve el resultado de cada frame y la lista combinada de estudiantes
+    cuya asistencia se registró. Si la inferencia deja de estar disponible
+    a mitad del lote se devuelve lo procesado (las asistencias ya quedaron
+    registradas) con busy, retry_after y los frames pendientes; si falla
+    en el primer frame se propaga InferenceUnavailable (503).
+    """
+    session_id = int(session_id)
+    settings = None
+    try:
+        settings = FaceRecognitionSettings.current()
+        gallery = _load_session_gallery(session_id)
+    except Ficha.DoesNotExist:
+        _log_recognition_error(settings, session_id, "La ficha de la sesión no existe.")
+        return {"error": "La sesión de asistencia no existe o no tiene una ficha asociada."}
+
+    if not len(gallery):
         if settings.enable_logging:
-            FaceVerificationLog.objects.create(
+            verification_log.add(
                 session_id=session_id,
-                status='error',
-                error_message=error_msg
+                status='no_registered_face',
+                error_message="No hay rostros registrados para esta ficha."
             )
-        return {"error": error_msg}
+        return {"error": "No hay rostros registrados para esta ficha."}
+
+    frames = []
+    recognized_students = {}
+    unavailable = None
+    for index, image_file in enumerate(image_files):
+        # La configuración y la galería se cargan una vez; no entran en los tiempos por frame
+        timer = StageTimer()
+        try:
+            result = _recognize_unique_frame(image_file, session_id, gallery, settings, timer)
+        except InferenceUnavailable as e:
+            timer.outcome = 'rejected'
+            _record_metrics(session_id, timer, {})
+            if not frames:
+                raise
+            unavailable = e
+            break
+        except Exception as e:
+            error_msg = f"Ocurrió un error durante el reconocimiento: {e}"
+            print(f"Error during face recognition: {e}")
+            _log_recognition_error(settings, session_id, error_msg)
+            result = {"error": error_msg}
+        _record_metrics(session_id, timer, result)
+
+        frames.append({'frame': index, 'name': getattr(image_file, 'name', None), **result})
+        for student in result.get('recognized_students', []):
+            recognized_students.setdefault(student['id'], student)
+
+    response = {
+        "frames": frames,
+        "recognized_students": list(recognized_students.values()),
+    }
+    if unavailable is not None:
+        response.update({
+            "busy": True,
+            "retry_after": unavailable.wait,
+            "pending_frames": [
+                {'frame': index, 'name': getattr(image_file, 'name', None)}
+                for index, image_file in enumerate(image_files) if index >= len(frames)
+            ],
+        })
+    return response
@@ -0,0 +1,95 @@
+# face_recognition_app/settings_cache.py
+"""
+Caché en proceso de la configuración activa de reconocimiento facial.
+
+Cada proceso guarda el objeto cargado y, como mucho una vez cada `ttl`
+segundos, compara su versión con un contador en la caché compartida de
+Django (Redis en producción). Guardar o borrar la configuración incrementa
+ese contador, así todos los workers recargan la fila en su siguiente
+comprobación. Mientras la versión no cambie no se consulta la base de datos.
+
+Sin REDIS_URL la caché por defecto es memoria local de cada proceso y el
+contador no llega a los demás workers: en ese caso se recarga la fila cada
+`ttl` segundos. Solo save() y delete() avisan del cambio; un
+QuerySet.update() sobre FaceRecognitionSettings no invalida nada y los
+workers siguen con la versión anterior hasta la siguiente invalidación.
+"""
+import threading
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def cache_is_shared():
+    """Indica si la caché por defecto la ven todos los procesos (no es memoria local)"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def read_version(*keys):
+    """
+    Tupla con las versiones compartidas guardadas en `keys`, o None si la
+    caché no es compartida o no responde (quien la use debe recargar por
+    tiempo).
+    """
+    if not cache_is_shared():
+        return None
+    try:
+        versions = cache.get_many(keys)
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            # Un valor nuevo (no 1) evita confundirlo con una versión anterior
+            # a que la clave se perdiera; add() no pisa el de otro proceso
+            for key in missing:
+                cache.add(key, time.time_ns(), timeout=None)
+            versions.update(cache.get_many(missing))
+        return tuple(versions.get(key) for key in keys)
+    except Exception as e:
+        print(f"Error reading versions {keys} from cache: {e}")
+        return None
+
+
+def bump_version(key):
+    """Cambia la versión compartida en `key` para que los demás procesos recarguen"""
+    if not cache_is_shared():
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # La clave se perdió o nunca existió
+        cache.set(key, time.time_ns(), timeout=None)
+    except Exception as e:
+        print(f"Error invalidating version {key} in cache: {e}")
+
+
+class SettingsCache:
+    def __init__(self, loader, ttl, version_key):
+        self.loader = loader
+        self.ttl = ttl
+        self.version_key = version_key
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
+        # Reentrante: el loader puede crear la fila y su señal llama a invalidate()
+        self._lock = threading.RLock()
+
+    def get(self):
+        """Devuelve la configuración activa; no debe modificarse (se comparte entre hilos)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._value is not None and now - self._checked_at < self.ttl:
+                return self._value
+            # Sin versión compartida (None) se recarga en cada TTL
+            version = read_version(self.version_key)
+            if self._value is None or version is None or version != self._version:
+                self._value = self.loader()
+                self._version = version
+            self._checked_at = now
+            return self._value
+
+    def invalidate(self):
+        """Descarta la copia local y obliga a los demás procesos a recargar"""
+        with self._lock:
+            self._value = None
+        bump_version(self.version_key)
@@ -0,0 +1,41 @@
+# face_recognition_app/signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from attendance.models import Ficha
+from .face_index import face_index
+from .gallery import gallery_cache, invalidate_user_galleries
+from .models import FaceEncoding, FaceRecognitionSettings, active_settings
+
+
+@receiver([post_save, post_delete], sender=FaceEncoding)
+def invalidate_galleries_on_encoding_change(sender, instance, **kwargs):
+    invalidate_user_galleries(instance.user_id)
+
+
+# El índice se actualiza al confirmar, una vez por transacción: si se revierte, queda como estaba
+@receiver([post_save, post_delete], sender=FaceEncoding)
+def update_face_index(sender, instance, **kwargs):
+    face_index.mark_changed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=FaceRecognitionSettings)
+def invalidate_settings_cache(sender, **kwargs):
+    # Tras el commit, para que ningún worker recargue la fila anterior con la versión nueva
+    transaction.on_commit(active_settings.invalidate)
+
+
+@receiver(m2m_changed, sender=Ficha.students.through)
+def invalidate_galleries_on_enrollment_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # ficha.students.add(...) / remove(...) / clear()
+        gallery_cache.invalidate(instance.pk)
+    elif pk_set:
+        # user.fichas_enrolled.add(...) / remove(...)
+        gallery_cache.invalidate(*pk_set)
+    else:
+        # user.fichas_enrolled.clear(): no se conocen las fichas afectadas
+        gallery_cache.invalidate_student(instance.pk)
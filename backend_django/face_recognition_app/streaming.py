@@ -0,0 +1,246 @@
+# face_recognition_app/streaming.py
+"""
+Reconocimiento facial por WebSocket para una sesión de asistencia.
+
+Ruta: /ws/recognize/<session_id>/?token=<access JWT>
+
+El instructor se autentica una sola vez al conectar. Después envía frames
+JPEG como mensajes binarios y recibe mensajes JSON:
+  - {"type": "ready", "session_id": ...} al aceptar la conexión
+  - {"type": "frame", "seq": ..., "recognized_students": [...], ...} por cada frame procesado
+  - {"type": "check_in", "students": [...]} cuando se registra asistencia
+  - {"type": "busy", "retry_after": ...} si el reconocimiento está saturado
+  - {"type": "error", "error": ...}
+
+Contrapresión: solo se guarda el último frame recibido. Si llega otro antes
+de que termine el reconocimiento del anterior, el frame pendiente se
+descarta (se informa en "dropped"); así la latencia no crece aunque la
+cámara envíe más rápido de lo que el servidor procesa.
+
+No depende de Django Channels: es una aplicación ASGI que facelog/asgi.py
+usa para las conexiones de tipo "websocket".
+"""
+import asyncio
+import json
+import re
+import time
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .inference import InferenceUnavailable
+from .services import recognize_faces_in_stream
+from .views import get_active_session
+
+PATH_PATTERN = re.compile(r'^/ws/recognize/(?P<session_id>\d+)/?$')
+
+# Códigos de cierre (rango 4000-4999 reservado para la aplicación)
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_FRAME_TOO_LARGE = 4413
+CLOSE_CODES = {404: CLOSE_NOT_FOUND, 403: CLOSE_FORBIDDEN}
+
+
+def _authenticate(raw_token):
+    """Devuelve (usuario, expiración del token) o (None, None) si el token no es válido"""
+    authentication = JWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        user = authentication.get_user(validated_token)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None, None
+    return user, validated_token.get('exp')
+
+
+def _check_session(user, session_id):
+    """
+    Las mismas comprobaciones que las vistas (views.get_active_session).
+    Devuelve None o (código de cierre, mensaje).
+    """
+    _, error = get_active_session(user, session_id)
+    if error is None:
+        return None
+    status_code, message = error
+    return CLOSE_CODES[status_code], message
+
+
+def _with_fresh_connection(function):
+    # Los hilos de sync_to_async no pasan por el ciclo de request de Django
+    def wrapper(*args):
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+authenticate = sync_to_async(_with_fresh_connection(_authenticate), thread_sensitive=False)
+check_session = sync_to_async(_with_fresh_connection(_check_session), thread_sensitive=False)
+
+
+def _recognize_frame_bytes(frame, session_id):
+    image_file = BytesIO(frame)
+    image_file.name = 'frame.jpg'
+    return recognize_faces_in_stream(image_file, session_id)
+
+
+recognize_frame = sync_to_async(_with_fresh_connection(_recognize_frame_bytes), thread_sensitive=False)
+
+
+class RecognitionStream:
+    """Estado de una conexión: último frame pendiente y contadores"""
+
+    def __init__(self, send, user, session_id, token_expires_at):
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.user = user
+        self.session_id = session_id
+        self.token_expires_at = token_expires_at
+        self.pending_frame = None
+        self.frame_available = asyncio.Event()
+        self.closed = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.session_checked_at = time.monotonic()
+
+    async def send_json(self, message):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder)})
+
+    async def close(self, code=1000):
+        if self.closed:
+            return
+        self.closed = True
+        self.frame_available.set()
+        async with self._send_lock:
+            await self._send({'type': 'websocket.close', 'code': code})
+
+    def push_frame(self, frame):
+        self.received += 1
+        if self.pending_frame is not None:
+            self.dropped += 1
+        self.pending_frame = (self.received, frame)
+        self.frame_available.set()
+
+    async def receive_loop(self, receive):
+        while not self.closed:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                self.closed = True
+                self.frame_available.set()
+                return
+            if message.get('bytes') is not None:
+                if len(message['bytes']) > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                    await self.send_json({'type': 'error', 'error': 'El frame supera el tamaño máximo permitido.'})
+                    await self.close(CLOSE_FRAME_TOO_LARGE)
+                    return
+                self.push_frame(message['bytes'])
+            elif message.get('text'):
+                await self._handle_text(message['text'])
+
+    async def _handle_text(self, text):
+        try:
+            command = json.loads(text)
+        except ValueError:
+            command = None
+        if isinstance(command, dict) and command.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+        else:
+            await self.send_json({'type': 'error', 'error': 'Envíe los frames como mensajes binarios JPEG.'})
+
+    async def _still_authorized(self):
+        """Revisa periódicamente que el token no haya expirado y la sesión siga activa"""
+        if self.token_expires_at and time.time() >= self.token_expires_at:
+            await self.send_json({'type': 'error', 'error': 'El token expiró; vuelva a conectarse.'})
+            await self.close(CLOSE_UNAUTHORIZED)
+            return False
+        if time.monotonic() - self.session_checked_at < settings.FACE_STREAM_SESSION_CHECK_INTERVAL:
+            return True
+        self.session_checked_at = time.monotonic()
+        problem = await check_session(self.user, self.session_id)
+        if problem:
+            code, error = problem
+            await self.send_json({'type': 'error', 'error': error})
+            await self.close(code)
+            return False
+        return True
+
+    async def process_loop(self):
+        while True:
+            await self.frame_available.wait()
+            self.frame_available.clear()
+            if self.closed:
+                return
+            pending, self.pending_frame = self.pending_frame, None
+            if pending is None or not await self._still_authorized():
+                continue
+            seq, frame = pending
+
+            started = time.perf_counter()
+            try:
+                result = await recognize_frame(frame, self.session_id)
+            except InferenceUnavailable as e:
+                await self.send_json({'type': 'busy', 'dropped': self.dropped, 'retry_after': e.wait})
+                continue
+            self.processed += 1
+            if self.closed:
+                return
+
+            await self.send_json({
+                'type': 'frame',
+                'seq': seq,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+                'dropped': self.dropped,
+                **result,
+            })
+            if result.get('recognized_students'):
+                await self.send_json({'type': 'check_in', 'students': result['recognized_students']})
+
+
+async def recognition_websocket(scope, receive, send):
+    """Aplicación ASGI para las conexiones WebSocket de reconocimiento"""
+    match = PATH_PATTERN.match(scope['path'])
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    session_id = int(match.group('session_id'))
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    raw_token = query.get('token', [''])[0]
+    user, token_expires_at = await authenticate(raw_token.encode()) if raw_token else (None, None)
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    problem = await check_session(user, session_id)
+    if problem:
+        await send({'type': 'websocket.close', 'code': problem[0]})
+        return
+
+    await send({'type': 'websocket.accept'})
+    stream = RecognitionStream(send, user, session_id, token_expires_at)
+    await stream.send_json({'type': 'ready', 'session_id': session_id})
+
+    processor = asyncio.ensure_future(stream.process_loop())
+    try:
+        await stream.receive_loop(receive)
+    finally:
+        stream.closed = True
+        stream.frame_available.set()
+        try:
+            await processor
+        except Exception as e:
+            # Normalmente, enviar a un cliente que ya se desconectó
+            print(f"Error in recognition stream for session {session_id}: {e}")
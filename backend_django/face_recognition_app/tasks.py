@@ -0,0 +1,9 @@
+# face_recognition_app/tasks.py
+from celery import shared_task
+
+from .jobs import execute_job
+
+
+@shared_task(name='face_recognition_app.run_face_job', ignore_result=True)
+def run_face_job(job_id):
+    execute_job(job_id)
@@ -1,3 +1,1654 @@
-from django.test import TestCase
+# face_recognition_app/tests.py
+import asyncio
+import json
+import os
+import tempfile
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from io import BytesIO, StringIO
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from attendance.models import Attendance, AttendanceSession, Ficha
+from .admission import AdmissionController, RecognitionOverloaded, SessionBatchFrameRateThrottle
+from .benchmarks import composite_image, latency_summary, parse_profile
+from .codec import EncodingFormatError, pack_encoding, stack_encodings, unpack_encoding
+from .enrollment import batch_duplicates, student_id_from_name
+from .face_index import IVFIndex, PersistentFaceIndex, face_index
+from . import enrollment, inference, jobs, reencoding, services, settings_cache, warmup
+from .inference import InferenceBusy, InferencePool, InferenceTimeout, InferenceUnavailable
+from .frame_cache import FrameCache, difference_hash, frame_cache, hamming_distance
+from .gallery import FaceGallery, GalleryCache
+from .log_buffer import BufferedModelWriter, load_spilled_entries
+from .metrics import histogram, summarize_metrics
+from .matching import assign_faces, face_distance_matrix, match_faces, refine_with_templates
+from .models import FaceEncoding, FaceRecognitionJob, FaceRecognitionSettings, FaceTemplate, FaceVerificationLog
+from .profiles import RecognitionProfile
+from .services import add_face_template, check_in_students
+from .quantization import QuantizedMatrix
+from .settings_cache import SettingsCache
+from .streaming import CLOSE_FORBIDDEN, CLOSE_NOT_FOUND, CLOSE_UNAUTHORIZED, recognition_websocket
+from .preprocessing import (
+    decode_image, downscale_for_detection, oriented_size, parse_face_boxes, plausible_face_boxes, scale_locations,
+)
+from .timing import StageTimer
+from .tracking import SessionTracker, associate, box_iou
+
+
+class EncodingCodecTests(SimpleTestCase):
+    def test_round_trip_float32(self):
+        """Una codificación float32 se recupera sin pérdidas"""
+        encoding = np.random.default_rng(0).standard_normal(128).astype(np.float32)
+        data = pack_encoding(encoding)
+        self.assertEqual(len(data), 4 + 128 * 4)
+        np.testing.assert_array_equal(unpack_encoding(data), encoding)
+
+    def test_round_trip_float64(self):
+        """Se puede conservar la precisión original en float64"""
+        encoding = np.random.default_rng(1).standard_normal(128)
+        restored = unpack_encoding(pack_encoding(encoding, dtype=np.float64))
+        self.assertEqual(restored.dtype, np.dtype('<f8'))
+        np.testing.assert_array_equal(restored, encoding)
+
+    def test_unpack_rejects_invalid_data(self):
+        """Datos truncados o con otra versión no se decodifican"""
+        data = pack_encoding(np.zeros(128))
+        with self.assertRaises(EncodingFormatError):
+            unpack_encoding(data[:-1])
+        with self.assertRaises(EncodingFormatError):
+            unpack_encoding(b'\x09' + data[1:])
+
+    def test_stack_encodings(self):
+        """Los vectores se apilan en una matriz contigua (N, D)"""
+        vectors = [unpack_encoding(pack_encoding(np.full(128, i))) for i in range(3)]
+        matrix = stack_encodings(vectors)
+        self.assertEqual(matrix.shape, (3, 128))
+        self.assertTrue(matrix.flags['C_CONTIGUOUS'])
+        self.assertEqual(stack_encodings([]).shape, (0, 0))
+
+
+def _fake_gallery(ficha_id, size=4):
+    student_ids = np.arange(ficha_id * 100, ficha_id * 100 + size, dtype=np.int64)
+    return FaceGallery(ficha_id, student_ids, np.zeros((size, 128), dtype=np.float32))
+
+
+class GalleryCacheTests(SimpleTestCase):
+    def test_hits_after_first_load(self):
+        """La segunda lectura de una ficha no vuelve a cargar la galería"""
+        loads = []
+        cache = GalleryCache(max_bytes=10 ** 6, max_age=60, loader=lambda f: loads.append(f) or _fake_gallery(f))
+        cache.get(1)
+        cache.get(1)
+        self.assertEqual(loads, [1])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_lru_eviction_by_memory(self):
+        """Al superar el límite de memoria se desaloja la galería menos usada"""
+        size = _fake_gallery(0).nbytes
+        cache = GalleryCache(max_bytes=size * 2, max_age=60, loader=_fake_gallery)
+        cache.get(1)
+        cache.get(2)
+        cache.get(1)
+        cache.get(3)
+        self.assertEqual(list(cache._entries), [1, 3])
+        self.assertLessEqual(cache.stats()['bytes'], size * 2)
+
+    def test_invalidate_student(self):
+        """Se invalidan solo las galerías que contienen al estudiante"""
+        cache = GalleryCache(max_bytes=10 ** 6, max_age=60, loader=_fake_gallery)
+        cache.get(1)
+        cache.get(2)
+        cache.invalidate_student(201)
+        self.assertEqual(list(cache._entries), [1])
+
+    def test_invalidation_during_load_is_not_cached(self):
+        """Una galería cargada antes de una invalidación no se guarda"""
+        def loader(ficha_id):
+            cache.invalidate(ficha_id)
+            return _fake_gallery(ficha_id)
+        cache = GalleryCache(max_bytes=10 ** 6, max_age=60, loader=loader)
+        cache.get(1)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_invalidation_reaches_other_processes_after_commit(self):
+        """Otro proceso descarta su galería cuando se confirma la invalidación compartida"""
+        patcher = mock.patch.object(settings_cache, 'cache_is_shared', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        version_key = 'tests:gallery_version'
+        self.addCleanup(cache.delete_many, [f'{version_key}:all', f'{version_key}:1', f'{version_key}:2'])
+        loads = []
+        worker_a = GalleryCache(
+            max_bytes=10 ** 6, max_age=60, loader=lambda f: loads.append(f) or _fake_gallery(f), version_key=version_key,
+        )
+        worker_b = GalleryCache(max_bytes=10 ** 6, max_age=60, loader=_fake_gallery, version_key=version_key)
+        worker_a.get(1)
+        worker_a.get(2)
+
+        callbacks = []
+        with mock.patch.object(transaction, 'on_commit', side_effect=callbacks.append):
+            worker_b.invalidate(1)
+        worker_a.get(1)
+        self.assertEqual(loads, [1, 2])
+        for callback in callbacks:
+            callback()
+        worker_a.get(1)
+        worker_a.get(2)
+        self.assertEqual(loads, [1, 2, 1])
+
+        # Sin conocer sus fichas se invalidan todas las galerías
+        worker_b.invalidate_student(201)
+        worker_a.get(1)
+        worker_a.get(2)
+        self.assertEqual(loads, [1, 2, 1, 1, 2])
+
+
+class MatchingTests(SimpleTestCase):
+    def test_distance_matrix_matches_pairwise_norm(self):
+        """La matriz de distancias coincide con np.linalg.norm par a par"""
+        rng = np.random.default_rng(2)
+        probes, gallery = rng.standard_normal((5, 128)) * 0.1, rng.standard_normal((7, 128)) * 0.1
+        expected = np.linalg.norm(probes[:, None, :] - gallery[None, :, :], axis=2)
+        np.testing.assert_allclose(face_distance_matrix(probes, gallery), expected, atol=1e-4)
+
+    def test_assigns_closest_not_first_match(self):
+        """Se asigna el estudiante más cercano, no el primero bajo la tolerancia"""
+        distances = np.array([[0.35, 0.10]], dtype=np.float32)
+        [match] = assign_faces(distances, np.array([10, 20]), tolerance=0.4)
+        self.assertEqual(match.student_id, 20)
+        self.assertAlmostEqual(match.distance, 0.10, places=5)
+
+    def test_conflicting_faces_resolved_by_distance(self):
+        """Si dos rostros reclaman al mismo estudiante, gana el más cercano"""
+        distances = np.array([
+            [0.20, 0.30],
+            [0.10, 0.90],
+        ], dtype=np.float32)
+        matches = assign_faces(distances, np.array([10, 20]), tolerance=0.4)
+        self.assertEqual([m.student_id for m in matches], [20, 10])
+
+    def test_unmatched_face_keeps_best_distance(self):
+        """Un rostro sin coincidencia conserva su menor distancia para el log"""
+        distances = np.array([[0.55, 0.70]], dtype=np.float32)
+        [match] = assign_faces(distances, np.array([10, 20]), tolerance=0.4)
+        self.assertIsNone(match.student_id)
+        self.assertAlmostEqual(match.best_distance, 0.55, places=5)
+
+
+    def test_borderline_centroid_rechecked_against_templates(self):
+        """Un rostro lejos del centroide pero cerca de una plantilla coincide"""
+        templates = np.zeros((2, 128), dtype=np.float32)
+        templates[0, 0], templates[1, 0] = 0.5, -0.5
+        gallery = FaceGallery(
+            1,
+            np.array([10, 20], dtype=np.int64),
+            np.array([np.zeros(128), np.full(128, 0.2)], dtype=np.float32),
+            spreads=np.array([0.5, 0.0], dtype=np.float32),
+            template_owners=np.array([0, 0]),
+            template_encodings=templates,
+        )
+        probe = templates[:1] + 0.001
+        [match] = match_faces(probe, gallery, tolerance=0.4)
+        self.assertEqual(match.student_id, 10)
+        self.assertLess(match.distance, 0.05)
+
+        # Fuera de la franja (distancia - spread > tolerancia) no se revisan plantillas
+        far = np.full((1, 128), 0.5, dtype=np.float32)
+        distances = gallery.encodings.distances(far)
+        self.assertEqual(refine_with_templates(distances, far, gallery, 0.4), 0)
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.ids = np.arange(1, 601)
+        self.vectors = rng.standard_normal((600, 128)).astype(np.float32) * 0.1
+        self.index = IVFIndex()
+        self.index.build(self.ids, self.vectors)
+
+    def test_search_finds_stored_vector(self):
+        """Una codificación almacenada es su propio vecino más cercano"""
+        ids, distances = self.index.search(self.vectors[42], k=3)
+        self.assertEqual(ids[0], 43)
+        self.assertAlmostEqual(float(distances[0]), 0.0, places=3)
+        self.assertGreater(len(self.index.centroids), 1)
+
+    def test_upsert_and_remove(self):
+        """Las actualizaciones reemplazan o eliminan la entrada del usuario"""
+        new_vector = np.full(128, 0.5, dtype=np.float32)
+        self.index.upsert(43, new_vector)
+        self.assertEqual(len(self.index), 600)
+        self.assertEqual(self.index.search(new_vector, k=1)[0][0], 43)
+        self.index.remove(43)
+        self.assertNotIn(43, self.index.ids)
+
+    def test_upsert_many(self):
+        """Varias actualizaciones a la vez equivalen a upsert uno por uno"""
+        vectors = np.full((3, 128), 0.5, dtype=np.float32) * np.array([[1.0], [-1.0], [2.0]], dtype=np.float32)
+        self.index.upsert_many([43, 1001, 43], vectors)
+        self.assertEqual(len(self.index), 601)
+        self.assertEqual(self.index.search(vectors[1], k=1)[0][0], 1001)
+        # Gana la última codificación del usuario repetido
+        self.assertEqual(self.index.search(vectors[2], k=1)[0][0], 43)
+        self.assertNotEqual(self.index.search(vectors[0], k=1)[0][0], 43)
+
+    def test_save_and_load(self):
+        """El índice se puede persistir y recargar desde disco"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.npz')
+            self.index.save(path)
+            loaded = IVFIndex.load(path)
+        np.testing.assert_array_equal(loaded.ids, self.index.ids)
+        self.assertEqual(loaded.search(self.vectors[7], k=1)[0][0], 8)
+
+
+class PersistentFaceIndexTests(SimpleTestCase):
+    def test_concurrent_updates_are_not_lost(self):
+        """Dos procesos (dos instancias sobre el mismo archivo) no pisan sus actualizaciones"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.npz')
+            IVFIndex().save(path)
+            indexes = [PersistentFaceIndex(path), PersistentFaceIndex(path)]
+            vectors = np.random.default_rng(5).standard_normal((40, 128)).astype(np.float32)
+
+            def upsert(worker):
+                for user_id in range(worker, 40, 8):
+                    indexes[worker % 2].upsert(user_id, vectors[user_id])
+
+            threads = [threading.Thread(target=upsert, args=(worker,)) for worker in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(IVFIndex.load(path).ids.tolist()), list(range(40)))
+
+    def test_update_saves_upserts_and_removals_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.npz')
+            IVFIndex().save(path)
+            index = PersistentFaceIndex(path)
+            vectors = np.random.default_rng(6).standard_normal((4, 128)).astype(np.float32)
+            index.upsert_many([1, 2, 3], vectors[:3])
+            with mock.patch.object(IVFIndex, 'save', autospec=True, side_effect=IVFIndex.save) as save:
+                index.update([3, 4], vectors[2:], removed_ids=[1, 2])
+            save.assert_called_once()
+            self.assertEqual(sorted(IVFIndex.load(path).ids.tolist()), [3, 4])
+
+
+class FaceIndexSignalTests(TestCase):
+    def setUp(self):
+        self.users = [get_user_model().objects.create_user(username=f'indexed{index}') for index in range(2)]
+        self.encoding_data = pack_encoding(np.full(128, 0.1, dtype=np.float32))
+        patcher = mock.patch.object(face_index, 'update')
+        self.update = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Lo pendiente de transacciones revertidas en otras pruebas no cuenta aquí
+        face_index._pending.user_ids = set()
+        self.addCleanup(setattr, face_index._pending, 'user_ids', set())
+
+    def test_index_is_updated_once_after_commit(self):
+        """Todos los cambios de una transacción se guardan juntos al confirmarla"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                first = FaceEncoding.objects.create(user=self.users[0], encoding_data=self.encoding_data)
+                second = FaceEncoding.objects.create(user=self.users[1], encoding_data=self.encoding_data)
+                first.encoding_data = pack_encoding(np.full(128, 0.3, dtype=np.float32))
+                first.save()
+                second.delete()
+            self.update.assert_not_called()
+        self.update.assert_called_once()
+        user_ids, vectors, removed_ids = self.update.call_args.args
+        self.assertEqual(list(user_ids), [self.users[0].id])
+        self.assertTrue(np.allclose(vectors, 0.3))
+        self.assertEqual(removed_ids, [self.users[1].id])
+
+    def test_rolled_back_savepoint_uses_stored_encoding(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            face_encoding = FaceEncoding.objects.create(user=self.users[0], encoding_data=self.encoding_data)
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    face_encoding.encoding_data = pack_encoding(np.full(128, 0.5, dtype=np.float32))
+                    face_encoding.save()
+                    raise RuntimeError
+        self.update.assert_called_once()
+        self.assertTrue(np.allclose(self.update.call_args.args[1], 0.1))
+
+    def test_rolled_back_save_leaves_index_untouched(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    FaceEncoding.objects.create(user=self.users[0], encoding_data=self.encoding_data)
+                    raise RuntimeError
+        self.update.assert_not_called()
+
+
+class FaceTemplateTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        patcher = mock.patch.object(face_index, 'update')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(username='aprendiz')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def _add(self, value, user=None):
+        image = SimpleUploadedFile('rostro.jpg', b'jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            _, template, _ = add_face_template(user or self.user, image, np.full(128, value, dtype=np.float32))
+        return template
+
+    def _centroid(self):
+        return unpack_encoding(FaceEncoding.objects.get(user=self.user).encoding_data)
+
+    def test_lists_only_own_templates(self):
+        own = [self._add(0.1).id, self._add(0.3).id]
+        self._add(0.5, user=get_user_model().objects.create_user(username='otro'))
+        response = self.client.get('/api/v1/face/templates/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(template['id'] for template in response.data['results']), own)
+
+    def test_added_template_updates_centroid(self):
+        self._add(0.1)
+        with mock.patch('face_recognition_app.views.get_face_encoding_from_image', return_value=np.full(128, 0.3)), \
+                mock.patch('face_recognition_app.views.find_duplicate_face', return_value=None):
+            response = self.client.post(
+                '/api/v1/face/templates/', {'image': SimpleUploadedFile('rostro.jpg', b'jpeg')}, format='multipart',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(FaceTemplate.objects.filter(face_encoding__user=self.user).count(), 2)
+        self.assertTrue(np.allclose(self._centroid(), 0.2))
+
+    @override_settings(FACE_MAX_TEMPLATES=2)
+    def test_trimmed_templates_lose_their_images(self):
+        oldest = self._add(0.1)
+        self._add(0.2)
+        self.assertTrue(default_storage.exists(oldest.image.name))
+        newest = self._add(0.3)
+        self.assertFalse(FaceTemplate.objects.filter(id=oldest.id).exists())
+        self.assertFalse(default_storage.exists(oldest.image.name))
+        self.assertTrue(default_storage.exists(newest.image.name))
+
+    def test_only_template_cannot_be_deleted(self):
+        template = self._add(0.1)
+        response = self.client.delete(f'/api/v1/face/templates/{template.id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+        self.assertTrue(FaceTemplate.objects.filter(id=template.id).exists())
+        self.assertTrue(default_storage.exists(template.image.name))
+
+    def test_other_users_template_is_not_found(self):
+        self._add(0.1)
+        other = get_user_model().objects.create_user(username='otro')
+        templates = [self._add(0.3, user=other), self._add(0.5, user=other)]
+        self.assertEqual(self.client.get(f'/api/v1/face/templates/{templates[0].id}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/v1/face/templates/{templates[0].id}/').status_code, 404)
+        self.assertTrue(FaceTemplate.objects.filter(id=templates[0].id).exists())
+
+    def test_delete_recomputes_centroid_and_removes_image(self):
+        first = self._add(0.1)
+        second = self._add(0.3)
+        self.assertEqual(FaceEncoding.objects.get(user=self.user).profile_image.name, second.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/v1/face/templates/{second.id}/')
+        self.assertEqual(response.status_code, 204)
+        face_encoding = FaceEncoding.objects.get(user=self.user)
+        self.assertEqual(face_encoding.template_count, 1)
+        self.assertTrue(np.allclose(self._centroid(), 0.1))
+        # La imagen de perfil ya no apunta al archivo borrado
+        self.assertEqual(face_encoding.profile_image.name, first.image.name)
+        self.assertFalse(default_storage.exists(second.image.name))
+
+
+class BulkEnrollmentTests(SimpleTestCase):
+    def test_student_id_from_file_name(self):
+        self.assertEqual(student_id_from_name('cohorte 2024/1023456789.JPG'), '1023456789')
+
+    def test_batch_duplicates(self):
+        """Se reportan los pares del lote dentro de la tolerancia"""
+        encodings = np.random.default_rng(9).standard_normal((4, 128)).astype(np.float32)
+        encodings[3] = encodings[1] + 0.01
+        self.assertEqual(batch_duplicates(encodings, 0.6), [(1, 3)])
+        self.assertEqual(batch_duplicates(encodings[:1], 0.6), [])
+
+
+def _zip_bytes(files):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+class BulkEnrollmentDatabaseTests(TestCase):
+    """enroll_faces y register/bulk/ con la codificación simulada: cada foto contiene su valor"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.directory = media_root.name
+        media_settings = override_settings(MEDIA_ROOT=os.path.join(media_root.name, 'media'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        def encode(images, profile, pool):
+            results = []
+            for image in images:
+                if image == b'sin rostro':
+                    results.append((0, None, None))
+                elif image == b'dos rostros':
+                    results.append((2, None, None))
+                else:
+                    results.append((1, np.full(128, float(image.decode()), dtype=np.float32), None))
+            return results
+
+        def search(encoding, k, n_probe):
+            # Todos los rostros registrados son candidatos
+            return np.array(list(FaceEncoding.objects.values_list('user_id', flat=True)), dtype=np.int64), None
+
+        for target, attribute, value in (
+            (enrollment, 'encode_enrollment_images', encode),
+            (face_index, 'search', search),
+            (face_index, 'update', mock.DEFAULT),
+            (face_index, 'rebuild', mock.DEFAULT),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        User = get_user_model()
+        self.students = {
+            student_id: User.objects.create_user(username=f'aprendiz{student_id}', student_id=student_id)
+            for student_id in ('100', '101', '102', '103', '104', '105')
+        }
+        self.enrolled_template = self._enroll_existing('104', 0.9)
+        face_index.update.reset_mock()
+
+    def _enroll_existing(self, student_id, value):
+        with self.captureOnCommitCallbacks(execute=True):
+            _, template, _ = add_face_template(
+                self.students[student_id], SimpleUploadedFile('rostro.jpg', b'jpeg'), np.full(128, value),
+            )
+        return template
+
+    def _run_command(self, files, *args):
+        path = os.path.join(self.directory, 'cohorte.zip')
+        with open(path, 'wb') as archive_file:
+            archive_file.write(_zip_bytes(files))
+        output = os.path.join(self.directory, 'resultado.json')
+        stdout = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('enroll_faces', path, '--workers', '0', '--output', output, *args, stdout=stdout, stderr=StringIO())
+        with open(output, encoding='utf-8') as output_file:
+            report = json.load(output_file)
+        return {entry['file']: entry for entry in report['results']}, stdout.getvalue()
+
+    def test_command_enrolls_valid_photos_and_reports_the_rest(self):
+        results, stdout = self._run_command({
+            '101.jpg': b'0.1',
+            'fotos/100.jpg': b'sin rostro',
+            '102.jpg': b'0.5',
+            '103.jpg': b'0.5',
+            '104.jpg': b'0.3',
+            '105.jpg': b'0.9',
+            '999.jpg': b'0.7',
+        })
+        self.assertEqual({name: entry['status'] for name, entry in results.items()}, {
+            '101.jpg': 'enrolled',
+            'fotos/100.jpg': 'no_face',
+            '102.jpg': 'duplicate_in_batch',
+            '103.jpg': 'duplicate_in_batch',
+            '104.jpg': 'already_enrolled',
+            '105.jpg': 'duplicate_face',
+            '999.jpg': 'unknown_student',
+        })
+        self.assertEqual((results['102.jpg']['duplicate_of'], results['103.jpg']['duplicate_of']), ('103', '102'))
+        self.assertEqual(results['105.jpg']['duplicate_of'], '104')
+        self.assertIn('enrolled: 1', stdout)
+
+        face_encoding = FaceEncoding.objects.get(user=self.students['101'])
+        template = face_encoding.templates.get()
+        self.assertEqual(face_encoding.template_count, 1)
+        self.assertEqual(face_encoding.profile_image.name, template.image.name)
+        self.assertEqual(face_encoding.model_version, RecognitionProfile().model_version)
+        self.assertTrue(np.allclose(unpack_encoding(face_encoding.encoding_data), 0.1))
+        with default_storage.open(template.image.name) as image_file:
+            self.assertEqual(image_file.read(), b'0.1')
+        self.assertEqual(
+            set(FaceEncoding.objects.values_list('user__student_id', flat=True)), {'101', '104'},
+        )
+        # El comando no actualiza el índice por rostro: lo reconstruye una vez al terminar
+        face_index.update.assert_not_called()
+        face_index.rebuild.assert_called_once()
+
+    def test_replace_keeps_only_the_new_photo(self):
+        results, _ = self._run_command({'104.jpg': b'0.3'}, '--replace')
+        self.assertEqual(results['104.jpg']['status'], 'replaced')
+        face_encoding = FaceEncoding.objects.get(user=self.students['104'])
+        self.assertEqual(face_encoding.templates.count(), 1)
+        self.assertTrue(np.allclose(unpack_encoding(face_encoding.encoding_data), 0.3))
+        self.assertFalse(default_storage.exists(self.enrolled_template.image.name))
+
+    def test_dry_run_writes_nothing(self):
+        results, stdout = self._run_command({'101.jpg': b'0.1'}, '--dry-run')
+        self.assertEqual(results['101.jpg']['status'], 'enrolled')
+        self.assertTrue(stdout.startswith('Simulación'))
+        self.assertFalse(FaceEncoding.objects.filter(user=self.students['101']).exists())
+        face_index.rebuild.assert_not_called()
+
+    def test_admin_endpoint(self):
+        client = APIClient(SERVER_NAME='localhost')
+        archive = SimpleUploadedFile('cohorte.zip', _zip_bytes({'101.jpg': b'0.1', '999.jpg': b'0.2'}))
+        client.force_authenticate(self.students['100'])
+        response = client.post('/api/v1/face/register/bulk/', {'archive': archive}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+        admin = get_user_model().objects.create_user(username='admin', role='admin', is_staff=True)
+        client.force_authenticate(admin)
+        archive.seek(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/v1/face/register/bulk/', {'archive': archive}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary'], {'enrolled': 1, 'unknown_student': 1})
+        self.assertTrue(FaceEncoding.objects.filter(user=self.students['101']).exists())
+        face_index.update.assert_called_once()
+        self.assertEqual(face_index.update.call_args.args[0], [self.students['101'].id])
+
+        response = client.post(
+            '/api/v1/face/register/bulk/', {'archive': SimpleUploadedFile('cohorte.zip', b'no es zip')}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "El archivo no es un ZIP válido.")
+
+
+class PreprocessingTests(SimpleTestCase):
+    def test_downscale_limits_largest_side(self):
+        """La copia para detección respeta la dimensión máxima"""
+        image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        small, scale = downscale_for_detection(image, 480)
+        self.assertEqual(small.shape, (270, 480, 3))
+        self.assertAlmostEqual(scale, 0.25)
+
+    def test_small_images_are_not_resized(self):
+        """Sin límite o con imágenes pequeñas no se reescala"""
+        image = np.zeros((240, 320, 3), dtype=np.uint8)
+        self.assertIs(downscale_for_detection(image, 0)[0], image)
+        self.assertIs(downscale_for_detection(image, 640)[0], image)
+
+    def test_scale_locations_maps_back_to_original(self):
+        """Las cajas detectadas se llevan a la imagen original y se recortan"""
+        locations = scale_locations([(10, 100, 60, 50), (200, 480, 270, 400)], 0.25, (1080, 1920, 3))
+        self.assertEqual(locations, [(40, 400, 240, 200), (800, 1920, 1080, 1600)])
+
+    def test_parse_client_face_boxes(self):
+        """Se aceptan cajas {x, y, width, height} o [top, right, bottom, left]"""
+        self.assertIsNone(parse_face_boxes(''))
+        self.assertEqual(
+            parse_face_boxes('[{"x": 10, "y": 20, "width": 50, "height": 60}, [1, 2, 3, 4]]'),
+            [(20.0, 60.0, 80.0, 10.0), (1.0, 2.0, 3.0, 4.0)],
+        )
+        with self.assertRaises(ValueError):
+            parse_face_boxes('[{"x": 10}]')
+
+    def test_implausible_client_boxes_fall_back_to_detection(self):
+        image_size = (640, 480)
+        self.assertEqual(
+            plausible_face_boxes([(100, 260, 260, 100), (-10, 100, 90, 30)], image_size, min_size=20, max_faces=10),
+            [(100, 260, 260, 100), (0, 100, 90, 30)],
+        )
+        # Muy pequeña, muy alargada, casi fuera de la imagen o demasiadas
+        for boxes in ([(0, 10, 10, 0)], [(0, 300, 50, 0)], [(400, 700, 700, 600)], [(0, 50, 50, 0)] * 11):
+            self.assertIsNone(plausible_face_boxes(boxes, image_size, min_size=20, max_faces=10))
+
+    def test_decode_image_reduces_and_orients(self):
+        """Los JPEG grandes se decodifican reducidos y con la orientación EXIF aplicada"""
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # girada 90°: se ve como 1000x2000
+        Image.new('RGB', (2000, 1000), (200, 30, 30)).save(buffer, format='JPEG', exif=exif)
+        image_bytes = buffer.getvalue()
+        self.assertEqual(oriented_size(Image.open(BytesIO(image_bytes))), (1000, 2000))
+
+        image, scale, original_shape = decode_image(image_bytes, 500)
+        self.assertEqual(image.shape, (500, 250, 3))
+        self.assertEqual(image.dtype, np.uint8)
+        self.assertEqual(original_shape, (2000, 1000))
+        self.assertAlmostEqual(scale, 0.25)
+        self.assertEqual(decode_image(image_bytes)[0].shape, (2000, 1000, 3))
+
+
+class RecognitionProfileTests(SimpleTestCase):
+    def test_profile_from_settings(self):
+        """El perfil refleja los campos de la configuración"""
+        settings = FaceRecognitionSettings(
+            face_detection_model='cnn', number_of_times_to_upsample=0,
+            num_jitters=5, landmark_model='large', max_image_dimension=960, decode_max_dimension=1280,
+        )
+        self.assertEqual(settings.get_profile(), RecognitionProfile('cnn', 0, 5, 'large', 960, 1280))
+
+    def test_model_version_tracks_encoding_parameters(self):
+        """La versión cambia con los parámetros que alteran las codificaciones"""
+        profile = RecognitionProfile()
+        self.assertNotEqual(profile.model_version, profile._replace(num_jitters=5).model_version)
+        self.assertNotEqual(profile.model_version, profile._replace(landmark_model='large').model_version)
+        self.assertEqual(profile.model_version, profile._replace(max_image_dimension=960).model_version)
+
+    def test_parse_profile(self):
+        """Los perfiles de los benchmarks se describen como texto"""
+        self.assertEqual(parse_profile('hog:1:1:small'), RecognitionProfile())
+        with self.assertRaises(ValueError):
+            parse_profile('hog:1:1:medium')
+
+    def test_latency_summary(self):
+        summary = latency_summary(list(range(1, 101)))
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50'], 50.5)
+
+    def test_composite_image_tiles(self):
+        tile = Image.new('RGB', (64, 48), 'red')
+        composite = Image.open(BytesIO(composite_image([tile], 3, tile_size=(64, 48))))
+        self.assertEqual(composite.size, (192, 144))
+
+
+class StageTimingTests(SimpleTestCase):
+    def test_stages_accumulate(self):
+        """Una etapa medida varias veces se suma"""
+        timer = StageTimer()
+        with timer.stage('matching'):
+            pass
+        timer.add('matching', 2.0)
+        timer.add('detection', 10.0)
+        self.assertGreaterEqual(timer.stages['matching'], 2.0)
+        self.assertIn('detection;dur=10.0', timer.server_timing())
+        self.assertEqual(timer.as_dict()['stages']['detection'], 10.0)
+
+    def test_summarize_metrics_finds_hot_stage(self):
+        rows = [
+            (100.0, {'decode': 5.0, 'detection': 80.0, 'matching': 1.0}, 'checked_in', 'server'),
+            (300.0, {'decode': 6.0, 'detection': 280.0, 'matching': 2.0}, 'no_check_in', 'server'),
+            (20.0, {'decode': 5.0, 'encoding': 10.0}, 'checked_in', 'client_boxes'),
+            (3.0, {'dedup': 1.0}, 'duplicate', ''),
+        ]
+        summary = summarize_metrics(rows)
+        self.assertEqual(summary['frames'], 4)
+        self.assertEqual(summary['hot_stage'], 'detection')
+        self.assertEqual(summary['stages']['dedup']['count'], 1)
+        self.assertEqual(sum(summary['total']['histogram']), 4)
+        self.assertAlmostEqual(summary['detection_skip_rate'], 1 / 3, places=3)
+        self.assertEqual(histogram([5.0, 5.1, 20000.0], buckets=(5, 10)), [1, 1, 1])
+
+
+def _jpeg_bytes(array):
+    buffer = BytesIO()
+    Image.fromarray(array.astype(np.uint8)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class FrameCacheTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.scene = rng.integers(0, 255, (12, 16, 3)).repeat(40, axis=0).repeat(40, axis=1)
+        self.noisy_scene = np.clip(self.scene + rng.integers(-3, 4, self.scene.shape), 0, 255)
+
+    def test_similar_frames_have_close_hashes(self):
+        """Un frame con ruido leve queda cerca; otra escena queda lejos"""
+        reference = difference_hash(_jpeg_bytes(self.scene))
+        self.assertLessEqual(hamming_distance(reference, difference_hash(_jpeg_bytes(self.noisy_scene))), 4)
+        self.assertGreater(hamming_distance(reference, difference_hash(_jpeg_bytes(255 - self.scene))), 16)
+
+    def test_lookup_reuses_recent_result_and_counts_skips(self):
+        """Un frame casi idéntico reutiliza el resultado y cuenta como omitido"""
+        cache = FrameCache(max_distance=4, max_age=60, history=4)
+        self.assertIsNone(cache.lookup(1, 0b1010))
+        cache.store(1, 0b1010, {'recognized_students': []})
+        self.assertEqual(cache.lookup(1, 0b1011), {'recognized_students': []})
+        self.assertIsNone(cache.lookup(2, 0b1010))
+        self.assertEqual(cache.stats(1), {'processed': 1, 'skipped': 1, 'skip_rate': 0.5})
+
+    def test_idle_sessions_are_forgotten(self):
+        """Los frames y contadores de sesiones inactivas no se acumulan"""
+        cache = FrameCache(max_distance=4, max_age=60, history=4, idle_timeout=120)
+        for session_id in range(3):
+            cache.lookup(session_id, 0b1010)
+            cache.store(session_id, 0b1010, {})
+        self.assertEqual(len(cache), 3)
+        with mock.patch('face_recognition_app.frame_cache.time.monotonic', return_value=time.monotonic() + 90):
+            cache.lookup(0, 0b1010)
+            self.assertEqual(len(cache), 3)
+        with mock.patch('face_recognition_app.frame_cache.time.monotonic', return_value=time.monotonic() + 250):
+            cache.lookup(1, 0b1010)
+            self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats(0), {'processed': 0, 'skipped': 0, 'skip_rate': 0.0})
+        # La sesión 1 también había vencido: sus contadores empiezan de nuevo
+        self.assertEqual(cache.stats(1)['processed'], 1)
+
+    def test_duplicate_frame_does_not_repeat_check_ins(self):
+        """Un frame duplicado devuelve los estudiantes del original como ya registrados"""
+        first = {
+            'recognized_students': [{'id': 7, 'full_name': 'Ana', 'status': 'present', 'attendance_id': 70}],
+            'already_checked_in': [3],
+            'tracked_faces': 0,
+        }
+        frame = BytesIO(_jpeg_bytes(self.scene))
+        with mock.patch.object(services, '_recognize_frame', return_value=first) as recognize_frame:
+            for _ in range(2):
+                result = services._recognize_unique_frame(frame, 'dedup-test', None, None, StageTimer())
+        frame_cache.forget('dedup-test')
+        recognize_frame.assert_called_once()
+        self.assertTrue(result['duplicate_frame'])
+        self.assertEqual(result['recognized_students'], [])
+        self.assertEqual(result['already_checked_in'], [3, 7])
+
+    def test_error_results_are_not_replayed(self):
+        """Un fallo en un frame no se repite para los frames casi idénticos"""
+        failure = {'error': 'No se detectó ningún rostro en la imagen.'}
+        success = {'recognized_students': [], 'already_checked_in': [], 'tracked_faces': 0}
+        frame = BytesIO(_jpeg_bytes(self.scene))
+        with mock.patch.object(services, '_recognize_frame', side_effect=[failure, success]) as recognize_frame:
+            results = [services._recognize_unique_frame(frame, 8101, None, None, StageTimer()) for _ in range(2)]
+        frame_cache.forget(8101)
+        self.assertEqual(recognize_frame.call_count, 2)
+        self.assertEqual(results[0]['error'], failure['error'])
+        self.assertNotIn('duplicate_frame', results[1])
+
+    def test_session_id_is_normalised_to_int(self):
+        """El id de sesión de HTTP (texto) y de WebSocket (entero) comparten cachés"""
+        with mock.patch.object(services, '_recognize_stream_frame', return_value={}) as recognize, \
+                mock.patch.object(services, '_record_metrics'):
+            services.recognize_faces_in_stream(BytesIO(), '8102')
+            services.recognize_faces_in_stream(BytesIO(), 8102)
+        self.assertEqual([call.args[1] for call in recognize.call_args_list], [8102, 8102])
+        with mock.patch.object(services, '_recognize_unique_frame', return_value={}) as recognize_unique, \
+                mock.patch.object(services, '_load_session_gallery', return_value=[object()]), \
+                mock.patch.object(services.FaceRecognitionSettings, 'current', return_value=mock.Mock(enable_logging=False)), \
+                mock.patch.object(services, '_record_metrics'):
+            services.recognize_faces_in_batch([BytesIO()], '8102')
+        self.assertEqual(recognize_unique.call_args.args[1], 8102)
+
+
+class TrackingTests(SimpleTestCase):
+    def test_associate_follows_moving_faces(self):
+        """Cada caja se asocia con la pista que tenía al lado en el frame anterior"""
+        previous = [(100, 200, 200, 100), (100, 500, 200, 400)]
+        current = [(105, 510, 205, 410), (102, 205, 202, 105), (400, 900, 500, 800)]
+        self.assertEqual(associate(current, previous), {0: 1, 1: 0})
+        self.assertAlmostEqual(box_iou(previous[0], previous[0]), 1.0)
+        self.assertEqual(box_iou(previous[0], previous[1]), 0.0)
+
+    def test_track_is_confirmed_after_consistent_matches(self):
+        """Una pista se confirma tras confirm_hits coincidencias con el mismo estudiante"""
+        tracker = SessionTracker(confirm_hits=2, max_age=60)
+        box = (100, 200, 200, 100)
+        for _ in range(2):
+            self.assertEqual(tracker.confirmed_tracks(), [])
+            [track] = tracker.update([box], [])
+            tracker.record_match(track, 7)
+        [track] = tracker.confirmed_tracks()
+        self.assertEqual(track.student_id, 7)
+        # La pista confirmada se mantiene aunque la cara se mueva un poco
+        self.assertIs(tracker.update([(104, 204, 204, 104)], [track])[0], track)
+
+    def test_changed_identity_resets_confirmation(self):
+        tracker = SessionTracker(confirm_hits=2, max_age=60)
+        [track] = tracker.update([(0, 50, 50, 0)], [])
+        tracker.record_match(track, 7)
+        tracker.record_match(track, 8)
+        self.assertEqual(tracker.confirmed_tracks(), [])
+        self.assertEqual((track.student_id, track.hits), (8, 1))
+
+    def test_unmatched_track_is_exhausted_after_max_attempts(self):
+        """Un rostro desconocido deja de compararse tras max_verification_attempts intentos"""
+        tracker = SessionTracker(confirm_hits=2, max_age=60, retry_cooldown=60)
+        box = (0, 50, 50, 0)
+        for _ in range(3):
+            self.assertEqual(tracker.confirmed_tracks(max_attempts=3), [])
+            [track] = tracker.update([box], [])
+            tracker.record_match(track, None)
+        self.assertEqual(tracker.confirmed_tracks(max_attempts=3), [track])
+        self.assertEqual(tracker.confirmed_tracks(), [])
+
+    def test_exhausted_track_is_retried_after_cooldown(self):
+        """Pasado retry_cooldown, una pista agotada vuelve a compararse y puede confirmarse"""
+        tracker = SessionTracker(confirm_hits=2, max_age=60, retry_cooldown=5)
+        box = (0, 50, 50, 0)
+        for _ in range(2):
+            [track] = tracker.update([box], [])
+            tracker.record_match(track, None)
+        self.assertEqual(tracker.confirmed_tracks(max_attempts=2), [track])
+
+        track.failed_at -= 5
+        self.assertEqual(tracker.confirmed_tracks(max_attempts=2), [])
+        # Un nuevo fallo la vuelve a agotar por otro periodo
+        self.assertIs(tracker.update([box], [])[0], track)
+        tracker.record_match(track, None)
+        self.assertEqual(tracker.confirmed_tracks(max_attempts=2), [track])
+
+        track.failed_at -= 5
+        for _ in range(2):
+            self.assertIs(tracker.update([box], [])[0], track)
+            tracker.record_match(track, 7)
+        self.assertEqual(tracker.confirmed_tracks(max_attempts=2), [track])
+        self.assertTrue(tracker.is_confirmed(track))
+        self.assertEqual(track.attempts, 0)
+
+
+class InferencePoolTests(SimpleTestCase):
+    def _pool(self, *executors, workers=1, max_pending=0, timeout=5):
+        """Pool cuyos ejecutores son hilos (o los dobles indicados) en lugar de procesos"""
+        executors = list(executors) or [ThreadPoolExecutor(workers)]
+        patcher = mock.patch.object(inference, 'ProcessPoolExecutor', side_effect=executors)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pool = InferencePool(workers=workers, max_pending=max_pending, timeout=timeout)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_full_queue_is_rejected_immediately(self):
+        pool = self._pool(workers=1, max_pending=1)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        pool._submit(release.wait)
+        pool._submit(release.wait)
+        with self.assertRaises(InferenceBusy):
+            pool.run(time.time)
+        release.set()
+        # Al terminar las tareas se liberan sus cupos
+        for _ in range(50):
+            try:
+                self.assertEqual(pool.run(abs, -2), 2)
+                break
+            except InferenceBusy:
+                time.sleep(0.01)
+        else:
+            self.fail('Los cupos no se liberaron')
+
+    def test_slow_task_times_out(self):
+        pool = self._pool(timeout=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(InferenceTimeout):
+            pool.run(release.wait)
+
+    def test_broken_pool_is_replaced(self):
+        broken = mock.Mock()
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        broken.submit.return_value = future
+        pool = self._pool(broken, ThreadPoolExecutor(1))
+        with self.assertRaises(InferenceUnavailable):
+            pool.run(abs, -1)
+        broken.shutdown.assert_called_once()
+        self.assertEqual(pool.run(abs, -1), 1)
+
+    def test_broken_pool_on_submit_is_replaced(self):
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        pool = self._pool(broken, ThreadPoolExecutor(1))
+        with self.assertRaises(InferenceUnavailable):
+            pool.run(abs, -1)
+        # El cupo no se pierde y el ejecutor se vuelve a crear
+        self.assertEqual(pool.run(abs, -3), 3)
+
+    def test_without_workers_inference_runs_in_this_thread(self):
+        threads = []
+
+        def encode(image_bytes, profile, skip_boxes, known_locations):
+            threads.append(threading.current_thread())
+            return [], []
+
+        with mock.patch.object(inference, 'inference_pool', None), \
+                mock.patch.object(inference, '_encode_image_bytes', side_effect=encode):
+            self.assertEqual(inference.encode_image(BytesIO(b'jpeg'), RecognitionProfile()), ([], []))
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_web_process_does_not_load_face_models(self):
+        """Importar las vistas y servicios no importa face_recognition (ni dlib)"""
+        code = (
+            "import sys, django; django.setup(); "
+            "import face_recognition_app.views, face_recognition_app.streaming; "
+            "print('face_recognition' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, env=os.environ,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1:], ['False'], result.stderr)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_rejects_when_queue_is_full(self):
+        """Sin cupo ni lugar en la cola se rechaza de inmediato con Retry-After"""
+        controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=5)
+        with controller.admit():
+            with self.assertRaises(RecognitionOverloaded) as context:
+                with controller.admit():
+                    pass
+        self.assertGreaterEqual(context.exception.wait, 1)
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(controller.stats()['active'], 0)
+
+    def test_queued_request_times_out(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+        timer = StageTimer()
+        with controller.admit(timer):
+            with self.assertRaises(RecognitionOverloaded):
+                with controller.admit():
+                    pass
+        self.assertIn('admission', timer.stages)
+        self.assertEqual((controller.stats()['waiting'], controller.stats()['rejected']), (0, 1))
+
+
+class _BatchView:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def frame_count(self, request):
+        return self.frames
+
+
+class _Request:
+    def __init__(self, session_id, user_id=1):
+        self.data = {'session_id': session_id}
+        self.user = mock.Mock(pk=user_id)
+
+
+@override_settings(FACE_SESSION_BATCH_FRAME_RATE='5/m')
+class SessionFrameRateThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.request = _Request('throttle-test')
+        self.other_request = _Request('throttle-test', user_id=2)
+        for request in (self.request, self.other_request):
+            cache.delete(SessionBatchFrameRateThrottle().get_cache_key(request, None))
+
+    def test_batch_is_charged_per_frame(self):
+        """Un lote de 3 frames consume 3 turnos: no cabe otro igual en la misma ventana"""
+        self.assertTrue(SessionBatchFrameRateThrottle().allow_request(self.request, _BatchView(3)))
+        throttle = SessionBatchFrameRateThrottle()
+        self.assertFalse(throttle.allow_request(self.request, _BatchView(3)))
+        self.assertGreater(throttle.wait(), 0)
+        self.assertTrue(SessionBatchFrameRateThrottle().allow_request(self.request, _BatchView(2)))
+
+    def test_batch_larger_than_rate_uses_whole_window(self):
+        self.assertTrue(SessionBatchFrameRateThrottle().allow_request(self.request, _BatchView(50)))
+        self.assertFalse(SessionBatchFrameRateThrottle().allow_request(self.request, _BatchView(1)))
+
+    def test_other_users_do_not_spend_the_session_budget(self):
+        """Quien envía el session_id de otra sesión agota solo su propio cupo"""
+        self.assertTrue(SessionBatchFrameRateThrottle().allow_request(self.other_request, _BatchView(5)))
+        self.assertFalse(SessionBatchFrameRateThrottle().allow_request(self.other_request, _BatchView(1)))
+        self.assertTrue(SessionBatchFrameRateThrottle().allow_request(self.request, _BatchView(5)))
+
+
+class BufferedLogWriterTests(SimpleTestCase):
+    def test_spill_file_round_trip(self):
+        """Las entradas volcadas a archivo se cargan con su fecha original"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'logs.jsonl')
+            writer = BufferedModelWriter(
+                'face_recognition_app.FaceVerificationLog', max_size=10, flush_interval=60, spill_path=path
+            )
+            writer.add(user_id=None, session_id=3, status='failed', confidence_score=0.71)
+            writer.add(status='error', error_message="Sin rostro")
+            self.assertEqual(writer.pending(), 2)
+            self.assertEqual(writer.flush(), 2)
+            self.assertEqual(writer.pending(), 0)
+            with open(path, encoding='utf-8') as spill_file:
+                instances = load_spilled_entries(spill_file)
+
+        [logs] = instances.values()
+        self.assertIs(list(instances)[0], FaceVerificationLog)
+        self.assertEqual([log.status for log in logs], ['failed', 'error'])
+        self.assertEqual((logs[0].session_id, logs[0].confidence_score), (3, 0.71))
+        self.assertIsNotNone(logs[1].created_at.tzinfo)
+
+    def _spilling_writer(self, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # El hilo del writer sigue vivo tras la prueba: que no vuelva a despertar
+        patcher = mock.patch('face_recognition_app.log_buffer.atexit.register')
+        self.atexit_register = patcher.start()
+        self.addCleanup(patcher.stop)
+        writer = BufferedModelWriter(
+            'face_recognition_app.FaceVerificationLog', spill_path=os.path.join(directory.name, 'logs.jsonl'), **options
+        )
+        self.addCleanup(setattr, writer, 'flush_interval', 3600)
+        return writer
+
+    def _wait_until_flushed(self, writer):
+        for _ in range(100):
+            if writer.pending() == 0 and os.path.exists(writer.spill_path):
+                with open(writer.spill_path, encoding='utf-8') as spill_file:
+                    return len(spill_file.readlines())
+            time.sleep(0.01)
+        self.fail('El buffer no se vació')
+
+    def test_full_buffer_is_flushed_without_waiting_interval(self):
+        writer = self._spilling_writer(max_size=2, flush_interval=3600)
+        writer.add(status='failed')
+        time.sleep(0.05)
+        self.assertEqual(writer.pending(), 1)
+        writer.add(status='failed')
+        self.assertEqual(self._wait_until_flushed(writer), 2)
+
+    def test_buffer_is_flushed_after_interval(self):
+        writer = self._spilling_writer(max_size=100, flush_interval=0.05)
+        writer.add(status='failed')
+        self.assertEqual(self._wait_until_flushed(writer), 1)
+
+    def test_pending_entries_are_flushed_at_exit(self):
+        writer = self._spilling_writer(max_size=100, flush_interval=3600)
+        writer.add(status='failed')
+        self.atexit_register.assert_called_once_with(writer.flush)
+        self.atexit_register.call_args.args[0]()
+        self.assertEqual(self._wait_until_flushed(writer), 1)
+
+
+class BufferedLogWriterDatabaseTests(TestCase):
+    def test_invalid_entry_does_not_discard_the_batch(self):
+        writer = BufferedModelWriter('face_recognition_app.FaceVerificationLog', max_size=0, flush_interval=60)
+        # Sin pasar por add(): con max_size = 0 escribiría al instante
+        writer._entries = [
+            {'status': 'failed', 'created_at': timezone.now()},
+            {'status': None, 'created_at': timezone.now()},
+            {'status': 'error', 'created_at': timezone.now()},
+        ]
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(sorted(FaceVerificationLog.objects.values_list('status', flat=True)), ['error', 'failed'])
+
+
+class SettingsCacheTests(SimpleTestCase):
+    def setUp(self):
+        # La caché de pruebas es memoria local: se trata como compartida entre los "workers" del test
+        patcher = mock.patch.object(settings_cache, 'cache_is_shared', return_value=True)
+        self.cache_is_shared = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reloads_only_when_version_changes(self):
+        """Dentro del TTL no se consulta nada; tras invalidar, otro proceso recarga"""
+        loads = []
+
+        def loader():
+            loads.append(len(loads))
+            return loads[-1]
+
+        worker_a = SettingsCache(loader, ttl=0, version_key='tests:settings_version')
+        worker_b = SettingsCache(loader, ttl=60, version_key='tests:settings_version')
+        self.assertEqual((worker_a.get(), worker_a.get()), (0, 0))
+        self.assertEqual(worker_b.get(), 1)
+        worker_b.invalidate()
+        self.assertEqual(worker_a.get(), 2)
+        self.assertEqual(len(loads), 3)
+
+    def test_loader_may_invalidate(self):
+        """Crear la fila por defecto dentro del loader dispara invalidate() sin bloquearse"""
+        def loader():
+            settings_cache.invalidate()
+            return 'creada'
+
+        settings_cache = SettingsCache(loader, ttl=60, version_key='tests:settings_version_created')
+        self.assertEqual(settings_cache.get(), 'creada')
+
+    def test_reloads_every_ttl_without_shared_cache(self):
+        """Con caché por proceso la versión no avisa a otros workers: se recarga por tiempo"""
+        self.cache_is_shared.return_value = False
+        loads = []
+
+        def loader():
+            loads.append(len(loads))
+            return loads[-1]
+
+        expired = SettingsCache(loader, ttl=0, version_key='tests:settings_version_local')
+        self.assertEqual((expired.get(), expired.get()), (0, 1))
+        fresh = SettingsCache(loader, ttl=60, version_key='tests:settings_version_local')
+        self.assertEqual((fresh.get(), fresh.get()), (2, 2))
+        self.assertIsNone(cache.get('tests:settings_version_local'))
+
+
+class QuantizationTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.gallery = (rng.normal(0, 0.08, 128) + rng.normal(0, 0.056, (50, 128))).astype(np.float32)
+        self.probes = self.gallery[:5] + rng.normal(0, 0.03, (5, 128)).astype(np.float32)
+
+    def test_quantized_distances_close_to_exact(self):
+        """float16 e int8 ocupan menos memoria y se desvían poco de float32"""
+        exact = QuantizedMatrix(self.gallery).distances(self.probes)
+        for precision, max_error in (('float16', 1e-3), ('int8', 2e-2)):
+            matrix = QuantizedMatrix(self.gallery, precision)
+            self.assertLess(matrix.nbytes, self.gallery.nbytes)
+            np.testing.assert_allclose(matrix.distances(self.probes), exact, atol=max_error)
+
+    def test_rerank_uses_exact_values_near_tolerance(self):
+        """Las distancias cercanas a la tolerancia se recalculan con los valores exactos"""
+        student_ids = np.arange(10, 60, dtype=np.int64)
+        exact_distances = QuantizedMatrix(self.gallery).distances(self.probes[:1])
+        tolerance = float(exact_distances[0, 0])
+        gallery = FaceGallery(
+            1, student_ids, self.gallery, precision='int8',
+            exact_loader=lambda ids: (ids, self.gallery[ids - 10]),
+        )
+        [match] = match_faces(self.probes[:1], gallery, tolerance, rerank_margin=0.05)
+        self.assertEqual(match.student_id, 10)
+        self.assertAlmostEqual(match.distance, tolerance, places=5)
+        self.assertLess(gallery.memory_usage()['encodings'], self.gallery.nbytes / 3)
+
+    def test_exact_centroids_are_loaded_once_per_gallery(self):
+        """Las filas ya recalculadas no vuelven a consultarse en cada frame"""
+        student_ids = np.arange(10, 60, dtype=np.int64)
+        tolerance = float(QuantizedMatrix(self.gallery).distances(self.probes[:1])[0, 0])
+        loaded = []
+
+        def exact_loader(ids):
+            loaded.append(ids.tolist())
+            present = ids[ids != 11]
+            return present, self.gallery[present - 10]
+
+        gallery = FaceGallery(1, student_ids, self.gallery, precision='int8', exact_loader=exact_loader)
+        for _ in range(3):
+            [match] = match_faces(self.probes[:1], gallery, tolerance, rerank_margin=0.05)
+            self.assertEqual(match.student_id, 10)
+        self.assertEqual(len(loaded), 1)
+
+        # Solo se consultan las filas que faltan; un estudiante ausente tampoco se vuelve a pedir
+        new_rows = [row for row in (0, 1, 2) if row not in gallery.exact_cache]
+        for _ in range(2):
+            exact, found = gallery.exact_encodings([0, 1, 2])
+        self.assertEqual(loaded[1:], [[10 + row for row in new_rows]] if new_rows else [])
+        np.testing.assert_array_equal(exact[0], self.gallery[0])
+        self.assertEqual(found.tolist(), [True, False, True])
+        # El estudiante 11 (fila 1) se recuerda como ausente y no ocupa memoria
+        self.assertEqual(gallery.memory_usage()['exact_cache'], (len(gallery.exact_cache) - 1) * 128 * 4)
+
+
+def _create_session(student_count=3, start_delta=timedelta(hours=1), permisividad=0):
+    """Instructor, ficha con student_count aprendices y una sesión activa que empieza en now + start_delta"""
+    User = get_user_model()
+    instructor = User.objects.create_user(username='instructor', role='instructor')
+    students = [
+        User.objects.create_user(
+            username=f'aprendiz{index}', first_name=f'Aprendiz {index}', student_id=f'10{index}',
+        )
+        for index in range(student_count)
+    ]
+    ficha = Ficha.objects.create(programa_formacion='ADSO', numero_ficha='2670001', instructor=instructor)
+    ficha.students.add(*students)
+    start = timezone.now() + start_delta
+    session = AttendanceSession.objects.create(
+        ficha=ficha, date=start.date(), start_time=start.time(),
+        end_time=(start + timedelta(hours=2)).time(), permisividad=permisividad,
+    )
+    for student in students:
+        Attendance.objects.create(session=session, student=student)
+    return instructor, students, session
+
+
+class CheckInStudentsTests(TestCase):
+    def test_absent_students_are_marked_present(self):
+        _, students, session = _create_session()
+        result = check_in_students(session.id, [students[0].id, students[1].id])
+        self.assertEqual(sorted(entry['id'] for entry in result['checked_in']), [students[0].id, students[1].id])
+        self.assertEqual({entry['status'] for entry in result['checked_in']}, {'present'})
+        self.assertEqual((result['unchanged'], result['not_enrolled']), ([], []))
+        record = Attendance.objects.get(session=session, student=students[0])
+        self.assertEqual(record.status, 'present')
+        self.assertTrue(record.verified_by_face)
+        self.assertIsNotNone(record.check_in_time)
+        self.assertEqual(Attendance.objects.get(session=session, student=students[2]).status, 'absent')
+
+    def test_students_after_grace_period_are_late(self):
+        _, students, session = _create_session(start_delta=-timedelta(minutes=30), permisividad=10)
+        [entry] = check_in_students(session.id, [students[0].id])['checked_in']
+        self.assertEqual(entry['status'], 'late')
+        self.assertEqual(Attendance.objects.get(pk=entry['attendance_id']).status, 'late')
+
+    def test_existing_status_is_left_alone(self):
+        """Un presente, tardanza o excusa previa no se sobreescribe ni se reporta como nuevo"""
+        _, students, session = _create_session()
+        Attendance.objects.filter(session=session, student=students[0]).update(status='late')
+        Attendance.objects.filter(session=session, student=students[1]).update(status='excused')
+        result = check_in_students(session.id, [students[0].id, students[1].id])
+        self.assertEqual(result['checked_in'], [])
+        self.assertEqual(result['unchanged'], sorted([students[0].id, students[1].id]))
+        self.assertEqual(
+            list(Attendance.objects.filter(session=session).order_by('student_id').values_list('status', flat=True)),
+            ['late', 'excused', 'absent'],
+        )
+        # Repetir el registro de un presente tampoco cambia nada
+        check_in_students(session.id, [students[2].id])
+        self.assertEqual(check_in_students(session.id, [students[2].id])['unchanged'], [students[2].id])
+
+    def test_students_outside_the_session_are_not_enrolled(self):
+        _, students, session = _create_session()
+        outsider = get_user_model().objects.create_user(username='visitante')
+        result = check_in_students(session.id, [students[0].id, outsider.id])
+        self.assertEqual([entry['id'] for entry in result['checked_in']], [students[0].id])
+        self.assertEqual(result['not_enrolled'], [outsider.id])
+        self.assertFalse(Attendance.objects.filter(session=session, student=outsider).exists())
+        self.assertEqual(check_in_students(session.id, []), {'checked_in': [], 'unchanged': [], 'not_enrolled': []})
+
+
+class _WebSocketClient:
+    """scope, receive y send falsos para probar la aplicación ASGI de streaming.py"""
+
+    def __init__(self, path, token=None):
+        self.scope = {'type': 'websocket', 'path': path, 'query_string': f'token={token}'.encode() if token else b''}
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+        self.task = asyncio.ensure_future(recognition_websocket(self.scope, self.inbox.get, self.outbox.put))
+
+    async def next_message(self):
+        message = await asyncio.wait_for(self.outbox.get(), timeout=5)
+        return json.loads(message['text']) if message['type'] == 'websocket.send' else message
+
+    async def send_frame(self, frame):
+        await self.inbox.put({'type': 'websocket.receive', 'bytes': frame})
+        while not self.inbox.empty():
+            await asyncio.sleep(0)
+
+    async def disconnect(self):
+        await self.inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+# Los hilos de sync_to_async usan su propia conexión: los datos deben estar confirmados
+class RecognitionStreamTests(TransactionTestCase):
+    def setUp(self):
+        self.instructor, _, self.session = _create_session(student_count=1)
+        self.path = f'/ws/recognize/{self.session.id}/'
+
+    async def test_invalid_token_is_rejected(self):
+        for token in (None, 'no-es-un-jwt'):
+            client = _WebSocketClient(self.path, token)
+            self.assertEqual(await client.next_message(), {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+    async def test_only_the_instructor_of_an_active_session_connects(self):
+        other = await sync_to_async(get_user_model().objects.create_user)(username='otro', role='instructor')
+        client = _WebSocketClient(self.path, str(AccessToken.for_user(other)))
+        self.assertEqual(await client.next_message(), {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+        client = _WebSocketClient('/ws/recognize/999999/', str(AccessToken.for_user(self.instructor)))
+        self.assertEqual(await client.next_message(), {'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+
+        await sync_to_async(AttendanceSession.objects.filter(pk=self.session.pk).update)(is_active=False)
+        client = _WebSocketClient(self.path, str(AccessToken.for_user(self.instructor)))
+        self.assertEqual(await client.next_message(), {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    async def test_pending_frames_are_replaced_by_the_latest(self):
+        """Mientras se reconoce un frame, de los que llegan solo se conserva el último"""
+        started, release, recognized = asyncio.Event(), asyncio.Event(), []
+
+        async def recognize(frame, session_id):
+            recognized.append(frame)
+            started.set()
+            await release.wait()
+            return {'recognized_students': [], 'already_checked_in': [], 'tracked_faces': 0}
+
+        with mock.patch('face_recognition_app.streaming.recognize_frame', recognize):
+            client = _WebSocketClient(self.path, str(AccessToken.for_user(self.instructor)))
+            self.assertEqual((await client.next_message())['type'], 'websocket.accept')
+            self.assertEqual(await client.next_message(), {'type': 'ready', 'session_id': self.session.id})
+
+            await client.send_frame(b'1')
+            await asyncio.wait_for(started.wait(), timeout=5)
+            for frame in (b'2', b'3', b'4'):
+                await client.send_frame(frame)
+            release.set()
+            first, second = await client.next_message(), await client.next_message()
+            await client.disconnect()
+
+        self.assertEqual(recognized, [b'1', b'4'])
+        self.assertEqual((first['seq'], first['dropped']), (1, 2))
+        self.assertEqual((second['seq'], second['dropped']), (4, 2))
+
+
+class BatchRecognitionTests(TestCase):
+    """recognize/batch/ con la detección y codificación simuladas por nombre de archivo"""
+
+    def setUp(self):
+        self.instructor, self.students, self.session = _create_session(student_count=2)
+        self.encodings = np.zeros((2, 128), dtype=np.float32)
+        self.encodings[0, 0] = self.encodings[1, 1] = 0.5
+        for student, encoding in zip(self.students, self.encodings):
+            FaceEncoding.objects.create(user=student, encoding_data=pack_encoding(encoding))
+        cache.clear()
+
+        frames = {
+            'ana.jpg': [self.encodings[0]],
+            'ambos.jpg': [self.encodings[0], self.encodings[1]],
+            'vacio.jpg': [],
+        }
+
+        def encode_image(image_file, profile, skip_boxes=(), timer=None, known_locations=None):
+            if image_file.name == 'roto.jpg':
+                raise ValueError('imagen dañada')
+            if image_file.name == 'ocupado.jpg':
+                raise InferenceBusy()
+            encodings = frames[image_file.name]
+            return [(0, 50 * (i + 1), 50, 50 * i) for i in range(len(encodings))], encodings
+
+        for target, attribute, value in (
+            (services, 'encode_image', encode_image),
+            (frame_cache, 'max_age', 0),
+            (services.session_trackers, 'max_age', 0),
+            (services.verification_log, 'add', mock.DEFAULT),
+            (services.recognition_metrics, 'add', mock.DEFAULT),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.instructor)
+
+    def _post(self, *names):
+        images = [SimpleUploadedFile(name, b'jpeg', content_type='image/jpeg') for name in names]
+        return self.client.post(
+            '/api/v1/face/recognize/batch/', {'session_id': self.session.id, 'images': images}, format='multipart',
+        )
+
+    def test_check_ins_are_aggregated_across_frames(self):
+        response = self._post('ana.jpg', 'ambos.jpg')
+        self.assertEqual(response.status_code, 200)
+        first, second = response.data['frames']
+        self.assertEqual([student['id'] for student in first['recognized_students']], [self.students[0].id])
+        self.assertEqual([student['id'] for student in second['recognized_students']], [self.students[1].id])
+        self.assertEqual(second['already_checked_in'], [self.students[0].id])
+        self.assertEqual(
+            sorted(student['id'] for student in response.data['recognized_students']),
+            sorted(student.id for student in self.students),
+        )
+        self.assertEqual(services.recognition_metrics.add.call_count, 2)
+
+    def test_errors_are_reported_per_frame(self):
+        """Un frame ilegible o sin rostros no impide procesar los demás"""
+        response = self._post('roto.jpg', 'vacio.jpg', 'ana.jpg')
+        self.assertEqual(response.status_code, 200)
+        broken, empty, recognized = response.data['frames']
+        self.assertEqual((broken['frame'], broken['name']), (0, 'roto.jpg'))
+        self.assertIn('imagen dañada', broken['error'])
+        self.assertEqual(empty['error'], "No se detectó ningún rostro en la imagen.")
+        self.assertEqual([student['id'] for student in recognized['recognized_students']], [self.students[0].id])
+        self.assertEqual([student['id'] for student in response.data['recognized_students']], [self.students[0].id])
+
+    def test_saturation_mid_batch_returns_processed_frames(self):
+        """Las asistencias de los frames ya procesados llegan al cliente junto con los pendientes"""
+        response = self._post('ana.jpg', 'ocupado.jpg', 'ambos.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['frames']), 1)
+        self.assertEqual([student['id'] for student in response.data['recognized_students']], [self.students[0].id])
+        self.assertTrue(response.data['busy'])
+        self.assertEqual(response.data['retry_after'], InferenceBusy.wait)
+        self.assertEqual(response['Retry-After'], str(InferenceBusy.wait))
+        self.assertEqual(
+            response.data['pending_frames'], [{'frame': 1, 'name': 'ocupado.jpg'}, {'frame': 2, 'name': 'ambos.jpg'}],
+        )
+        self.assertFalse(Attendance.objects.filter(session=self.session, student=self.students[1]).exclude(
+            status='absent').exists())
+
+    def test_saturation_on_first_frame_is_503(self):
+        response = self._post('ocupado.jpg', 'ana.jpg')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(Attendance.objects.filter(session=self.session).exclude(status='absent').exists())
+
+    @override_settings(FACE_BATCH_MAX_FRAMES=2)
+    def test_frame_count_is_limited(self):
+        response = self._post('ana.jpg', 'ambos.jpg', 'vacio.jpg')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Se permiten como máximo 2 imágenes por solicitud.')
+        self.assertFalse(Attendance.objects.filter(session=self.session).exclude(status='absent').exists())
+
+
+class FaceJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = get_user_model().objects.create_user(username='aprendiz')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def _create_job(self, **fields):
+        image = SimpleUploadedFile('rostro.jpg', _jpeg_bytes(np.zeros((8, 8, 3), dtype=np.uint8)))
+        return FaceRecognitionJob.objects.create(kind='registration', user=self.user, image=image, **fields)
+
+    @override_settings(CELERY_BROKER_URL=None)
+    def test_job_runs_locally_after_commit_without_celery(self):
+        executor = mock.Mock()
+        with mock.patch.object(jobs, '_get_local_executor', return_value=executor):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(
+                    '/api/v1/face/register/jobs/',
+                    {'profile_image': SimpleUploadedFile('rostro.jpg', b'jpeg')}, format='multipart',
+                )
+                executor.submit.assert_not_called()
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['status'], 'pending')
+            self.assertEqual(len(callbacks), 1)
+            callbacks[0]()
+        executor.submit.assert_called_once_with(jobs._run_locally, str(response.data['id']))
+
+    @override_settings(CELERY_BROKER_URL='redis://localhost:6379/0')
+    def test_job_is_sent_to_celery_after_commit(self):
+        job = self._create_job()
+        with mock.patch('face_recognition_app.tasks.run_face_job.delay') as delay, \
+                mock.patch.object(jobs, '_get_local_executor') as local_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue_job(job)
+                delay.assert_not_called()
+        delay.assert_called_once_with(str(job.id))
+        local_executor.assert_not_called()
+
+    def test_registration_job_completes(self):
+        job = self._create_job()
+        with mock.patch.object(jobs, 'get_face_encoding_from_image', return_value=np.full(128, 0.1)):
+            jobs.execute_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertTrue(job.result['created'])
+        self.assertIsNotNone(job.completed_at)
+        self.assertTrue(FaceEncoding.objects.filter(user=self.user).exists())
+
+        # Un trabajo que ya no está pendiente no se vuelve a ejecutar
+        with mock.patch.object(jobs, 'get_face_encoding_from_image') as encode:
+            jobs.execute_job(job.id)
+        encode.assert_not_called()
+
+    def test_failed_jobs_keep_the_error(self):
+        job = self._create_job()
+        with mock.patch.object(jobs, 'get_face_encoding_from_image', return_value=None):
+            jobs.execute_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('única cara', job.error_message)
+
+        _, _, session = _create_session(student_count=0)
+        job = FaceRecognitionJob.objects.create(
+            kind='recognition', user=self.user, session=session,
+            image=SimpleUploadedFile('frame.jpg', b'jpeg'),
+        )
+        with mock.patch.object(jobs, 'recognize_faces_in_stream', side_effect=RuntimeError('sin memoria')):
+            jobs.execute_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('sin memoria', job.error_message)
+        self.assertFalse(job.image)
+
+    def test_job_status_is_only_visible_to_its_owner(self):
+        job = self._create_job(status='completed', result={'created': True})
+        response = self.client.get(f'/api/v1/face/jobs/{job.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['result']), ('completed', {'created': True}))
+
+        self.client.force_authenticate(get_user_model().objects.create_user(username='otro'))
+        self.assertEqual(self.client.get(f'/api/v1/face/jobs/{job.id}/').status_code, 404)
+
+
+class ReencodingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # Cada imagen de prueba es un número: la codificación es ese número repetido
+        patcher = mock.patch.object(reencoding, 'encode_enrollment_images', side_effect=lambda images, profile, pool: [
+            (1, np.full(128, float(image.decode()), dtype=np.float32), None) for image in images
+        ])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.profile = RecognitionProfile()
+
+    def _create_encoding(self, username, template_images=(), profile_image=None):
+        user = get_user_model().objects.create_user(username=username)
+        face_encoding = FaceEncoding.objects.create(
+            user=user, encoding_data=pack_encoding(np.zeros(128)), model_version='antigua',
+            profile_image=profile_image and default_storage.save('face_profiles/rostro.jpg', ContentFile(profile_image)),
+        )
+        for image in template_images:
+            FaceTemplate.objects.create(
+                face_encoding=face_encoding, encoding_data=pack_encoding(np.zeros(128)),
+                image=default_storage.save('face_templates/rostro.jpg', ContentFile(image)),
+            )
+        return face_encoding
+
+    def _reencode(self, *face_encodings, dry_run=False):
+        rows = FaceEncoding.objects.filter(id__in=[face_encoding.id for face_encoding in face_encodings]).order_by(
+            'id').values_list('id', 'user_id', 'profile_image', 'encoding_data')
+        return reencoding.reencode_chunk(rows, self.profile, dry_run=dry_run)
+
+    def test_templates_and_centroid_are_updated_with_model_version(self):
+        face_encoding = self._create_encoding('aprendiz', [b'1', b'3'])
+        result = self._reencode(face_encoding)
+        self.assertEqual((result['updated'], result['failed']), (1, {}))
+        face_encoding.refresh_from_db()
+        self.assertEqual(face_encoding.model_version, self.profile.model_version)
+        self.assertEqual(face_encoding.template_count, 2)
+        self.assertTrue(np.allclose(unpack_encoding(face_encoding.encoding_data), 2))
+        self.assertEqual(
+            sorted(float(unpack_encoding(data)[0]) for data in face_encoding.templates.values_list('encoding_data', flat=True)),
+            [1.0, 3.0],
+        )
+
+    def test_profile_image_fallback_creates_the_missing_template(self):
+        face_encoding = self._create_encoding('aprendiz', profile_image=b'2')
+        self.assertEqual(self._reencode(face_encoding)['updated'], 1)
+        face_encoding.refresh_from_db()
+        templates = list(face_encoding.templates.all())
+        self.assertEqual(face_encoding.template_count, len(templates))
+        self.assertEqual(len(templates), 1)
+        self.assertEqual(templates[0].image.name, face_encoding.profile_image.name)
+        self.assertTrue(np.allclose(unpack_encoding(templates[0].encoding_data), 2))
+
+    def test_rows_with_missing_images_are_skipped(self):
+        without_image = self._create_encoding('sin_imagen')
+        deleted_file = self._create_encoding('archivo_borrado', [b'1'])
+        default_storage.delete(deleted_file.templates.get().image.name)
+        result = self._reencode(without_image, deleted_file)
+        self.assertEqual((result['updated'], result['failed']), (0, {'missing_image': 2}))
+        self.assertFalse(FaceEncoding.objects.exclude(model_version='antigua').exists())
+        self.assertFalse(FaceTemplate.objects.filter(face_encoding=without_image).exists())
+
+    def test_rows_whose_templates_changed_during_the_run_are_skipped(self):
+        face_encoding = self._create_encoding('aprendiz', [b'1'])
+        encode = reencoding.encode_enrollment_images.side_effect
+
+        def encode_and_enroll(images, profile, pool):
+            # El aprendiz registra otra foto mientras se recalculan las codificaciones
+            FaceTemplate.objects.create(face_encoding=face_encoding, encoding_data=pack_encoding(np.zeros(128)))
+            return encode(images, profile, pool)
+
+        reencoding.encode_enrollment_images.side_effect = encode_and_enroll
+        result = self._reencode(face_encoding)
+        self.assertEqual((result['updated'], result['failed']), (0, {'changed_during_run': 1}))
+        face_encoding.refresh_from_db()
+        self.assertEqual(face_encoding.model_version, 'antigua')
+        self.assertFalse(any(
+            unpack_encoding(data).any() for data in face_encoding.templates.values_list('encoding_data', flat=True)
+        ))
+
+    def test_command_rebuilds_index_once(self):
+        """Las tandas no tocan el índice de duplicados; se reconstruye una vez al terminar"""
+        for index in range(3):
+            self._create_encoding(f'aprendiz{index}', [str(index + 1).encode()])
+        with mock.patch.object(face_index, 'rebuild', return_value=3) as rebuild, \
+                mock.patch.object(face_index, 'update') as update:
+            call_command('reencode_faces', '--workers', '0', '--dry-run', stdout=StringIO(), stderr=StringIO())
+            rebuild.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command(
+                    'reencode_faces', '--workers', '0', '--chunk-size', '1', stdout=StringIO(), stderr=StringIO(),
+                )
+        rebuild.assert_called_once()
+        update.assert_not_called()
+        self.assertFalse(FaceEncoding.objects.exclude(model_version=self.profile.model_version).exists())
+
+    def test_dry_run_writes_nothing(self):
+        face_encoding = self._create_encoding('aprendiz', profile_image=b'2')
+        result = self._reencode(face_encoding, dry_run=True)
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(len(result['shifts']), 1)
+        self.assertAlmostEqual(result['shifts'][0], float(np.linalg.norm(np.full(128, 2.0))), places=4)
+        face_encoding.refresh_from_db()
+        self.assertEqual(face_encoding.model_version, 'antigua')
+        self.assertFalse(face_encoding.templates.exists())
+
+
+class WarmupTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(warmup, '_started', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_warmup_runs_once_per_process(self):
+        report = {'image': 'sintética', 'model_load_ms': 1.0, 'first': {}, 'steady': {}, 'total_ms': 2.0}
+        with mock.patch.object(warmup, 'run_warmup', return_value=report) as run_warmup:
+            self.assertEqual(warmup.warmup_on_startup(), report)
+            self.assertIsNone(warmup.warmup_on_startup())
+        run_warmup.assert_called_once()
+
+    def test_each_pool_worker_is_warmed_once(self):
+        pool = mock.Mock(workers=3)
+        pool.run_on_workers.return_value = [{'faces': 0}] * 3
+        profile = RecognitionProfile()
+        with mock.patch('face_recognition_app.pipeline.warm_up_bytes', return_value={'faces': 0}) as warm_up_bytes, \
+                mock.patch('face_recognition_app.inference.inference_pool', pool):
+            report = warmup.run_warmup(profile)
+        # Dos inferencias en este proceso y una tanda (una tarea por proceso) en el pool
+        self.assertEqual(warm_up_bytes.call_count, 2)
+        pool.run_on_workers.assert_called_once_with(warm_up_bytes, mock.ANY, profile)
+        self.assertEqual(len(report['pool_workers']), 3)
+
+    @override_settings(FACE_WARMUP=True)
+    def test_failed_warmup_does_not_stop_startup(self):
+        with mock.patch.object(warmup, 'run_warmup', side_effect=RuntimeError('sin modelos')) as run_warmup:
+            apps.get_app_config('face_recognition_app').ready()
+            self.assertIsNone(warmup.warmup_on_startup())
+        run_warmup.assert_called_once()
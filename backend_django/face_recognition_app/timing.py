@@ -0,0 +1,60 @@
+# face_recognition_app/timing.py
+"""
+Tiempos por etapa del reconocimiento de un frame.
+
+recognize_faces_in_stream mide con un StageTimer cada etapa:
+settings, gallery, dedup, admission (espera de turno, ver admission.py),
+decode, detection, encoding, inference_wait (cola del pool y envío entre
+procesos), matching, check_in y logging. Las etapas no se solapan, así su
+suma se acerca al total. El resultado se guarda en RecognitionMetric (ver
+metrics.py) y, si el cliente envía la cabecera X-Face-Timing, se devuelve
+en la respuesta.
+"""
+import time
+from contextlib import contextmanager
+
+STAGES = (
+    'settings', 'gallery', 'dedup', 'admission', 'decode', 'detection', 'encoding',
+    'inference_wait', 'matching', 'check_in', 'logging',
+)
+
+
+class StageTimer:
+    """Acumula milisegundos por etapa; una etapa puede medirse varias veces"""
+
+    def __init__(self):
+        self.stages = {}
+        self.outcome = None
+        self.faces = 0
+        # 'server', 'client_boxes', 'client_crops' o 'client_fallback' (ver services.py)
+        self.detection_source = None
+        self.total_ms = None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name, elapsed_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def stop(self):
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self._started) * 1000
+        return self.total_ms
+
+    def rounded_stages(self):
+        return {name: round(elapsed, 2) for name, elapsed in self.stages.items()}
+
+    def as_dict(self):
+        return {'total_ms': round(self.stop(), 2), 'stages': self.rounded_stages()}
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing (visible en las herramientas del navegador)"""
+        entries = [f"{name};dur={elapsed:.1f}" for name, elapsed in self.stages.items()]
+        entries.append(f"total;dur={self.stop():.1f}")
+        return ', '.join(entries)
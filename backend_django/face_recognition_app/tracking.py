@@ -0,0 +1,194 @@
+# face_recognition_app/tracking.py
+"""
+Seguimiento ligero de rostros entre frames consecutivos de una sesión.
+
+Las cajas detectadas en un frame se asocian a las pistas del frame anterior
+por IoU (o, si la cara se movió más, por cercanía de centroides). Una pista
+confirmada (identificada varias veces seguidas como el mismo estudiante) no
+vuelve a codificarse ni a compararse: su asistencia ya quedó registrada.
+Tampoco una pista agotada, que no coincidió con nadie en
+max_verification_attempts comparaciones seguidas (p. ej. un visitante): se
+vuelve a intentar una vez cada retry_cooldown segundos, por si los primeros
+frames estaban borrosos o la cara estaba de lado.
+
+Las funciones de asociación no dependen de Django porque también se usan en
+los procesos del pool de inferencia (ver pipeline.py).
+"""
+import itertools
+import threading
+import time
+
+MIN_IOU = 0.4
+# Desplazamiento máximo del centroide, relativo al tamaño de la caja
+MAX_CENTROID_SHIFT = 0.5
+
+
+def box_iou(a, b):
+    """IoU de dos cajas (top, right, bottom, left)"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, bottom - top) * max(0, right - left)
+    area_a = max(0, a[2] - a[0]) * max(0, a[1] - a[3])
+    area_b = max(0, b[2] - b[0]) * max(0, b[1] - b[3])
+    union = area_a + area_b - intersection
+    return intersection / union if union else 0.0
+
+
+def _centroid_shift(a, b):
+    """Distancia entre centroides relativa al tamaño medio de las cajas"""
+    dy = (a[0] + a[2] - b[0] - b[2]) / 2
+    dx = (a[1] + a[3] - b[1] - b[3]) / 2
+    size = ((a[2] - a[0]) + (a[1] - a[3]) + (b[2] - b[0]) + (b[1] - b[3])) / 4
+    return (dx * dx + dy * dy) ** 0.5 / size if size > 0 else float('inf')
+
+
+def associate(locations, boxes, min_iou=MIN_IOU):
+    """
+    Asocia cada ubicación con a lo sumo una caja, empezando por los pares con
+    mayor IoU. Devuelve {índice_de_ubicación: índice_de_caja}.
+    """
+    candidates = []
+    for location_index, location in enumerate(locations):
+        for box_index, box in enumerate(boxes):
+            overlap = box_iou(location, box)
+            shift = _centroid_shift(location, box)
+            if overlap >= min_iou or shift <= MAX_CENTROID_SHIFT:
+                candidates.append((-overlap, shift, location_index, box_index))
+    candidates.sort()
+
+    assigned = {}
+    used_boxes = set()
+    for _, _, location_index, box_index in candidates:
+        if location_index in assigned or box_index in used_boxes:
+            continue
+        assigned[location_index] = box_index
+        used_boxes.add(box_index)
+    return assigned
+
+
+class FaceTrack:
+    __slots__ = ('id', 'box', 'student_id', 'hits', 'attempts', 'failed_at', 'last_seen')
+
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.student_id = None
+        self.hits = 0
+        self.attempts = 0  # comparaciones seguidas sin coincidencia
+        self.failed_at = None  # hora de la última de ellas
+        self.last_seen = now
+
+
+class SessionTracker:
+    """Pistas activas de una sesión de asistencia"""
+
+    def __init__(self, confirm_hits, max_age, retry_cooldown=0):
+        self.confirm_hits = confirm_hits
+        self.max_age = max_age
+        self.retry_cooldown = retry_cooldown
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.last_update = time.monotonic()
+
+    def is_confirmed(self, track):
+        return track.student_id is not None and track.hits >= self.confirm_hits
+
+    def is_exhausted(self, track, max_attempts, now):
+        """Sin coincidencia en max_attempts comparaciones y sin cumplir aún el tiempo de reintento"""
+        return (
+            max_attempts > 0 and track.student_id is None and track.attempts >= max_attempts
+            and now - track.failed_at < self.retry_cooldown
+        )
+
+    def confirmed_tracks(self, max_attempts=0):
+        """
+        Pistas confirmadas o agotadas (max_attempts > 0) y vigentes; sus cajas
+        se pasan al pipeline para no codificarlas
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                track for track in self.tracks
+                if (self.is_confirmed(track) or self.is_exhausted(track, max_attempts, now))
+                and now - track.last_seen <= self.max_age
+            ]
+
+    def update(self, locations, confirmed):
+        """
+        Asocia las ubicaciones del frame a pistas y devuelve una pista por
+        ubicación. `confirmed` debe ser la misma lista usada para decidir qué
+        rostros no se codificaban, para que ambas asociaciones coincidan.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.last_update = now
+            self.tracks = [
+                track for track in self.tracks
+                if now - track.last_seen <= self.max_age or any(track is c for c in confirmed)
+            ]
+            result = [None] * len(locations)
+
+            for location_index, track_index in associate(locations, [t.box for t in confirmed]).items():
+                result[location_index] = confirmed[track_index]
+
+            remaining = [i for i, track in enumerate(result) if track is None]
+            others = [track for track in self.tracks if not any(track is c for c in confirmed)]
+            matches = associate([locations[i] for i in remaining], [t.box for t in others])
+            for position, track_index in matches.items():
+                result[remaining[position]] = others[track_index]
+
+            for location_index, track in enumerate(result):
+                if track is None:
+                    track = FaceTrack(next(self._ids), locations[location_index], now)
+                    self.tracks.append(track)
+                    result[location_index] = track
+                track.box = locations[location_index]
+                track.last_seen = now
+            return result
+
+    def record_match(self, track, student_id):
+        """Registra el resultado de la comparación de una pista no confirmada"""
+        with self._lock:
+            if student_id is not None and track.student_id == student_id:
+                track.hits += 1
+            else:
+                track.student_id = student_id
+                track.hits = 1 if student_id is not None else 0
+            if student_id is None:
+                track.attempts += 1
+                track.failed_at = time.monotonic()
+            else:
+                track.attempts = 0
+
+
+class TrackerRegistry:
+    """Un SessionTracker por sesión, descartado cuando la sesión deja de enviar frames"""
+
+    def __init__(self, confirm_hits, max_age, retry_cooldown=0):
+        self.confirm_hits = confirm_hits
+        self.max_age = max_age
+        self.retry_cooldown = retry_cooldown
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_age > 0
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, tracker in self._trackers.items() if now - tracker.last_update > self.max_age * 10]
+            for key in idle:
+                del self._trackers[key]
+            tracker = self._trackers.get(session_id)
+            if tracker is None:
+                tracker = self._trackers[session_id] = SessionTracker(
+                    self.confirm_hits, self.max_age, self.retry_cooldown
+                )
+            return tracker
+
+    def forget(self, session_id):
+        with self._lock:
+            self._trackers.pop(session_id, None)
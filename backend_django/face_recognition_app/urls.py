@@ -1,11 +1,40 @@
 # face_recognition_app/urls.py
 from django.urls import path
-from .views import FacialRegistrationView, FacialRecognitionView
+from .views import (
+    FacialRegistrationView,
+    FaceBulkEnrollmentView,
+    FacialRecognitionView,
+    FacialBatchRecognitionView,
+    FacialRegistrationJobView,
+    FacialRecognitionJobView,
+    FaceRecognitionJobDetailView,
+    FaceTemplateListView,
+    FaceTemplateDetailView,
+    FaceRecognitionMetricsView,
+)
 
 urlpatterns = [
     # Endpoint para que un estudiante registre su rostro
     path('register/', FacialRegistrationView.as_view(), name='facial-registration'),
+
+    # Endpoint para registrar los rostros de una cohorte desde un ZIP (solo administradores)
+    path('register/bulk/', FaceBulkEnrollmentView.as_view(), name='facial-bulk-registration'),
+
+    # Endpoints para consultar, agregar o eliminar plantillas del propio rostro
+    path('templates/', FaceTemplateListView.as_view(), name='face-template-list'),
+    path('templates/<int:pk>/', FaceTemplateDetailView.as_view(), name='face-template-detail'),
     
     # Endpoint para el proceso de reconocimiento en tiempo real
     path('recognize/', FacialRecognitionView.as_view(), name='facial-recognition'),
+
+    # Endpoint para reconocer varios frames de una sesión en una sola solicitud
+    path('recognize/batch/', FacialBatchRecognitionView.as_view(), name='facial-batch-recognition'),
+
+    # Endpoints asíncronos: devuelven el ID de un trabajo que se consulta en jobs/<id>/
+    path('register/jobs/', FacialRegistrationJobView.as_view(), name='facial-registration-job'),
+    path('recognize/jobs/', FacialRecognitionJobView.as_view(), name='facial-recognition-job'),
+    path('jobs/<uuid:pk>/', FaceRecognitionJobDetailView.as_view(), name='face-job-detail'),
+
+    # Tiempos por etapa del reconocimiento agregados en histogramas (solo administradores)
+    path('metrics/', FaceRecognitionMetricsView.as_view(), name='face-recognition-metrics'),
 ]
\ No newline at end of file
@@ -1,16 +1,40 @@
 # face_recognition_app/views.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import generics, views, permissions, status
 from rest_framework.response import Response
-from .models import FaceEncoding
-from .serializers import FaceEncodingSerializer
-from .services import get_face_encoding_from_image, recognize_faces_in_stream
+from .admission import (
+    SessionBatchFrameRateThrottle, SessionFrameRateThrottle, SessionThrottled, recognition_admission,
+)
+from .enrollment import bulk_enroll, open_image_source
+from .jobs import enqueue_job
+from .face_index import find_duplicate_face
+from .metrics import summarize_metrics
+from .models import FaceEncoding, FaceRecognitionJob, FaceTemplate, RecognitionMetric
+from .preprocessing import parse_face_boxes
+from .serializers import FaceEncodingSerializer, FaceRecognitionJobSerializer, FaceTemplateSerializer
+from .services import (
+    add_face_template,
+    count_archive_frames,
+    get_face_encoding_from_image,
+    read_archive_frames,
+    recognize_faces_in_batch,
+    recognize_faces_in_stream,
+    remove_face_template,
+    save_face_encoding,
+)
+from .timing import StageTimer
 from attendance.models import AttendanceSession
 from attendance.permissions import IsInstructorOfFicha
 
 class FacialRegistrationView(generics.CreateAPIView):
     """
     Vista para que un estudiante registre su rostro.
-    Recibe una imagen (profile_image) y la procesa para crear una codificación facial.
+    Recibe una imagen (profile_image) y la agrega como una nueva plantilla de
+    su codificación facial (ver FaceTemplateListView).
     """
     queryset = FaceEncoding.objects.all()
     serializer_class = FaceEncodingSerializer
@@ -29,45 +53,310 @@ class FacialRegistrationView(generics.CreateAPIView):
         if encoding is None:
             return Response({'error': 'No se pudo detectar una única cara en la imagen. Intente con otra foto.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Crear o actualizar el registro de FaceEncoding
-        face_encoding_obj, created = FaceEncoding.objects.update_or_create(
-            user=user,
-            defaults={'profile_image': image_file}
-        )
-        face_encoding_obj.set_encoding_array(encoding)
-        face_encoding_obj.save()
+        # Agregar la plantilla y recalcular el centroide del FaceEncoding
+        face_encoding_obj, created = save_face_encoding(user, image_file, encoding)
 
         serializer = self.get_serializer(face_encoding_obj)
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
-class FacialRecognitionView(views.APIView):
+class FaceBulkEnrollmentView(views.APIView):
+    """
+    Vista (solo administradores) para registrar los rostros de una cohorte.
+    Recibe un ZIP (archive) con fotos nombradas por student_id y devuelve
+    un resultado por archivo (ver enrollment.py). Opciones: replace para
+    reemplazar rostros ya registrados y dry_run para solo validar.
+    Para archivos muy grandes conviene `manage.py enroll_faces`.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        archive_file = request.data.get('archive')
+
+        if not archive_file:
+            return Response({'error': 'Se requiere un archivo ZIP (archive).'}, status=status.HTTP_400_BAD_REQUEST)
+
+        replace = str(request.data.get('replace', '')).lower() in ('1', 'true')
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        try:
+            with open_image_source(archive_file) as image_source:
+                report = bulk_enroll(image_source, replace=replace, dry_run=dry_run)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(report, status=status.HTTP_200_OK)
+
+class FaceTemplateListView(generics.ListCreateAPIView):
+    """
+    Vista para listar las plantillas faciales del usuario o agregar una nueva.
+    Recibe una imagen (image); la plantilla se suma a las anteriores y se
+    recalcula el centroide usado en el reconocimiento.
+    """
+    serializer_class = FaceTemplateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return FaceTemplate.objects.filter(face_encoding__user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        image_file = request.data.get('image')
+
+        if not image_file:
+            return Response({'error': 'No se proporcionó ninguna imagen.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        encoding = get_face_encoding_from_image(image_file)
+
+        if encoding is None:
+            return Response({'error': 'No se pudo detectar una única cara en la imagen. Intente con otra foto.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Una plantilla no puede ser el rostro de otro usuario
+        if find_duplicate_face(encoding, exclude_user_id=request.user.id) is not None:
+            return Response({'error': 'Este rostro ya ha sido registrado por otro usuario.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        _, template, _ = add_face_template(request.user, image_file, encoding)
+
+        serializer = self.get_serializer(template)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class FaceTemplateDetailView(generics.RetrieveDestroyAPIView):
+    """
+    Vista para consultar o eliminar una plantilla facial propia.
+    No se permite eliminar la única plantilla del usuario.
+    """
+    serializer_class = FaceTemplateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return FaceTemplate.objects.filter(face_encoding__user=self.request.user)
+
+    def destroy(self, request, *args, **kwargs):
+        error = remove_face_template(self.get_object())
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+def get_active_session(user, session_id):
+    """
+    Obtiene la sesión de asistencia indicada y verifica que el usuario sea el
+    instructor de su ficha y que la sesión esté activa. La usan las vistas
+    (ActiveSessionMixin) y el reconocimiento por WebSocket (streaming.py).
+    Devuelve (session, None) o (None, (código de estado HTTP, mensaje de error)).
+    """
+    try:
+        session = AttendanceSession.objects.select_related('ficha').get(id=session_id)
+    except AttendanceSession.DoesNotExist:
+        return None, (status.HTTP_404_NOT_FOUND, 'La sesión de asistencia no existe.')
+
+    # Verificar permisos del instructor sobre la ficha de la sesión
+    if session.ficha is None or session.ficha.instructor_id != user.id:
+        return None, (status.HTTP_403_FORBIDDEN, 'No tiene permisos sobre esta sesión.')
+
+    if not session.is_active:
+        return None, (status.HTTP_403_FORBIDDEN, 'Esta sesión de asistencia no está activa para el reconocimiento facial.')
+
+    return session, None
+
+class ActiveSessionMixin:
+    """
+    Obtiene la sesión de asistencia indicada con get_active_session.
+    Devuelve (session, None) o (None, Response de error).
+    """
+    def get_active_session(self, request, session_id):
+        session, error = get_active_session(request.user, session_id)
+        if error:
+            status_code, message = error
+            return None, Response({'error': message}, status=status_code)
+        return session, None
+
+class SessionFrameRateMixin:
+    """
+    Limita los frames por sesión de asistencia (FACE_SESSION_FRAME_RATE):
+    los excedentes reciben 429 con Retry-After antes de leer la imagen.
+    """
+    throttle_classes = [SessionFrameRateThrottle]
+
+    def throttled(self, request, wait):
+        raise SessionThrottled(wait)
+
+class FacialRecognitionView(SessionFrameRateMixin, ActiveSessionMixin, views.APIView):
     """
     Vista para el reconocimiento facial en tiempo real.
     Recibe una imagen y el ID de la sesión activa.
+    Opcionalmente acepta las cajas de rostros detectadas por el cliente
+    (face_boxes) o recortes de un solo rostro (face_crops) para omitir la
+    detección en el servidor; ver preprocessing.parse_face_boxes.
+    Con la cabecera X-Face-Timing: 1 la respuesta incluye los tiempos por
+    etapa ("timings" y la cabecera Server-Timing).
+    Bajo carga responde 429 (demasiados frames de la sesión) o 503 (sin
+    turno para reconocer), ambos con Retry-After; ver admission.py.
     """
     permission_classes = [permissions.IsAuthenticated, IsInstructorOfFicha]
 
     def post(self, request, *args, **kwargs):
         session_id = request.data.get('session_id')
         image_file = request.data.get('image')
+        face_crops = request.FILES.getlist('face_crops')
 
-        if not session_id or not image_file:
-            return Response({'error': 'Se requiere session_id y una imagen.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not session_id or not (image_file or face_crops):
+            return Response({'error': 'Se requiere session_id y una imagen o recortes de rostros.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            session = AttendanceSession.objects.get(id=session_id)
-            # Verificar permisos del instructor sobre la ficha de la sesión
-            self.check_object_permissions(request, session.ficha)
-        except AttendanceSession.DoesNotExist:
-            return Response({'error': 'La sesión de asistencia no existe.'}, status=status.HTTP_404_NOT_FOUND)
+            face_boxes = parse_face_boxes(request.data.get('face_boxes'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not session.is_active:
-            return Response({'error': 'Esta sesión de asistencia no está activa para el reconocimiento facial.'}, status=status.HTTP_403_FORBIDDEN)
+        session, error_response = self.get_active_session(request, session_id)
+        if error_response:
+            return error_response
 
         # Llamar al servicio de reconocimiento
-        result = recognize_faces_in_stream(image_file, session_id)
+        timer = StageTimer()
+        result = recognize_faces_in_stream(
+            image_file, session_id, timer, face_boxes=face_boxes, face_crops=face_crops
+        )
+
+        response_status = status.HTTP_400_BAD_REQUEST if 'error' in result else status.HTTP_200_OK
+        if request.headers.get('X-Face-Timing') != '1':
+            return Response(result, status=response_status)
+
+        response = Response({**result, 'timings': timer.as_dict()}, status=response_status)
+        response['Server-Timing'] = timer.server_timing()
+        return response
+
+class FacialBatchRecognitionView(SessionFrameRateMixin, ActiveSessionMixin, views.APIView):
+    """
+    Vista para el reconocimiento facial de varios frames de una misma sesión.
+    Recibe el ID de la sesión y varias imágenes (campo 'images', repetido)
+    o un archivo ZIP con las imágenes (campo 'archive').
+    Cada imagen cuenta para el límite de frames de la sesión en lote
+    (FACE_SESSION_BATCH_FRAME_RATE). Si el reconocimiento se satura a mitad
+    del lote se responde lo procesado con busy, retry_after y pending_frames.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsInstructorOfFicha]
+    throttle_classes = [SessionBatchFrameRateThrottle]
+
+    def frame_count(self, request):
+        archive = request.FILES.get('archive')
+        return len(request.FILES.getlist('images')) + (count_archive_frames(archive) if archive else 0)
+
+    def post(self, request, *args, **kwargs):
+        session_id = request.data.get('session_id')
+        image_files = request.FILES.getlist('images')
+        archive = request.FILES.get('archive')
+        max_frames = settings.FACE_BATCH_MAX_FRAMES
+
+        if not session_id or not (image_files or archive):
+            return Response({'error': 'Se requiere session_id y al menos una imagen o un archivo ZIP.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        session, error_response = self.get_active_session(request, session_id)
+        if error_response:
+            return error_response
+
+        if archive:
+            try:
+                image_files += read_archive_frames(archive, max_frames)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not image_files:
+            return Response({'error': 'El archivo no contiene imágenes.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(image_files) > max_frames:
+            return Response({'error': f'Se permiten como máximo {max_frames} imágenes por solicitud.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = recognize_faces_in_batch(image_files, session_id)
 
         if 'error' in result:
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(result, status=status.HTTP_200_OK)
\ No newline at end of file
+        if result.get('busy'):
+            # Lote procesado en parte: los frames pendientes se reenvían más tarde
+            return Response(result, status=status.HTTP_200_OK, headers={'Retry-After': str(result['retry_after'])})
+
+        return Response(result, status=status.HTTP_200_OK)
+
+class FacialRegistrationJobView(views.APIView):
+    """
+    Vista para registrar el rostro de forma asíncrona.
+    Recibe una imagen (profile_image) y devuelve el ID del trabajo creado.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        image_file = request.data.get('profile_image')
+
+        if not image_file:
+            return Response({'error': 'No se proporcionó ninguna imagen.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            job = FaceRecognitionJob.objects.create(kind='registration', user=request.user, image=image_file)
+            enqueue_job(job)
+
+        return Response(FaceRecognitionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class FacialRecognitionJobView(ActiveSessionMixin, views.APIView):
+    """
+    Vista para el reconocimiento facial asíncrono.
+    Recibe una imagen y el ID de la sesión activa y devuelve el ID del trabajo;
+    el resultado se consulta en jobs/<id>/.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsInstructorOfFicha]
+
+    def post(self, request, *args, **kwargs):
+        session_id = request.data.get('session_id')
+        image_file = request.data.get('image')
+
+        if not session_id or not image_file:
+            return Response({'error': 'Se requiere session_id y una imagen.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        session, error_response = self.get_active_session(request, session_id)
+        if error_response:
+            return error_response
+
+        with transaction.atomic():
+            job = FaceRecognitionJob.objects.create(kind='recognition', user=request.user, session=session, image=image_file)
+            enqueue_job(job)
+
+        return Response(FaceRecognitionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class FaceRecognitionJobDetailView(generics.RetrieveAPIView):
+    """
+    Vista para consultar el estado y el resultado de un trabajo asíncrono.
+    Cada usuario solo puede ver sus propios trabajos.
+    """
+    serializer_class = FaceRecognitionJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return FaceRecognitionJob.objects.filter(user=self.request.user)
+
+class FaceRecognitionMetricsView(views.APIView):
+    """
+    Vista (solo administradores) con los tiempos por etapa del
+    reconocimiento agregados en histogramas, para encontrar la etapa más
+    lenta del despliegue. Parámetros: hours (por defecto 24) y session_id.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            hours = float(request.query_params.get('hours', 24))
+            session_id = request.query_params.get('session_id')
+            session_id = int(session_id) if session_id else None
+        except ValueError:
+            return Response({'error': 'hours y session_id deben ser numéricos.'}, status=status.HTTP_400_BAD_REQUEST)
+        if hours <= 0:
+            return Response({'error': 'hours debe ser mayor que cero.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = timezone.now() - timedelta(hours=hours)
+        metrics = RecognitionMetric.objects.filter(created_at__gte=since)
+        if session_id is not None:
+            metrics = metrics.filter(session_id=session_id)
+        # Solo los frames más recientes, para acotar la memoria de la consulta
+        rows = metrics.order_by('-created_at').values_list('total_ms', 'stages', 'outcome', 'detection_source')[:settings.FACE_METRICS_MAX_ROWS]
+
+        return Response({
+            'since': since,
+            'session_id': session_id,
+            **summarize_metrics(rows),
+            # Estado del control de admisión en el proceso que responde
+            'admission': recognition_admission.stats(),
+        }, status=status.HTTP_200_OK)
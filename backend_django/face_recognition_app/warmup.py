@@ -0,0 +1,99 @@
+# face_recognition_app/warmup.py
+"""
+Calentamiento opcional de los modelos faciales al iniciar el proceso.
+
+Importar face_recognition carga los modelos de dlib y la primera inferencia
+es bastante más lenta que las siguientes. Con FACE_WARMUP=True ese costo se
+paga al arrancar cada worker (ver apps.py) y no en el primer frame de una
+sesión. Se usa la imagen FACE_WARMUP_IMAGE o, si no se puede leer, una
+imagen sintética.
+"""
+import sys
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .profiles import RecognitionProfile
+
+_startup_lock = threading.Lock()
+_started = False
+
+
+def _synthetic_image_bytes():
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, 640, dtype=np.float32)[None, :, None]
+    image = np.clip(gradient + rng.normal(0, 20, (480, 640, 3)), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(image).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def warmup_image_bytes(path=None):
+    """Bytes de la imagen de calentamiento y su origen"""
+    path = path or settings.FACE_WARMUP_IMAGE
+    try:
+        with open(path, 'rb') as image_file:
+            image_bytes = image_file.read()
+        Image.open(BytesIO(image_bytes)).verify()
+        return image_bytes, str(path)
+    except (OSError, ValueError, SyntaxError):
+        return _synthetic_image_bytes(), 'sintética'
+
+
+def run_warmup(profile=None):
+    """
+    Carga los modelos y ejecuta dos inferencias en este proceso (la segunda
+    muestra la latencia ya estable) y una por proceso del pool de inferencia.
+    Devuelve un dict con los tiempos en milisegundos.
+    """
+    started = time.perf_counter()
+    already_loaded = 'face_recognition' in sys.modules
+    from .inference import inference_pool
+    from .models import FaceRecognitionSettings
+    from .pipeline import warm_up_bytes
+    model_load_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    if profile is None:
+        try:
+            profile = FaceRecognitionSettings.current().get_profile()
+        except Exception:
+            # Base de datos aún no disponible (p. ej. antes de migrar): perfil por defecto
+            profile = RecognitionProfile()
+    image_bytes, source = warmup_image_bytes()
+    report = {
+        'image': source,
+        'model_load_ms': None if already_loaded else model_load_ms,
+        'first': warm_up_bytes(image_bytes, profile),
+        'steady': warm_up_bytes(image_bytes, profile),
+    }
+    if inference_pool is not None:
+        report['pool_workers'] = inference_pool.run_on_workers(warm_up_bytes, image_bytes, profile)
+    report['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def warmup_on_startup():
+    """
+    Ejecuta run_warmup una sola vez por proceso e informa los tiempos; un
+    fallo no impide arrancar (y no se reintenta).
+    """
+    global _started
+    with _startup_lock:
+        if _started:
+            return None
+        _started = True
+    try:
+        report = run_warmup()
+    except Exception as e:
+        print(f"Face recognition warmup failed: {e}")
+        return None
+    print(
+        f"Face recognition warmup ({report['image']}): models {report['model_load_ms']} ms, "
+        f"first inference {report['first']}, steady {report['steady']}, "
+        f"pool workers {report.get('pool_workers', [])}, total {report['total_ms']} ms"
+    )
+    return report
@@ -2,6 +2,9 @@
 ASGI config for facelog project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections go to the streaming face
+recognition endpoint (face_recognition_app/streaming.py). Serve it with an
+ASGI server that supports WebSockets, e.g. ``uvicorn facelog.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +16,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'facelog.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Se importa después de inicializar Django
+from face_recognition_app.streaming import recognition_websocket
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await recognition_websocket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
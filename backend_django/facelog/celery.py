@@ -0,0 +1,12 @@
+# facelog/celery.py
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'facelog.settings')
+
+app = Celery('facelog')
+
+# Toma toda la configuración CELERY_* de settings.py
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
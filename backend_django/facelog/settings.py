@@ -151,4 +151,71 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Celery
 CELERY_BROKER_URL = os.getenv("REDIS_URL")
-CELERY_RESULT_BACKEND = os.getenv("REDIS_URL")
\ No newline at end of file
+CELERY_RESULT_BACKEND = os.getenv("REDIS_URL")
+
+# Caché compartida entre workers (Redis si está configurado; en desarrollo, memoria local)
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+# Reconocimiento facial
+# Caché en proceso de galerías de rostros por ficha (ver face_recognition_app/gallery.py)
+FACE_GALLERY_CACHE_MAX_BYTES = int(os.getenv("FACE_GALLERY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+FACE_GALLERY_CACHE_MAX_AGE = int(os.getenv("FACE_GALLERY_CACHE_MAX_AGE", 300))  # segundos; sin REDIS_URL acota la desactualización entre workers
+# Precisión de los centroides en caché: float32, float16 o int8 (ver face_recognition_app/quantization.py)
+FACE_GALLERY_PRECISION = os.getenv("FACE_GALLERY_PRECISION", "float32")
+FACE_GALLERY_RERANK_MARGIN = float(os.getenv("FACE_GALLERY_RERANK_MARGIN", 0.02))  # franja recalculada en float32
+# Índice aproximado para detectar rostros duplicados al registrar (ver face_recognition_app/face_index.py)
+FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", os.path.join(BASE_DIR, 'face_index.npz'))
+FACE_INDEX_CANDIDATES = int(os.getenv("FACE_INDEX_CANDIDATES", 10))
+FACE_INDEX_N_PROBE = int(os.getenv("FACE_INDEX_N_PROBE", 8))
+# Máximo de imágenes por solicitud en /api/v1/face/recognize/batch/
+FACE_BATCH_MAX_FRAMES = int(os.getenv("FACE_BATCH_MAX_FRAMES", 10))
+# Pool de procesos para detección/codificación (0 = en el hilo de la petición)
+FACE_INFERENCE_WORKERS = int(os.getenv("FACE_INFERENCE_WORKERS", 0))
+FACE_INFERENCE_MAX_PENDING = int(os.getenv("FACE_INFERENCE_MAX_PENDING", 8))
+FACE_INFERENCE_TIMEOUT = float(os.getenv("FACE_INFERENCE_TIMEOUT", 15))  # segundos
+FACE_INFERENCE_RETRY_AFTER = int(os.getenv("FACE_INFERENCE_RETRY_AFTER", 2))  # segundos sugeridos en la cabecera Retry-After del 503
+# Hilos para los trabajos asíncronos cuando no hay broker de Celery configurado
+FACE_JOBS_LOCAL_WORKERS = int(os.getenv("FACE_JOBS_LOCAL_WORKERS", 2))
+# Supresión de frames casi idénticos por sesión (ver face_recognition_app/frame_cache.py)
+FACE_FRAME_DEDUP_MAX_DISTANCE = int(os.getenv("FACE_FRAME_DEDUP_MAX_DISTANCE", 4))  # bits de 64
+FACE_FRAME_DEDUP_MAX_AGE = float(os.getenv("FACE_FRAME_DEDUP_MAX_AGE", 10))  # segundos (0 = desactivado)
+FACE_FRAME_DEDUP_HISTORY = int(os.getenv("FACE_FRAME_DEDUP_HISTORY", 8))  # frames recordados por sesión
+# Seguimiento de rostros entre frames (ver face_recognition_app/tracking.py)
+FACE_TRACK_CONFIRM_HITS = int(os.getenv("FACE_TRACK_CONFIRM_HITS", 2))  # coincidencias seguidas para confirmar
+FACE_TRACK_MAX_AGE = float(os.getenv("FACE_TRACK_MAX_AGE", 3))  # segundos sin ver una pista (0 = desactivado)
+FACE_TRACK_RETRY_COOLDOWN = float(os.getenv("FACE_TRACK_RETRY_COOLDOWN", 5))  # segundos antes de reintentar un rostro sin coincidencia
+# Registros de verificación facial en buffer (ver face_recognition_app/log_buffer.py)
+FACE_LOG_BUFFER_SIZE = int(os.getenv("FACE_LOG_BUFFER_SIZE", 200))  # 0 = escribir cada registro al instante
+FACE_LOG_FLUSH_INTERVAL = float(os.getenv("FACE_LOG_FLUSH_INTERVAL", 2))  # segundos
+FACE_LOG_SPILL_PATH = os.getenv("FACE_LOG_SPILL_PATH", "")  # archivo JSONL; vacío = bulk_create directo
+# Configuración de reconocimiento en caché por proceso (ver face_recognition_app/settings_cache.py)
+FACE_SETTINGS_CACHE_TTL = float(os.getenv("FACE_SETTINGS_CACHE_TTL", 5))  # segundos entre comprobaciones (sin REDIS_URL, entre recargas)
+# Reconocimiento por WebSocket (ver face_recognition_app/streaming.py)
+FACE_STREAM_SESSION_CHECK_INTERVAL = int(os.getenv("FACE_STREAM_SESSION_CHECK_INTERVAL", 30))  # segundos entre revisiones de la sesión
+# Plantillas faciales por estudiante; se compara contra su centroide (ver face_recognition_app/matching.py)
+FACE_MAX_TEMPLATES = int(os.getenv("FACE_MAX_TEMPLATES", 5))
+# Calentamiento de los modelos faciales al iniciar cada worker (ver face_recognition_app/warmup.py)
+FACE_WARMUP = os.getenv("FACE_WARMUP", "False") == "True"
+FACE_WARMUP_IMAGE = os.getenv("FACE_WARMUP_IMAGE", os.path.join(BASE_DIR.parent, 'rostro.jpg'))
+# Tiempos por etapa del reconocimiento (ver face_recognition_app/timing.py y metrics.py)
+FACE_RECOGNITION_METRICS = os.getenv("FACE_RECOGNITION_METRICS", "True") == "True"
+FACE_METRICS_MAX_ROWS = int(os.getenv("FACE_METRICS_MAX_ROWS", 50000))  # frames más recientes agregados por consulta
+# Cajas o recortes de rostros detectados por el cliente (ver face_recognition_app/preprocessing.py)
+FACE_CLIENT_BOXES = os.getenv("FACE_CLIENT_BOXES", "True") == "True"
+FACE_CLIENT_BOX_MIN_SIZE = int(os.getenv("FACE_CLIENT_BOX_MIN_SIZE", 20))  # píxeles por lado
+FACE_CLIENT_MAX_FACES = int(os.getenv("FACE_CLIENT_MAX_FACES", 50))  # cajas o recortes por frame
+# Control de admisión del reconocimiento en tiempo real (ver face_recognition_app/admission.py)
+FACE_ADMISSION_MAX_CONCURRENT = int(os.getenv("FACE_ADMISSION_MAX_CONCURRENT", FACE_INFERENCE_WORKERS or os.cpu_count() or 1))  # por proceso (0 = sin límite)
+FACE_ADMISSION_MAX_QUEUE = int(os.getenv("FACE_ADMISSION_MAX_QUEUE", 8))  # reconocimientos esperando turno
+FACE_ADMISSION_QUEUE_TIMEOUT = float(os.getenv("FACE_ADMISSION_QUEUE_TIMEOUT", 2))  # segundos de espera máxima
+# Frames por sesión y usuario; se cuentan en CACHES, así que sin REDIS_URL el límite es por worker
+FACE_SESSION_FRAME_RATE = os.getenv("FACE_SESSION_FRAME_RATE", "4/s")  # vacío = sin límite
+FACE_SESSION_BATCH_FRAME_RATE = os.getenv("FACE_SESSION_BATCH_FRAME_RATE", "60/m")  # frames en /recognize/batch/
+# Registro masivo de rostros desde un ZIP o directorio (ver face_recognition_app/enrollment.py)
+FACE_ENROLLMENT_MAX_FILES = int(os.getenv("FACE_ENROLLMENT_MAX_FILES", 5000))
+FACE_ENROLLMENT_WORKERS = int(os.getenv("FACE_ENROLLMENT_WORKERS", os.cpu_count() or 1))  # procesos de manage.py enroll_faces